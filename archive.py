@@ -0,0 +1,91 @@
+import os
+import tarfile
+import zipfile
+from typing import Iterator
+
+ARCHIVE_FORMATS = ('zip', 'tar')
+ARCHIVE_MEDIA_TYPES = {'zip': 'application/zip', 'tar': 'application/x-tar'}
+# 每次从输出文件读取并产出的数据块大小
+ARCHIVE_BLOCK_SIZE = 1 << 16
+
+
+class _ChunkSink:
+    """只支持追加写入的文件对象，收集归档写出的字节，由调用方取走后产出"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class StreamingArchive:
+    """
+    逐个文件生成 zip 或 tar 归档的字节流，不需要可定位的输出，也不在内存中保留整个归档。
+    add_file 按数据块产出该文件对应的归档字节，close 产出归档结尾；内存占用不超过一个数据块加上条目头。
+    zip 条目使用数据描述符记录大小和CRC，tar 条目在写入头部前按已打开文件的实际大小确定长度。
+    """
+
+    def __init__(self, fmt: str = 'zip', block_size: int = ARCHIVE_BLOCK_SIZE):
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"不支持的归档格式: '{fmt}'")
+        self.format = fmt
+        self.block_size = block_size
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, 'w', compression=zipfile.ZIP_DEFLATED) if fmt == 'zip' else None
+        self._offset = 0
+
+    def add_file(self, path: str, arcname: str) -> Iterator[bytes]:
+        """把 path 以 arcname 加入归档；文件在产出第一个数据块前打开，打开失败时不写入任何内容"""
+        with open(path, 'rb') as f:
+            if self._zip is not None:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with self._zip.open(info, 'w') as dest:
+                    while block := f.read(self.block_size):
+                        dest.write(block)
+                        data = self._sink.drain()
+                        if data:
+                            yield data
+                yield self._sink.drain()
+                return
+            stat = os.fstat(f.fileno())
+            info = tarfile.TarInfo(arcname)
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            info.mode = 0o644
+            yield self._tar_bytes(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+            remaining = info.size
+            while remaining > 0:
+                block = f.read(min(self.block_size, remaining))
+                if not block:
+                    # 文件在读取过程中被截断，用NUL补足头部声明的长度
+                    block = tarfile.NUL * min(self.block_size, remaining)
+                remaining -= len(block)
+                yield self._tar_bytes(block)
+            padding = -info.size % tarfile.BLOCKSIZE
+            if padding:
+                yield self._tar_bytes(tarfile.NUL * padding)
+
+    def close(self) -> Iterator[bytes]:
+        """产出归档结尾（zip 中央目录，或 tar 的结束块并补足到记录大小）"""
+        if self._zip is not None:
+            self._zip.close()
+            yield self._sink.drain()
+            return
+        end = tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+        end += tarfile.NUL * (-(self._offset + len(end)) % tarfile.RECORDSIZE)
+        yield self._tar_bytes(end)
+
+    def _tar_bytes(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return data
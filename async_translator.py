@@ -0,0 +1,321 @@
+import asyncio
+import itertools
+import logging
+import os
+import weakref
+from typing import AsyncIterator, Callable, List, Optional, Sequence
+
+import httpx
+
+from cache import get_cache
+from hedging import get_hedge_policy
+from http_session import get_timeout
+from memory import get_memory
+from metrics import get_metrics
+from packing import PackedBatch, build_packed_prompt, parse_packed_response
+from pipeline import BatchJob, TranslationPipeline
+from translator import CompletionAttempts, TranslationFailedError, build_prompt, fall_back, iter_model_chain, lookup_translation, parse_stream_line, store_translation
+
+DEFAULT_CONCURRENCY = 100
+# 每次在线程中预读的块数
+READ_AHEAD_CHUNKS = 64
+
+logger = logging.getLogger(__name__)
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_concurrency(concurrency: int | None = None) -> int:
+    """返回异步并发上限，优先使用参数，其次是 .env 中的 ASYNC_CONCURRENCY"""
+    if concurrency:
+        return concurrency
+    return int(os.getenv('ASYNC_CONCURRENCY', DEFAULT_CONCURRENCY))
+
+
+def get_async_client(concurrency: int | None = None) -> httpx.AsyncClient:
+    """返回当前事件循环共享的异步HTTP客户端（keep-alive连接池，gzip由httpx默认开启）"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        limit = get_concurrency(concurrency)
+        connect_timeout, read_timeout = get_timeout()
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_async_client() -> None:
+    """关闭当前事件循环的共享客户端"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def run_store_io(func: Callable, *args):
+    """缓存和翻译记忆使用SQLite（同步I/O），开启时在线程中调用，不阻塞事件循环"""
+    if get_cache() is None and get_memory() is None:
+        return func(*args)
+    return await asyncio.to_thread(func, *args)
+
+
+async def chat_completion_async(prompt: str, api_key: str, model: str, max_retries: int = 5, client: httpx.AsyncClient | None = None) -> str:
+    """
+    chat_completion 的异步版本，与同步版本共享同一进程级限流器、重试预算、模型回退链和对冲策略。
+    """
+    client = client or get_async_client()
+    policy = get_hedge_policy()
+    for candidate, hedge_model, fallback in iter_model_chain(model):
+        try:
+            return await policy.run_async(lambda name: request_completion_async(prompt, api_key, name, max_retries, client), candidate, hedge_model)
+        except TranslationFailedError as e:
+            fall_back(e, candidate, fallback)
+
+
+async def request_completion_async(prompt: str, api_key: str, model: str, max_retries: int = 5, client: httpx.AsyncClient | None = None, mock: bool = False) -> str:
+    """request_completion 的异步版本：向单个模型发出请求，不做回退和对冲；重试和状态码处理见 CompletionAttempts"""
+    attempts = CompletionAttempts(prompt, model, max_retries, mock)
+    if not mock:
+        client = client or get_async_client()
+    for attempt in range(max_retries):
+        delay = attempts.backoff(attempt)
+        if delay:
+            await asyncio.sleep(delay)
+        backend = await attempts.acquire_async()
+        try:
+            if backend.mock:
+                return attempts.mock_reply(backend)
+            try:
+                response = await client.post(backend.url, json=backend.payload(prompt, model), headers=backend.headers(api_key))
+            except httpx.HTTPError as e:
+                attempts.request_failed(backend, e, attempt)
+                continue
+            if attempts.check_status(backend, response, attempt):
+                continue
+            content = attempts.read_reply(response.json)
+            if content is not None:
+                return content
+        finally:
+            # 任务被取消时也要归还槽位
+            attempts.abandon()
+    raise attempts.exhausted()
+
+
+async def translate_text_async(text: str, api_key: str, target_lang: str, model: str = "gpt-3.5-turbo", max_retries: int = 5, mock_mode: bool = False, client: httpx.AsyncClient | None = None) -> str:
+    """
+    translate_text 的异步版本，共享同一持久化缓存和翻译记忆。
+    """
+    if mock_mode:
+        return await request_completion_async(build_prompt(text, target_lang), api_key, model, max_retries, mock=True)
+    cache_key, result, reference = await run_store_io(lookup_translation, text, target_lang, model)
+    translated = result is None
+    if translated:
+        result = await chat_completion_async(build_prompt(text, target_lang, reference), api_key, model, max_retries, client)
+    await run_store_io(store_translation, text, target_lang, model, cache_key, result, translated)
+    return result
+
+
+async def chat_completion_stream_async(prompt: str, api_key: str, model: str, max_retries: int = 5, client: httpx.AsyncClient | None = None, mock: bool = False) -> AsyncIterator[str]:
+    """
+    chat_completion_stream 的异步版本：逐步产出当前已收到的完整回复，流中断时从头重试。
+    """
+    attempts = CompletionAttempts(prompt, model, max_retries, mock)
+    if not mock:
+        client = client or get_async_client()
+    for attempt in range(max_retries):
+        delay = attempts.backoff(attempt)
+        if delay:
+            await asyncio.sleep(delay)
+        backend = await attempts.acquire_async()
+        try:
+            if backend.mock:
+                yield attempts.mock_reply(backend)
+                return
+            parts = []
+            try:
+                async with client.stream('POST', backend.url, json=backend.payload(prompt, model, stream=True),
+                                         headers=backend.headers(api_key, stream=True)) as response:
+                    if attempts.check_status(backend, response, attempt, stream=True):
+                        continue
+                    async for line in response.aiter_lines():
+                        delta = parse_stream_line(line)
+                        if delta is None:
+                            break
+                        if delta:
+                            parts.append(delta)
+                            yield ''.join(parts)
+            except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+                attempts.request_failed(backend, e, attempt, stream=True)
+                continue
+            content = attempts.finish_stream(backend, parts)
+            if content is None:
+                continue
+            if content != ''.join(parts):
+                yield content
+            return
+        finally:
+            # 任务被取消或调用方提前停止迭代时也要归还槽位
+            attempts.abandon()
+    raise attempts.exhausted()
+
+
+async def translate_text_stream_async(text: str, api_key: str, target_lang: str, model: str = "gpt-3.5-turbo", max_retries: int = 5, mock_mode: bool = False, client: httpx.AsyncClient | None = None) -> AsyncIterator[str]:
+    """
+    translate_text_stream 的异步版本：逐步产出当前已翻译的部分，最后一次产出即完整译文。
+    """
+    if mock_mode:
+        async for partial in chat_completion_stream_async(build_prompt(text, target_lang), api_key, model, max_retries, mock=True):
+            yield partial
+        return
+    cache_key, result, reference = await run_store_io(lookup_translation, text, target_lang, model)
+    translated = result is None
+    if translated:
+        result = ''
+        async for result in chat_completion_stream_async(build_prompt(text, target_lang, reference), api_key, model, max_retries, client):
+            yield result
+    else:
+        yield result
+    await run_store_io(store_translation, text, target_lang, model, cache_key, result, translated)
+
+
+async def translate_batch_async(texts: Sequence[str], api_key: str, target_lang: str, model: str = "gpt-3.5-turbo", max_retries: int = 5, mock_mode: bool = False, client: httpx.AsyncClient | None = None) -> List[str]:
+    """
+    translate_batch 的异步版本：分隔符异常时拆分批次重试。
+    """
+    if mock_mode:
+        parsed = parse_packed_response(await request_completion_async(build_packed_prompt(texts, target_lang), api_key, model, max_retries, mock=True), len(texts))
+        return [parsed[i] if i in parsed else await translate_text_async(text, api_key, target_lang, model, max_retries, mock_mode=True) for i, text in enumerate(texts)]
+    batch = PackedBatch(texts, target_lang, model)
+
+    async def translate_group(indexes: List[int]) -> None:
+        if len(indexes) == 1:
+            i = indexes[0]
+            batch.results[i] = await translate_text_async(texts[i], api_key, target_lang, model, max_retries, client=client)
+            return
+        content = await chat_completion_async(batch.prompt(indexes), api_key, model, max_retries, client)
+        for group in await run_store_io(batch.accept, indexes, content):
+            await translate_group(group)
+
+    pending = await run_store_io(batch.lookup)
+    if pending:
+        await translate_group(pending)
+    return batch.results
+
+
+async def iter_translate_async(file_paths: List[str], api_key: str, target_lang: str | List[str], concurrency: int | None = None, model: str = "gpt-3.5-turbo", mock_mode: bool = False, progress_queue=None, chunk_tokens: int | None = None, pack: bool = False, pack_tokens: int | None = None, journal=None, total_files: int = 0, on_partial: Optional[Callable[[str, int, str], None]] = None, dedup: bool = False, extract: bool = True, open_output=None) -> AsyncIterator[tuple]:
+    """
+    iter_translate 的异步版本：所有块作为协程调度，由信号量限制同时在途的请求数，
+    单个事件循环即可驱动数百个并发翻译；每个文件完成后立即产出 (路径, 译文)。
+    传入 on_partial 时单块请求改用流式接口，每收到新内容调用 on_partial(路径, 块序号, 当前已翻译部分)。
+    dedup、extract、open_output、多语言 target_lang 的含义与 iter_translate 相同，调度和簿记见 pipeline.TranslationPipeline；
+    去重模式下一个段落可能属于多个文件，多语言时一个块有多份译文，这两种情况不推送部分译文。
+    """
+    from utils import mock_mode_global
+    mock_mode = mock_mode or mock_mode_global
+    pipeline = TranslationPipeline(file_paths, target_lang, model, total_files, progress_queue, chunk_tokens, pack, pack_tokens, journal, dedup, extract, open_output)
+    limit = get_concurrency(concurrency)
+    semaphore = asyncio.Semaphore(limit)
+    window = limit * 2
+    client = None if mock_mode else get_async_client(concurrency)
+    metrics = get_metrics()
+    if dedup or pipeline.multi:
+        on_partial = None
+
+    async def iter_chunks(path):
+        # 文件读取在线程中进行，每次预读一小批块，不阻塞事件循环
+        chunks = pipeline.read_chunks(path)
+        while True:
+            batch = await asyncio.to_thread(lambda: list(itertools.islice(chunks, READ_AHEAD_CHUNKS)))
+            if not batch:
+                return
+            for item in batch:
+                yield item
+
+    async def run_job(job):
+        async with semaphore:
+            try:
+                if isinstance(job, BatchJob):
+                    translated = await translate_batch_async(job.cores, api_key, job.lang, model, mock_mode=mock_mode, client=client)
+                elif on_partial is None:
+                    translated = await translate_text_async(job.core, api_key, job.lang, model, mock_mode=mock_mode, client=client)
+                else:
+                    translated = ''
+                    async for translated in translate_text_stream_async(job.core, api_key, job.lang, model, mock_mode=mock_mode, client=client):
+                        on_partial(job.task[0], job.index, pipeline.partial_text(job, translated))
+            except Exception as e:
+                translated = job.fallback(e)
+        return job.results(translated)
+
+    pending = set()
+
+    def submit(jobs):
+        for job in jobs:
+            pending.add(asyncio.ensure_future(run_job(job)))
+        metrics.set_queue_depth(len(pending))
+
+    async def collect(block=True):
+        done, _ = await asyncio.wait(pending, timeout=None if block else 0, return_when=asyncio.FIRST_COMPLETED)
+        pending.difference_update(done)
+        metrics.set_queue_depth(len(pending))
+        return pipeline.deliver_done(done)
+
+    try:
+        for path in pipeline.file_paths:
+            units = pipeline.open_file(path)
+            index = -1
+            async for source, translatable in iter_chunks(path):
+                index += 1
+                finished, jobs = pipeline.add_chunk(units, index, source, translatable)
+                for result in finished:
+                    yield result
+                submit(jobs)
+                while len(pending) >= window:
+                    for result in await collect():
+                        yield result
+            for result in pipeline.close_file(units):
+                yield result
+            if pending:
+                for result in await collect(block=False):
+                    yield result
+        submit(pipeline.flush())
+        while pending:
+            for result in await collect():
+                yield result
+        pipeline.finish_run()
+    finally:
+        for future in pending:
+            future.cancel()
+        pipeline.abort()
+
+
+async def translate_parallel_async(file_paths: List[str], api_key: str, target_lang: str | List[str], concurrency: int | None = None, model: str = "gpt-3.5-turbo", mock_mode: bool = False, progress_queue=None, chunk_tokens: int | None = None, pack: bool = False, pack_tokens: int | None = None, dedup: bool = False, extract: bool = True) -> dict:
+    """
+    translate_parallel 的异步版本，返回 {路径: 译文}；target_lang 为语言列表时返回 {(路径, 语言): 译文}。
+    """
+    results = iter_translate_async(file_paths, api_key, target_lang, concurrency, model, mock_mode, progress_queue, chunk_tokens, pack, pack_tokens, dedup=dedup, extract=extract)
+    if not isinstance(target_lang, str):
+        return {(path, lang): translated async for path, lang, translated in results}
+    return {path: translated async for path, translated in results}
+
+
+def run_translate_parallel(*args, **kwargs) -> dict:
+    """同步入口：在新的事件循环中运行 translate_parallel_async，供CLI通过 asyncio.run 复用"""
+    async def runner():
+        try:
+            return await translate_parallel_async(*args, **kwargs)
+        finally:
+            await close_async_client()
+    return asyncio.run(runner())
+
+
+def run_iter_translate(callback: Callable[..., None], *args, **kwargs) -> None:
+    """同步入口：运行 iter_translate_async，每个文件完成后以产出的元组调用 callback(路径, 译文) 或 callback(路径, 语言, 译文)"""
+    async def runner():
+        try:
+            async for result in iter_translate_async(*args, **kwargs):
+                callback(*result)
+        finally:
+            await close_async_client()
+    asyncio.run(runner())
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+from rate_limiter import AdaptiveLimiter, get_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_EJECT_AFTER = 3
+DEFAULT_EJECT_SECONDS = 30.0
+# 所有后端都没有空闲槽位时的轮询间隔
+ACQUIRE_POLL_INTERVAL = 0.02
+
+
+def get_api_url() -> str:
+    """返回chat completions接口地址，可用 OPENROUTER_API_URL 指向兼容服务（如基准测试的本地桩服务）"""
+    return os.getenv('OPENROUTER_API_URL') or API_URL
+
+
+class Backend:
+    """
+    一个OpenAI兼容的chat completions后端（一个地址 + 一个API密钥）。
+
+    url 为None时使用 get_api_url()，api_key 为None时使用调用方传入的 OPENROUTER_API_KEY，
+    limiter 为None时使用进程级限流器——未配置 BACKENDS 时的默认后端即是如此，行为与单一后端时一致。
+    其他后端各有独立的AIMD限流器，并发上限为 concurrency，429/Retry-After 只影响该后端。
+    kind 为 'mock' 时不发出HTTP请求，由调用方在本地生成mock译文。
+    """
+
+    def __init__(self, name: str, url: Optional[str] = None, api_key: Optional[str] = None, weight: float = 1.0,
+                 concurrency: Optional[int] = None, model: Optional[str] = None, kind: str = 'http'):
+        self.name = name
+        self._url = url
+        self.api_key = api_key
+        self.weight = max(weight, 0.001)
+        self.model = model
+        self.kind = kind
+        self.limiter = AdaptiveLimiter(initial_limit=concurrency, max_limit=concurrency) if concurrency else None
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.ejections = 0
+        self.latency_sum = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        # 平滑加权轮询的当前权重
+        self.current_weight = 0.0
+
+    @property
+    def mock(self) -> bool:
+        return self.kind == 'mock'
+
+    @property
+    def url(self) -> str:
+        return self._url or get_api_url()
+
+    def get_limiter(self) -> AdaptiveLimiter:
+        return self.limiter or get_rate_limiter()
+
+    def headers(self, api_key: str, stream: bool = False) -> dict:
+        key = api_key if self.api_key is None else self.api_key
+        headers = {"Content-Type": "application/json"}
+        if key:
+            headers["Authorization"] = f"Bearer {key}"
+        if stream:
+            headers["Accept"] = "text/event-stream"
+        return headers
+
+    def payload(self, prompt: str, model: str, stream: bool = False) -> dict:
+        payload = {
+            "model": self.model or model,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def stats(self) -> dict:
+        limiter = self.get_limiter()
+        return {
+            'name': self.name,
+            'kind': self.kind,
+            'weight': self.weight,
+            'requests': self.requests,
+            'successes': self.successes,
+            'failures': self.failures,
+            'ejections': self.ejections,
+            'ejected_for': max(self.ejected_until - time.monotonic(), 0.0),
+            'in_flight': limiter.in_flight,
+            'limit': limiter.limit,
+            'latency_avg': self.latency_sum / self.successes if self.successes else None,
+        }
+
+
+class BackendPool:
+    """
+    在多个后端之间分发请求。
+
+    按权重做平滑加权轮询，跳过并发已满或被暂时剔除的后端；全部满载时等待槽位。
+    连续失败（网络错误、5xx、429）达到 eject_after 次或API密钥无效的后端被剔除 eject_seconds 秒，
+    所有后端都被剔除时仍照常分发，避免整体停摆。只有一个后端时不剔除，行为与没有后端层时相同。
+    """
+
+    def __init__(self, backends: List[Backend], eject_after: int = DEFAULT_EJECT_AFTER, eject_seconds: float = DEFAULT_EJECT_SECONDS):
+        if not backends:
+            raise ValueError("至少需要一个后端")
+        self.backends = backends
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def _try_acquire(self) -> Optional[Backend]:
+        now = time.monotonic()
+        with self._lock:
+            healthy = [backend for backend in self.backends if backend.ejected_until <= now] or self.backends
+            total = sum(backend.weight for backend in healthy)
+            for backend in healthy:
+                backend.current_weight += backend.weight
+            for backend in sorted(healthy, key=lambda backend: backend.current_weight, reverse=True):
+                if backend.get_limiter().try_acquire():
+                    backend.current_weight -= total
+                    backend.requests += 1
+                    return backend
+            for backend in healthy:
+                backend.current_weight -= backend.weight
+        return None
+
+    def acquire(self) -> Backend:
+        """选择一个后端并占用它的一个并发槽位，用完后必须调用 release"""
+        if len(self.backends) == 1:
+            backend = self.backends[0]
+            backend.get_limiter().acquire()
+            with self._lock:
+                backend.requests += 1
+            return backend
+        while True:
+            backend = self._try_acquire()
+            if backend is not None:
+                return backend
+            time.sleep(ACQUIRE_POLL_INTERVAL)
+
+    async def acquire_async(self) -> Backend:
+        if len(self.backends) == 1:
+            backend = self.backends[0]
+            await backend.get_limiter().acquire_async()
+            with self._lock:
+                backend.requests += 1
+            return backend
+        while True:
+            backend = self._try_acquire()
+            if backend is not None:
+                return backend
+            await asyncio.sleep(ACQUIRE_POLL_INTERVAL)
+
+    def release(self, backend: Backend, success: bool | None = True, status_code: int | None = None,
+                retry_after: float | None = None, latency: float | None = None) -> None:
+        """归还槽位并记录结果；success为None（如请求被取消）时不计入成败"""
+        backend.get_limiter().release(success=success, status_code=status_code, retry_after=retry_after)
+        with self._lock:
+            if success:
+                backend.successes += 1
+                backend.consecutive_failures = 0
+                if latency is not None:
+                    backend.latency_sum += latency
+            elif success is False:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                if backend.consecutive_failures >= self.eject_after:
+                    self._eject_locked(backend, f"连续失败 {backend.consecutive_failures} 次")
+
+    def eject(self, backend: Backend, reason: str) -> bool:
+        """暂时剔除后端；返回是否还有其他可用后端（只有一个后端时不剔除，返回False）"""
+        with self._lock:
+            return self._eject_locked(backend, reason)
+
+    def _eject_locked(self, backend: Backend, reason: str) -> bool:
+        if len(self.backends) == 1:
+            return False
+        now = time.monotonic()
+        if backend.ejected_until <= now:
+            backend.ejections += 1
+            logger.warning("后端 %s 暂时剔除 %.0f 秒: %s", backend.name, self.eject_seconds, reason)
+        backend.ejected_until = now + self.eject_seconds
+        backend.consecutive_failures = 0
+        return any(other.ejected_until <= now for other in self.backends if other is not backend)
+
+    def stats(self) -> List[dict]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        with self._lock:
+            return [dict(backend.stats(), throughput=backend.successes / elapsed) for backend in self.backends]
+
+    def render_prometheus(self) -> str:
+        """每个后端的请求数、失败数、剔除次数、累计延迟、在途请求和剔除状态（Prometheus文本格式，带 backend 标签）"""
+        stats = self.stats()
+        series = [
+            ('translator_backend_requests_total', 'counter', 'Requests dispatched to each backend.', 'requests'),
+            ('translator_backend_failures_total', 'counter', 'Failed requests (network errors, 429, 5xx) per backend.', 'failures'),
+            ('translator_backend_ejections_total', 'counter', 'Times each backend was temporarily ejected.', 'ejections'),
+            ('translator_backend_in_flight', 'gauge', 'In-flight requests per backend.', 'in_flight'),
+            ('translator_backend_concurrency_limit', 'gauge', 'Current adaptive concurrency limit per backend.', 'limit'),
+        ]
+        lines = []
+        for name, kind, help_text, key in series:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            lines += [f'{name}{{backend="{entry["name"]}"}} {entry[key]}' for entry in stats]
+        lines += ['# HELP translator_backend_ejected Whether the backend is currently ejected.', '# TYPE translator_backend_ejected gauge']
+        lines += [f'translator_backend_ejected{{backend="{entry["name"]}"}} {int(entry["ejected_for"] > 0)}' for entry in stats]
+        return '\n'.join(lines) + '\n'
+
+
+def parse_backends(names: str, env=os.environ) -> List[Backend]:
+    """
+    根据 BACKENDS=name1,name2 和每个后端的 BACKEND_<NAME>_* 环境变量创建后端列表：
+    URL（默认 OPENROUTER_API_URL/OpenRouter）、KEYS（逗号分隔，每个密钥成为一个独立后端；未设置URL时默认 OPENROUTER_API_KEY）、
+    WEIGHT（默认1）、CONCURRENCY（每个密钥的并发上限，默认使用进程级限流器）、MODEL（覆盖请求的模型名，用于本地服务）、
+    TYPE（http 或 mock；名为 mock 的后端默认为 mock）。
+    """
+    backends = []
+    for name in dict.fromkeys(part.strip() for part in names.split(',') if part.strip()):
+        prefix = f"BACKEND_{name.upper().replace('-', '_')}_"
+        kind = env.get(prefix + 'TYPE') or ('mock' if name.lower() == 'mock' else 'http')
+        if kind not in ('http', 'mock'):
+            raise ValueError(f"后端 {name} 的类型无效: '{kind}'")
+        url = env.get(prefix + 'URL') or None
+        keys = [key.strip() for key in env.get(prefix + 'KEYS', '').split(',') if key.strip()]
+        if not keys:
+            # 自定义地址（本地服务）默认不发送 OpenRouter 密钥
+            keys = [None if url is None else '']
+        weight = float(env.get(prefix + 'WEIGHT') or 1)
+        concurrency = int(env.get(prefix + 'CONCURRENCY') or 0) or None
+        model = env.get(prefix + 'MODEL') or None
+        for i, key in enumerate(keys):
+            backend_name = name if len(keys) == 1 else f"{name}#{i + 1}"
+            backends.append(Backend(backend_name, url, key, weight, concurrency, model, kind))
+    return backends
+
+
+_pool: BackendPool | None = None
+_mock_pool: BackendPool | None = None
+_settings: tuple | None = None
+_lock = threading.Lock()
+
+
+def configure_backends(names: str = '', eject_after: int = DEFAULT_EJECT_AFTER, eject_seconds: float = DEFAULT_EJECT_SECONDS) -> BackendPool:
+    """
+    配置进程级后端池；names 为空时只有一个使用 OPENROUTER_API_URL/OPENROUTER_API_KEY 和进程级限流器的默认后端。
+    配置未变化时复用已有的后端池，保留各后端的限流状态、剔除状态和统计。
+    """
+    global _pool, _settings
+    settings = (names, tuple(sorted((key, value) for key, value in os.environ.items() if key.startswith('BACKEND_'))), eject_after, eject_seconds)
+    with _lock:
+        if _pool is None or settings != _settings:
+            _pool = BackendPool(parse_backends(names) if names.strip() else [Backend('openrouter')], eject_after, eject_seconds)
+            _settings = settings
+        return _pool
+
+
+def get_backend_pool(mock: bool = False) -> BackendPool:
+    """
+    返回进程级后端池，尚未配置时创建默认后端池。
+    mock 为True（MOCK_MODE）时返回只有一个mock后端的后端池，mock请求与真实请求走同一条请求路径。
+    """
+    global _mock_pool
+    if mock:
+        with _lock:
+            if _mock_pool is None:
+                _mock_pool = BackendPool([Backend('mock', kind='mock')])
+            return _mock_pool
+    if _pool is None:
+        return configure_backends()
+    return _pool
@@ -0,0 +1,230 @@
+"""
+离线基准测试：启动本地桩服务，分别驱动 translate_text、translate_parallel、CLI 和 FastAPI /translate，
+统计 files/s、tokens/s、请求延迟分位数和重试次数，并保存结果供回归对比。
+
+用法（在仓库根目录）:
+    python -m benchmarks.run
+    python -m benchmarks.run --scenarios parallel,cli --shapes tiny --rate-429 0.05 --retry-after 0.2
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.stub_server import StubServer  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+SCENARIOS = ('text', 'parallel', 'cli', 'fastapi')
+# 语料形态: (文件数, 每个文件的段落数)
+CORPUS_SHAPES = {
+    'tiny': (200, 1),
+    'huge': (3, 400),
+}
+PARAGRAPH = "The quick brown fox jumps over the lazy dog while the translator keeps up with every sentence. "
+# 吞吐量下降或延迟上升超过该比例时在对比中标记为回归
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def make_corpus(root: str, shape: str, scale: float = 1.0) -> List[str]:
+    """在root下生成指定形态的语料，返回文件路径列表"""
+    files, paragraphs = CORPUS_SHAPES[shape]
+    files = max(int(files * scale), 1) if shape == 'tiny' else files
+    paragraphs = max(int(paragraphs * scale), 1) if shape == 'huge' else paragraphs
+    os.makedirs(root, exist_ok=True)
+    paths = []
+    for i in range(files):
+        path = os.path.join(root, f"doc{i:04d}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n\n'.join(f"{i}.{j} {PARAGRAPH * 3}" for j in range(paragraphs)))
+        paths.append(path)
+    return paths
+
+
+def reset_process_state() -> None:
+    """每个场景开始前关闭缓存并重置限流器，避免场景之间互相影响"""
+    import rate_limiter
+    from utils import load_env, load_cache_config
+    rate_limiter._limiter = None
+    load_env()
+    load_cache_config(enabled=False)
+
+
+def summarize(name: str, stub: StubServer, elapsed: float, files: int) -> dict:
+    records = stub.snapshot()
+    ok = [record for record in records if record['status'] == 200]
+    latencies = [record['latency'] for record in ok]
+    completion_tokens = sum(record['completion_tokens'] for record in ok)
+    return {
+        'scenario': name,
+        'files': files,
+        'elapsed': elapsed,
+        'files_per_s': files / elapsed if elapsed else 0.0,
+        'tokens_per_s': completion_tokens / elapsed if elapsed else 0.0,
+        'requests': len(records),
+        'retries': len(records) - len(ok),
+        'status_429': sum(record['status'] == 429 for record in records),
+        'status_5xx': sum(record['status'] >= 500 for record in records),
+        'status_400': sum(record['status'] == 400 for record in records),
+        'prompt_tokens': sum(record['prompt_tokens'] for record in ok),
+        'completion_tokens': completion_tokens,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'latency_p99': percentile(latencies, 99),
+    }
+
+
+def bench_text(stub: StubServer, paths: List[str], options) -> int:
+    """逐段串行调用 translate_text，测单请求路径的开销"""
+    from translator import translate_text
+    api_key = os.environ['OPENROUTER_API_KEY']
+    count = 0
+    for path in paths[:options.text_limit]:
+        with open(path, 'r', encoding='utf-8') as f:
+            for paragraph in f.read().split('\n\n')[:options.text_limit]:
+                translate_text(paragraph, api_key, 'zh', 'stub-model')
+                count += 1
+    return count
+
+
+def bench_parallel(stub: StubServer, paths: List[str], options) -> int:
+    from parallel_translator import translate_parallel
+    results = translate_parallel(paths, os.environ['OPENROUTER_API_KEY'], 'zh', options.threads, model='stub-model', pack=options.pack)
+    return len(results)
+
+
+def bench_cli(stub: StubServer, paths: List[str], options) -> int:
+    input_dir = os.path.dirname(paths[0])
+    output_dir = tempfile.mkdtemp(prefix='bench_cli_out_')
+    command = [sys.executable, os.path.join(ROOT, 'main.py'), '--input-dir', input_dir, '--output-dir', output_dir, '--no-cache']
+    if options.pack:
+        command.append('--pack')
+    env = dict(os.environ, NUM_THREADS=str(options.threads), FILE_TYPES='txt')
+    try:
+        subprocess.run(command, env=env, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return len(paths)
+
+
+def bench_fastapi(stub: StubServer, paths: List[str], options) -> int:
+    """在临时工作目录中通过 TestClient 调用 /translate 并等待任务结束"""
+    from fastapi.testclient import TestClient
+    from web.app import app
+    workdir = tempfile.mkdtemp(prefix='bench_api_')
+    shutil.copytree(os.path.dirname(paths[0]), os.path.join(workdir, 'test', 'corpus'))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with TestClient(app) as client:
+            job_id = client.post('/translate', json={'input_dir': 'test/corpus', 'output_dir': 'output', 'file_types': 'txt', 'pack': options.pack}).json()['job_id']
+            while True:
+                job = client.get(f'/jobs/{job_id}').json()
+                if job['status'] != 'running':
+                    break
+                time.sleep(0.05)
+        if job['status'] != 'completed':
+            raise RuntimeError(f"FastAPI任务失败: {job.get('error')}")
+        return len(job['translated_files'])
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+DRIVERS = {'text': bench_text, 'parallel': bench_parallel, 'cli': bench_cli, 'fastapi': bench_fastapi}
+
+
+def compare(results: List[dict], baseline_path: str) -> None:
+    """与之前保存的结果对比并打印差异，吞吐下降或延迟上升超过阈值时标记为回归"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['scenario'], r['shape']): r for r in json.load(f)['results']}
+    print(f"\n与 {baseline_path} 对比:")
+    for result in results:
+        old = baseline.get((result['scenario'], result['shape']))
+        if old is None:
+            continue
+        for metric, higher_is_better in (('files_per_s', True), ('tokens_per_s', True), ('latency_p95', False), ('retries', False)):
+            before, after = old.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            regressed = change < -REGRESSION_THRESHOLD if higher_is_better else change > REGRESSION_THRESHOLD
+            flag = '  <-- 回归' if regressed else ''
+            print(f"  {result['scenario']}/{result['shape']} {metric}: {before:.3f} -> {after:.3f} ({change:+.1%}){flag}")
+
+
+def main(argv: Optional[List[str]] = None) -> List[dict]:
+    parser = argparse.ArgumentParser(description='离线翻译吞吐基准测试')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'要运行的场景（逗号分隔，可选 {",".join(SCENARIOS)}）')
+    parser.add_argument('--shapes', default=','.join(CORPUS_SHAPES), help=f'语料形态（逗号分隔，可选 {",".join(CORPUS_SHAPES)}）')
+    parser.add_argument('--scale', type=float, default=1.0, help='语料规模系数')
+    parser.add_argument('--threads', type=int, default=8, help='NUM_THREADS')
+    parser.add_argument('--pack', action='store_true', help='开启小块打包')
+    parser.add_argument('--text-limit', type=int, default=20, help='text场景最多翻译的段落数')
+    parser.add_argument('--latency', type=float, default=0.05, help='桩服务中位延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.3, help='延迟对数正态分布的sigma')
+    parser.add_argument('--tokens-per-second', type=float, help='桩服务输出token速率')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='注入429的概率')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='注入503的概率')
+    parser.add_argument('--retry-after', type=float, help='429响应的 Retry-After 秒数')
+    parser.add_argument('--context-limit', type=int, help='提示词token上限')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', help='结果保存路径（默认 benchmarks/results/<时间戳>.json）')
+    parser.add_argument('--compare', help='与之前保存的结果文件对比')
+    options = parser.parse_args(argv)
+
+    stub = StubServer(latency=options.latency, jitter=options.jitter, tokens_per_second=options.tokens_per_second,
+                      rate_429=options.rate_429, rate_5xx=options.rate_5xx, retry_after=options.retry_after,
+                      context_limit=options.context_limit, seed=options.seed).start()
+    os.environ.update(OPENROUTER_API_URL=stub.url, OPENROUTER_API_KEY=os.environ.get('OPENROUTER_API_KEY', 'bench'),
+                      MOCK_MODE='false', CACHE_ENABLED='false', NUM_THREADS=str(options.threads))
+    results = []
+    corpus_root = tempfile.mkdtemp(prefix='bench_corpus_')
+    try:
+        for shape in [s.strip() for s in options.shapes.split(',') if s.strip()]:
+            paths = make_corpus(os.path.join(corpus_root, shape), shape, options.scale)
+            for name in [s.strip() for s in options.scenarios.split(',') if s.strip()]:
+                reset_process_state()
+                stub.reset()
+                started = time.perf_counter()
+                files = DRIVERS[name](stub, paths, options)
+                result = summarize(name, stub, time.perf_counter() - started, files)
+                result['shape'] = shape
+                results.append(result)
+                p95 = result['latency_p95'] or 0.0
+                print(f"{name}/{shape}: {result['files_per_s']:.2f} files/s，{result['tokens_per_s']:.0f} tokens/s，"
+                      f"p50/p95/p99 {result['latency_p50'] or 0:.3f}/{p95:.3f}/{result['latency_p99'] or 0:.3f}s，"
+                      f"请求 {result['requests']}，重试 {result['retries']}（429: {result['status_429']}，5xx: {result['status_5xx']}）")
+    finally:
+        stub.stop()
+        shutil.rmtree(corpus_root, ignore_errors=True)
+
+    output = options.output or os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'created': time.time(), 'options': vars(options), 'results': results}, f, ensure_ascii=False, indent=1)
+    print(f"结果已保存到: {output}")
+    if options.compare:
+        compare(results, options.compare)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+本地OpenAI/OpenRouter兼容桩服务，用于离线基准测试。
+
+支持可配置的延迟分布、输出token速率、429/5xx注入、上下文长度限制和SSE流式响应，
+并记录每个请求的状态、耗时和token数供基准测试统计。
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from segmenter import estimate_tokens
+
+_SEGMENT_RE = re.compile(r'<<<SEG (\d+)>>>\n(.*?)\n<<<END \1>>>', re.S)
+STREAM_PIECE_CHARS = 16
+
+
+def fake_translate(prompt: str) -> str:
+    """生成与提示词格式匹配的"译文"：打包提示词保留分段标记，普通提示词返回冒号后的原文加前缀"""
+    if '<<<SEG ' in prompt:
+        return '\n\n'.join(f"<<<SEG {seg_id}>>>\n[译]{text}\n<<<END {seg_id}>>>" for seg_id, text in _SEGMENT_RE.findall(prompt))
+    return '[译]' + prompt.split(': ', 1)[-1]
+
+
+class StubServer:
+    """
+    在后台线程中运行的桩服务。
+
+    latency 为每个请求的中位延迟（秒），jitter 为对数正态分布的sigma（0表示固定延迟）；
+    tokens_per_second 限制输出速率，延迟随回复长度增加；rate_429/rate_5xx 为注入错误的概率，
+    retry_after 为429响应携带的 Retry-After 秒数；context_limit 为提示词token上限，超出时返回400。
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, tokens_per_second: Optional[float] = None,
+                 rate_429: float = 0.0, rate_5xx: float = 0.0, retry_after: Optional[float] = None,
+                 context_limit: Optional[int] = None, seed: Optional[int] = None, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.context_limit = context_limit
+        self.records: List[dict] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.records = []
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return list(self.records)
+
+    def _record(self, **record) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def _draw(self) -> tuple:
+        with self._lock:
+            roll = self._random.random()
+            factor = self._random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+        return roll, self.latency * factor
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                started = time.perf_counter()
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                prompt = ''.join(message.get('content', '') for message in payload.get('messages', []))
+                prompt_tokens = estimate_tokens(prompt)
+                stream = bool(payload.get('stream'))
+                roll, delay = stub._draw()
+
+                if stub.context_limit is not None and prompt_tokens > stub.context_limit:
+                    self.send_json(400, {'error': {'message': f'context length {prompt_tokens} exceeds {stub.context_limit}'}})
+                    stub._record(status=400, latency=time.perf_counter() - started, prompt_tokens=prompt_tokens, completion_tokens=0, stream=stream)
+                    return
+                if roll < stub.rate_429 + stub.rate_5xx:
+                    time.sleep(delay / 2)
+                    throttled = roll < stub.rate_429
+                    headers = {'Retry-After': str(stub.retry_after)} if throttled and stub.retry_after is not None else None
+                    status = 429 if throttled else 503
+                    self.send_json(status, {'error': {'message': 'injected failure'}}, headers)
+                    stub._record(status=status, latency=time.perf_counter() - started, prompt_tokens=prompt_tokens, completion_tokens=0, stream=stream)
+                    return
+
+                content = fake_translate(prompt)
+                completion_tokens = estimate_tokens(content)
+                generation = completion_tokens / stub.tokens_per_second if stub.tokens_per_second else 0.0
+                usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens}
+                if stream:
+                    self.send_stream(content, delay, generation, usage)
+                else:
+                    time.sleep(delay + generation)
+                    self.send_json(200, {
+                        'id': 'stub', 'object': 'chat.completion', 'model': payload.get('model'),
+                        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                        'usage': usage,
+                    })
+                stub._record(status=200, latency=time.perf_counter() - started, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, stream=stream)
+
+            def send_stream(self, content: str, delay: float, generation: float, usage: dict) -> None:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                time.sleep(delay)
+                pieces = [content[i:i + STREAM_PIECE_CHARS] for i in range(0, len(content), STREAM_PIECE_CHARS)] or ['']
+                for piece in pieces:
+                    time.sleep(generation / len(pieces))
+                    chunk = {'choices': [{'index': 0, 'delta': {'content': piece}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                final = {'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+DEFAULT_CACHE_PATH = '.translation_cache.sqlite3'
+# 等待其他进程释放数据库锁的毫秒数
+BUSY_TIMEOUT_MS = 30000
+# 命中时的访问时间先记在内存中，攒够这么多条再批量写入
+ACCESS_FLUSH_ENTRIES = 256
+# 设置了存活时间时，每写入这么多条清理一次过期条目
+EXPIRE_INTERVAL = 256
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本（Unicode NFC、统一换行、去除首尾空白），保证等价输入得到相同的缓存键"""
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text.strip()
+
+
+def make_cache_key(text: str, target_lang: str, model: str, prompt_version: str) -> str:
+    """根据 (规范化文本, 目标语言, 模型, 提示词版本) 计算内容寻址的缓存键"""
+    h = hashlib.sha256()
+    for part in (prompt_version, model, target_lang, normalize_text(text)):
+        h.update(part.encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+class TranslationCache:
+    """
+    基于SQLite的持久化翻译缓存。
+
+    单个连接由锁保护，可在线程池工作线程和FastAPI后台任务中安全共享；
+    使用回滚日志（journal_mode=DELETE）而不是WAL，多个进程（包括网络文件系统上的其他主机）也可以指向同一个共享路径，
+    锁冲突时按 busy_timeout 等待。
+
+    为减少每次读写的开销：命中时的访问时间在内存中累积，攒够 ACCESS_FLUSH_ENTRIES 条、淘汰前或关闭时批量更新；
+    条目数在内存中估算，只有估算值超过 max_entries 时才重新计数并按最久未访问淘汰；
+    过期条目在 get 时即不再返回，每 EXPIRE_INTERVAL 次写入才批量删除。
+    其他进程写入的条目不计入估算，共享路径上的条目数可能暂时超过上限，直到本进程的估算值触发重新计数。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 100000, max_age: float | None = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        # 尚未写入数据库的访问时间 {键: 时间}
+        self._accessed = {}
+        with self._lock:
+            self._conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            self._conn.execute('PRAGMA journal_mode=DELETE')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_accessed ON translations(accessed)')
+            self._conn.commit()
+            self._count = self._conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, created FROM translations WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self._conn.execute('DELETE FROM translations WHERE key = ?', (key,))
+                self._conn.commit()
+                self.evictions += 1
+                row = None
+            if row is None:
+                self._accessed.pop(key, None)
+                self.misses += 1
+                return None
+            self._accessed[key] = now
+            if len(self._accessed) >= ACCESS_FLUSH_ENTRIES:
+                self._flush_accessed_locked()
+                self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def contains(self, key: str) -> bool:
+        """只读检查键是否存在且未过期，不更新访问时间和命中统计（供 --dry-run 估算使用）"""
+        with self._lock:
+            row = self._conn.execute('SELECT created FROM translations WHERE key = ?', (key,)).fetchone()
+        return row is not None and (self.max_age is None or time.time() - row[0] <= self.max_age)
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO translations (key, value, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, value, now, now)
+            )
+            self.stores += 1
+            self._accessed.pop(key, None)
+            # 替换已有键时估算值偏大，超过上限时会重新计数
+            self._count += 1
+            if (self.max_entries and self._count > self.max_entries) or (self.max_age is not None and self.stores % EXPIRE_INTERVAL == 0):
+                self._evict_locked(now)
+            self._conn.commit()
+
+    def _flush_accessed_locked(self) -> None:
+        """把累积的访问时间写入数据库（不提交），调用方需持有锁"""
+        if self._accessed:
+            self._conn.executemany('UPDATE translations SET accessed = ? WHERE key = ?', [(t, k) for k, t in self._accessed.items()])
+            self._accessed = {}
+
+    def _evict_locked(self, now: float) -> None:
+        """重新计数后按存活时间和条目数（最久未访问优先）淘汰，调用方需持有锁"""
+        self._flush_accessed_locked()
+        if self.max_age is not None:
+            cur = self._conn.execute('DELETE FROM translations WHERE created < ?', (now - self.max_age,))
+            self.evictions += max(cur.rowcount, 0)
+        self._count = count = self._conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+        if self.max_entries:
+            excess = count - self.max_entries
+            if excess > 0:
+                cur = self._conn.execute(
+                    'DELETE FROM translations WHERE key IN '
+                    '(SELECT key FROM translations ORDER BY accessed ASC LIMIT ?)',
+                    (excess,)
+                )
+                self.evictions += max(cur.rowcount, 0)
+                self._count -= max(cur.rowcount, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM translations')
+            self._conn.commit()
+            self._accessed = {}
+            self._count = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits / total) if total else 0.0,
+            'path': self.path,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_accessed_locked()
+            self._conn.commit()
+            self._conn.close()
+
+
+_default_cache: TranslationCache | None = None
+_default_settings: tuple | None = None
+_default_lock = threading.Lock()
+
+
+def configure_cache(enabled: bool, path: str = DEFAULT_CACHE_PATH, max_entries: int = 100000, max_age: float | None = None) -> TranslationCache | None:
+    """配置进程级默认缓存；相同配置重复调用时复用已有实例"""
+    global _default_cache, _default_settings
+    settings = (enabled, os.path.abspath(path), max_entries, max_age)
+    with _default_lock:
+        if settings == _default_settings:
+            return _default_cache
+        if _default_cache is not None:
+            _default_cache.close()
+        _default_cache = TranslationCache(path, max_entries, max_age) if enabled else None
+        _default_settings = settings
+        return _default_cache
+
+
+def get_cache() -> TranslationCache | None:
+    """返回当前进程的默认缓存，未启用时返回None"""
+    return _default_cache
@@ -0,0 +1,174 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Optional
+
+# 本模块顶层只导入标准库中的轻量模块：客户端路径（main.py 转发请求）不应加载 requests、dotenv 等依赖，
+# 服务端用到的翻译模块在 TranslationDaemon 中按需导入
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = '.translation_daemon.sock'
+# 连接守护进程的超时；连接成功后等待回复不设超时，翻译耗时由API决定
+CONNECT_TIMEOUT = 1.0
+
+
+def get_socket_path(path: str | None = None) -> str:
+    """返回守护进程的unix socket路径，优先使用参数，其次是环境变量 DAEMON_SOCKET（客户端不读取 .env）"""
+    return path or os.getenv('DAEMON_SOCKET', DEFAULT_SOCKET_PATH)
+
+
+def send_request(payload: dict, path: str | None = None) -> Optional[dict]:
+    """
+    向守护进程发送一个JSON请求并返回回复。
+    守护进程未运行、平台不支持unix socket或连接在回复前断开时返回None，由调用方在本进程内处理。
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(get_socket_path(path))
+        except OSError:
+            return None
+        sock.settimeout(None)
+        try:
+            sock.sendall(json.dumps(payload, ensure_ascii=False).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as reader:
+                line = reader.readline()
+        except OSError:
+            return None
+    finally:
+        sock.close()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class TranslationDaemon:
+    """
+    常驻翻译守护进程。
+
+    启动时加载一次 .env 并配置HTTP连接池、限流器、缓存和对冲策略，之后的请求复用这些进程级状态，
+    客户端不必为每次调用重新导入模块和建立连接。协议为每个连接一行JSON请求、一行JSON回复：
+    - {"op": "ping"}：返回进程号、运行时长和已处理请求数
+    - {"op": "translate", "text" 或 "path", "output", "target_lang", "model", "file_types", ...}：翻译一段文本或一个文件
+    - {"op": "stop"}：停止守护进程
+    socket 文件权限为0600，只有启动守护进程的用户可以提交请求（请求可以读写该用户能访问的任意路径）。
+    """
+
+    def __init__(self, path: str | None = None):
+        from utils import load_env
+        self.path = get_socket_path(path)
+        self.config = load_env()
+        self.started = time.time()
+        self.requests = 0
+        self.server = None
+        self._lock = threading.Lock()
+
+    def handle(self, request: dict) -> dict:
+        op = request.get('op')
+        if op == 'ping':
+            with self._lock:
+                requests = self.requests
+            return {'ok': True, 'pid': os.getpid(), 'uptime': time.time() - self.started, 'requests': requests}
+        if op == 'translate':
+            with self._lock:
+                self.requests += 1
+            return self.translate(request)
+        if op == 'stop':
+            # shutdown 会等待 serve_forever 返回，不能在处理请求的线程中直接调用
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return {'ok': True}
+        return {'ok': False, 'error': f"未知操作: {op}"}
+
+    def translate(self, request: dict) -> dict:
+        """
+        翻译 request 中的 text 或 path（绝对路径），与CLI单文件翻译使用同一流程（分块、打包、格式提取）。
+        指定 output 时原子写出译文并返回输出路径，否则返回译文；翻译失败时与CLI单文件模式一样使用原文，并在 error 中说明原因。
+        文件按 file_types（未指定时为守护进程 .env 中的 FILE_TYPES）过滤，与CLI相同；不匹配时不翻译，返回 skipped。
+        """
+        from parallel_translator import translate_parallel
+        from utils import load_model_chain, atomic_copy, atomic_write, filter_files_by_types
+        api_key, num_threads, model, mock_mode = self.config
+        if request.get('model'):
+            model = load_model_chain(request['model'])
+        output = request.get('output')
+        path = request.get('path')
+        temp_path = None
+        if path is None:
+            import tempfile
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as tmp:
+                tmp.write(request.get('text') or '')
+                path = temp_path = tmp.name
+        elif not os.path.isfile(path):
+            return {'ok': False, 'error': f"输入文件 {path} 不存在"}
+        else:
+            file_types = request.get('file_types') or os.getenv('FILE_TYPES', '').split(',')
+            if not filter_files_by_types([path], file_types):
+                return {'ok': True, 'skipped': True}
+        error = None
+        try:
+            try:
+                results = translate_parallel([path], api_key, request.get('target_lang') or 'zh', num_threads, model=model, mock_mode=mock_mode,
+                                             chunk_tokens=request.get('chunk_tokens'), pack=bool(request.get('pack')), pack_tokens=request.get('pack_tokens'),
+                                             dedup=bool(request.get('dedup')), extract=request.get('extract', True))
+                translated = results[path]
+            except Exception as e:
+                logger.error("翻译 %s 失败，使用原始内容: %s", path, e)
+                error = str(e)
+                translated = None
+            if output:
+                if translated is None:
+                    atomic_copy(path, output)
+                else:
+                    atomic_write(output, translated)
+                return {'ok': True, 'output': output, 'error': error}
+            if translated is None:
+                with open(path, encoding='utf-8') as f:
+                    translated = f.read()
+            return {'ok': True, 'text': translated, 'error': error}
+        finally:
+            if temp_path is not None:
+                os.unlink(temp_path)
+
+    def serve(self) -> None:
+        """在unix socket上处理请求直到收到 stop 或被中断；socket 文件已存在但无人监听时视为残留并替换"""
+        import socketserver
+        if send_request({'op': 'ping'}, self.path) is not None:
+            raise RuntimeError(f"守护进程已在 {self.path} 运行")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                try:
+                    response = daemon.handle(json.loads(line))
+                except Exception as e:
+                    logger.exception("处理守护进程请求失败")
+                    response = {'ok': False, 'error': str(e)}
+                self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+
+        # 创建 socket 文件前收紧 umask，避免出现其他用户可连接的时间窗口
+        umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.path, Handler)
+        finally:
+            os.umask(umask)
+        self.server.daemon_threads = True
+        logger.info("翻译守护进程已启动: %s (pid %d)", self.path, os.getpid())
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            logger.info("翻译守护进程已停止")
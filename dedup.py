@@ -0,0 +1,57 @@
+from typing import Dict, List, Optional, Tuple
+
+from cache import make_cache_key
+from translator import PROMPT_VERSION
+
+
+class SegmentDeduplicator:
+    """
+    单次运行内的段落去重表。
+
+    每个段落按规范化内容计算键：首次出现时由调用方调度翻译，之后出现的相同段落只登记为等待者，
+    不会再次请求（包括第一次请求仍在途时）；译文返回后分发给所有等待者，并记住结果供后续文件直接使用。
+    只在调度线程/事件循环中使用，不需要加锁。
+    """
+
+    def __init__(self, target_lang: str, model: str):
+        self.target_lang = target_lang
+        self.model = model
+        self.segments = 0
+        self.unique = 0
+        self._results: Dict[str, str] = {}
+        self._waiters: Dict[str, List[tuple]] = {}
+
+    def claim(self, text: str, waiter: tuple, target_lang: Optional[str] = None) -> Tuple[str, Optional[str], bool]:
+        """
+        登记一个需要text译文的等待者，返回 (键, 已知译文, 是否需要调度翻译)。
+        已知译文不为None时调用方直接使用，等待者不会被登记。
+        多语言运行时传入 target_lang，不同语言的相同段落互不合并。
+        """
+        self.segments += 1
+        key = make_cache_key(text, target_lang or self.target_lang, self.model, PROMPT_VERSION)
+        if key in self._results:
+            return key, self._results[key], False
+        if key in self._waiters:
+            self._waiters[key].append(waiter)
+            return key, None, False
+        self._waiters[key] = [waiter]
+        self.unique += 1
+        return key, None, True
+
+    def resolve(self, key: str, translated: str) -> List[tuple]:
+        """记录键的译文，返回所有等待者"""
+        self._results[key] = translated
+        return self._waiters.pop(key, [])
+
+    @property
+    def ratio(self) -> float:
+        """重复段落占全部段落的比例，即节省的请求比例"""
+        return 1 - self.unique / self.segments if self.segments else 0.0
+
+    def stats(self) -> dict:
+        return {
+            'segments': self.segments,
+            'unique': self.unique,
+            'duplicates': self.segments - self.unique,
+            'ratio': self.ratio,
+        }
@@ -0,0 +1,291 @@
+import logging
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from segmenter import iter_split, split_segments, split_text
+
+logger = logging.getLogger(__name__)
+
+# 行内受保护片段替换成的占位符，模型需要原样保留
+PLACEHOLDER_FORMAT = '⟦{}⟧'
+_PLACEHOLDER_RE = re.compile(r'⟦\s*(\d+)\s*⟧')
+
+# 超过该大小（MB）的文件流式读取，不整体读入内存
+DEFAULT_STREAM_THRESHOLD_MB = 16
+# 流式读取时单次读取的最大行长度（字符），超长行分多次读入
+STREAM_LINE_LIMIT = 1 << 20
+
+FORMATS = {
+    'md': 'markdown', 'markdown': 'markdown',
+    'rst': 'rst',
+    'html': 'html', 'htm': 'html',
+}
+
+# 不含任何字母的行（空行、分隔线、标题下划线、数字表格等）不需要翻译
+_LETTER_RE = re.compile(r'[^\W\d_]')
+_URL = r'https?://[^\s<>()\[\]`"\']*[^\s<>()\[\]`"\'.,;:!?]'
+
+# Markdown
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+_MD_TABLE_SEPARATOR_RE = re.compile(r'^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$')
+_MD_LINK_DEFINITION_RE = re.compile(r'^ {0,3}\[[^\]]+\]:\s*\S+')
+_MD_HTML_LINE_RE = re.compile(r'^\s*(<[^>]+>\s*)+$')
+_MD_INLINE_RE = re.compile(
+    r'`+[^`]*?`+'                     # 行内代码
+    r'|\]\([^)\s]*(?:\s+"[^"]*")?\)'  # 链接/图片目标
+    r'|\]\[[^\]]*\]'                  # 引用式链接标签
+    r'|<' + _URL + r'>'               # 自动链接
+    r'|</?[A-Za-z][^>]*>'             # 行内HTML标签
+    r'|' + _URL
+)
+
+# reStructuredText
+_RST_DIRECTIVE_RE = re.compile(r'^(\s*)\.\.\s+([\w-]+)::')
+_RST_COMMENT_RE = re.compile(r'^(\s*)\.\.(\s|$)')
+_RST_FIELD_RE = re.compile(r'^\s*:[\w-]+:')
+# 正文需要翻译的指令（提示框等），其余指令的内容原样保留
+_RST_PROSE_DIRECTIVES = {'note', 'warning', 'tip', 'important', 'caution', 'danger', 'attention', 'hint', 'error', 'admonition', 'seealso', 'topic', 'sidebar', 'rubric', 'versionadded', 'versionchanged', 'deprecated'}
+_RST_INLINE_RE = re.compile(
+    r'``[^`]+``'               # 行内字面量
+    r'|:[\w:-]+:`[^`]*`'       # 角色，如 :func:`name`
+    r'|\s?<[^<>\s]+>(?=`_)'    # `文字 <目标>`_ 中的链接目标
+    r'|`_{1,2}'                # 链接结束标记
+    r'|\|[\w -]+\|'            # 替换引用
+    r'|' + _URL
+)
+
+# HTML
+_HTML_BLOCK_TAGS = 'html|head|body|div|p|h[1-6]|ul|ol|li|table|thead|tbody|tfoot|tr|td|th|caption|section|article|header|footer|nav|main|aside|blockquote|figure|figcaption|title|meta|link|hr|form|fieldset|legend|dl|dt|dd|details|summary|label|button|option|select|iframe|img|source|video|audio|base|noscript'
+_HTML_SKIP_RE = re.compile(
+    r'<(script|style|pre|textarea|svg|math)\b.*?</\1\s*>'
+    r'|<!--.*?-->'
+    r'|<![^>]*>'
+    r'|<\?.*?\?>'
+    r'|</?(?:' + _HTML_BLOCK_TAGS + r')\b[^>]*>',
+    re.S | re.I,
+)
+_HTML_INLINE_RE = re.compile(r'<code\b[^>]*>.*?</code\s*>|<[^>]+>|&#?\w+;|' + _URL, re.S | re.I)
+
+_INLINE_PATTERNS = {
+    'markdown': _MD_INLINE_RE,
+    'rst': _RST_INLINE_RE,
+    'html': _HTML_INLINE_RE,
+    'text': re.compile(_URL),
+}
+
+
+def detect_format(path: str) -> str:
+    """按扩展名判断文档格式：markdown/rst/html，其余按纯文本处理"""
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    return FORMATS.get(ext, 'text')
+
+
+def _has_letters(text: str) -> bool:
+    return _LETTER_RE.search(text) is not None
+
+
+def _markdown_runs(text: str) -> List[Tuple[str, bool]]:
+    lines = text.splitlines(keepends=True)
+    runs = []
+    i = 0
+    # YAML/TOML front matter
+    if lines and lines[0].rstrip() in ('---', '+++'):
+        marker = lines[0].rstrip()
+        for j in range(1, len(lines)):
+            if lines[j].rstrip() in (marker, '...'):
+                runs.append((''.join(lines[:j + 1]), False))
+                i = j + 1
+                break
+    fence = None
+    comment = False
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if fence is not None:
+            runs.append((line, False))
+            stripped = line.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+            continue
+        if comment:
+            runs.append((line, False))
+            comment = '-->' not in line
+            continue
+        match = _FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+            runs.append((line, False))
+            continue
+        if line.lstrip().startswith('<!--'):
+            comment = '-->' not in line
+            runs.append((line, False))
+            continue
+        translatable = (
+            _has_letters(line)
+            and not _MD_TABLE_SEPARATOR_RE.match(line)
+            and not _MD_LINK_DEFINITION_RE.match(line)
+            and not _MD_HTML_LINE_RE.match(line)
+        )
+        runs.append((line, translatable))
+    return runs
+
+
+def _rst_runs(text: str) -> List[Tuple[str, bool]]:
+    lines = text.splitlines(keepends=True)
+    runs = []
+    literal_indent = None  # 字面量块/代码指令所在的缩进层级，其后缩进更深的行原样保留
+    expect_literal = False
+    for line in lines:
+        indent = len(line) - len(line.lstrip())
+        if not line.strip():
+            runs.append((line, False))
+            continue
+        if literal_indent is not None:
+            if indent > literal_indent:
+                runs.append((line, False))
+                continue
+            literal_indent = None
+        if expect_literal:
+            expect_literal = False
+            if indent > last_indent:
+                literal_indent = last_indent
+                runs.append((line, False))
+                continue
+        directive = _RST_DIRECTIVE_RE.match(line)
+        if directive:
+            runs.append((line, False))
+            if directive.group(2).lower() not in _RST_PROSE_DIRECTIVES:
+                literal_indent = len(directive.group(1))
+            continue
+        if _RST_COMMENT_RE.match(line) or _RST_FIELD_RE.match(line):
+            # 注释、链接目标和指令选项
+            runs.append((line, False))
+            if _RST_COMMENT_RE.match(line):
+                literal_indent = indent
+            continue
+        runs.append((line, _has_letters(line)))
+        if line.rstrip().endswith('::'):
+            expect_literal = True
+            last_indent = indent
+    return runs
+
+
+def _html_runs(text: str) -> List[Tuple[str, bool]]:
+    runs = []
+    position = 0
+    for match in _HTML_SKIP_RE.finditer(text):
+        if match.start() > position:
+            between = text[position:match.start()]
+            runs.append((between, _has_letters(_HTML_INLINE_RE.sub('', between))))
+        runs.append((match.group(0), False))
+        position = match.end()
+    if position < len(text):
+        tail = text[position:]
+        runs.append((tail, _has_letters(_HTML_INLINE_RE.sub('', tail))))
+    return runs
+
+
+_PARSERS = {
+    'markdown': _markdown_runs,
+    'rst': _rst_runs,
+    'html': _html_runs,
+}
+
+
+def _merge_runs(runs: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+    """合并相邻的同类片段；纯空白片段并入前一段，不打断正文"""
+    merged = []
+    for piece, translatable in runs:
+        if not piece:
+            continue
+        if merged and (merged[-1][1] == translatable or not piece.strip()):
+            merged[-1] = (merged[-1][0] + piece, merged[-1][1])
+        else:
+            merged.append((piece, translatable))
+    return merged
+
+
+def split_document(text: str, path: Optional[str], max_tokens: int, segments: bool = False) -> List[Tuple[str, bool]]:
+    """
+    按文档格式切分文本，返回 [(片段, 是否需要翻译)]。
+
+    代码块、front matter、HTML标签、注释、无字母的行（分隔线、数字表格等）标记为不翻译，原样保留；
+    正文再按 split_text（segments=True 时按 split_segments）切分为块。切分是无损的，拼接所有片段即得原文。
+    path 为None时不做格式解析，整个文本都作为正文。
+    """
+    if not text:
+        return []
+    parser = _PARSERS.get(detect_format(path)) if path else None
+    runs = _merge_runs(parser(text)) if parser else [(text, True)]
+    split = split_segments if segments else split_text
+    pieces = []
+    for piece, translatable in runs:
+        if translatable:
+            pieces.extend((chunk, True) for chunk in split(piece, max_tokens))
+        else:
+            pieces.append((piece, False))
+    return pieces
+
+
+def get_stream_threshold() -> int:
+    """返回流式读取的文件大小阈值（字节），来自 .env 中的 STREAM_THRESHOLD_MB"""
+    return int(float(os.getenv('STREAM_THRESHOLD_MB', DEFAULT_STREAM_THRESHOLD_MB)) * 1024 * 1024)
+
+
+def iter_document(path: str, max_tokens: int, segments: bool = False, extract: bool = True) -> Iterator[Tuple[str, bool]]:
+    """
+    按需读取文件并产出 [(片段, 是否需要翻译)]。
+
+    不超过 STREAM_THRESHOLD_MB 的文件整体读入后由 split_document 按格式切分；
+    更大的文件（日志、导出数据等）逐行流式读取和切分，不做块级格式解析，内存占用与块大小成正比。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if os.path.getsize(path) <= get_stream_threshold():
+            yield from split_document(f.read(), path if extract else None, max_tokens, segments)
+            return
+        logger.info("文件 %s 超过流式读取阈值，逐块读取", path)
+        lines = iter(lambda: f.readline(STREAM_LINE_LIMIT), '')
+        for chunk in iter_split(lines, max_tokens, merge=not segments):
+            yield chunk, True
+
+
+def protect(text: str, path: str) -> Tuple[str, Dict[int, str]]:
+    """把行内代码、链接目标、URL、行内标签等替换为占位符，返回 (替换后的文本, {编号: 原文})"""
+    protected: Dict[int, str] = {}
+
+    def replace(match):
+        protected[len(protected)] = match.group(0)
+        return PLACEHOLDER_FORMAT.format(len(protected) - 1)
+
+    masked = _INLINE_PATTERNS[detect_format(path)].sub(replace, text)
+    return masked, protected
+
+
+def restore(text: str, protected: Optional[Dict[int, str]], warn: bool = True) -> str:
+    """把译文中的占位符还原为原文片段；模型丢失的占位符记录警告（还原流式部分译文时传 warn=False）"""
+    if not protected:
+        return text
+    seen = set()
+
+    def replace(match):
+        index = int(match.group(1))
+        if index not in protected:
+            return match.group(0)
+        seen.add(index)
+        return protected[index]
+
+    restored = _PLACEHOLDER_RE.sub(replace, text)
+    missing = set(protected) - seen
+    if missing and warn:
+        logger.warning("译文中缺少 %d 个占位符，对应的原文片段已丢失: %s", len(missing), [protected[i] for i in sorted(missing)])
+    return restored
+
+
+def has_placeholders(text: str) -> bool:
+    return _PLACEHOLDER_RE.search(text) is not None
+
+
+def placeholder_ids(text: str) -> List[int]:
+    """按出现顺序返回文本中的占位符编号"""
+    return [int(index) for index in _PLACEHOLDER_RE.findall(text)]
@@ -0,0 +1,212 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+DEFAULT_HEDGE_PERCENTILE = 0.95
+DEFAULT_HEDGE_BUDGET = 0.05
+DEFAULT_HEDGE_MIN_SAMPLES = 20
+DEFAULT_HEDGE_MIN_DELAY = 1.0
+# 每个模型保留的最近成功请求延迟数
+LATENCY_WINDOW = 500
+# 同步对冲使用的线程数上限（主请求和对冲请求都在其中运行，调用线程只等待结果）
+HEDGE_MAX_THREADS = 256
+
+
+def parse_model_chain(value: str) -> List[str]:
+    """把 "primary,fallback1,fallback2" 解析为去重后的模型列表"""
+    return list(dict.fromkeys(model.strip() for model in value.split(',') if model.strip()))
+
+
+_fallbacks: Dict[str, List[str]] = {}
+
+
+def register_model_chain(value: str) -> str:
+    """
+    登记 "primary,fallback,..." 形式的模型链并返回主模型。
+    缓存键、增量清单和费用估算仍以主模型为准，回退模型只在主模型失败或被对冲时使用。
+    """
+    chain = parse_model_chain(value)
+    if not chain:
+        raise ValueError(f"无效模型: '{value}'")
+    if len(chain) > 1:
+        _fallbacks[chain[0]] = chain[1:]
+    return chain[0]
+
+
+def get_model_chain(model: str) -> List[str]:
+    """返回模型及其回退模型列表"""
+    return [model] + [fallback for fallback in _fallbacks.get(model, []) if fallback != model]
+
+
+class HedgePolicy:
+    """
+    请求对冲策略。
+
+    按模型记录最近成功请求的延迟；开启后，请求耗时超过该模型延迟的 percentile 分位数（不低于 min_delay 秒，
+    样本不足 min_samples 个时不对冲）仍未返回时，再发出一个相同的请求（有回退模型时发给回退模型），
+    取先成功的结果并取消另一个。对冲请求总数不超过请求数的 budget 比例（至少允许1个），避免服务整体变慢时请求量翻倍。
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = DEFAULT_HEDGE_PERCENTILE, budget: float = DEFAULT_HEDGE_BUDGET,
+                 min_samples: int = DEFAULT_HEDGE_MIN_SAMPLES, min_delay: float = DEFAULT_HEDGE_MIN_DELAY, window: int = LATENCY_WINDOW):
+        self.enabled = enabled
+        self.percentile = min(max(percentile, 0.0), 1.0)
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+    def observe(self, model: str, latency: float) -> None:
+        """记录一次成功请求的延迟"""
+        with self._lock:
+            samples = self._latencies.get(model)
+            if samples is None:
+                samples = self._latencies[model] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    def delay(self, model: str) -> Optional[float]:
+        """返回发出对冲请求前的等待秒数；未开启或样本不足时返回None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return max(samples[min(int(self.percentile * len(samples)), len(samples) - 1)], self.min_delay)
+
+    def _start(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def _allow_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges >= max(1.0, self.budget * self.requests):
+                self.denied += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def _won(self, hedge_won: bool) -> None:
+        from metrics import get_metrics
+        get_metrics().record_hedge(won=hedge_won)
+        if hedge_won:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=HEDGE_MAX_THREADS, thread_name_prefix='hedge')
+            return self._executor
+
+    def run(self, call: Callable[[str, threading.Event], T], model: str, hedge_model: Optional[str] = None) -> T:
+        """
+        执行 call(模型, 取消事件)。超过对冲延迟仍未返回时用 hedge_model（默认同一模型）再执行一次，返回先成功的结果；
+        之后设置取消事件，落后的一方不再重试（同步请求已发出的部分无法中断，其结果被丢弃）。
+        """
+        self._start()
+        delay = self.delay(model)
+        if delay is None:
+            return call(model, threading.Event())
+        cancelled = threading.Event()
+        executor = self._get_executor()
+        primary = executor.submit(call, model, cancelled)
+        try:
+            return primary.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        if not self._allow_hedge():
+            return primary.result()
+        logger.info("请求超过 %.1f 秒未返回，向 %s 发出对冲请求", delay, hedge_model or model)
+        hedge = executor.submit(call, hedge_model or model, cancelled)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    cancelled.set()
+                    for loser in pending:
+                        loser.cancel()
+                    self._won(future is hedge)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    async def run_async(self, call: Callable[[str], Awaitable[T]], model: str, hedge_model: Optional[str] = None) -> T:
+        """run 的异步版本：落后的请求任务直接取消，在途的HTTP请求随之中止"""
+        self._start()
+        delay = self.delay(model)
+        if delay is None:
+            return await call(model)
+        tasks = [asyncio.ensure_future(call(model))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+            if not self._allow_hedge():
+                return await tasks[0]
+            logger.info("请求超过 %.1f 秒未返回，向 %s 发出对冲请求", delay, hedge_model or model)
+            tasks.append(asyncio.ensure_future(call(hedge_model or model)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._won(task is tasks[1])
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'denied': self.denied,
+            }
+
+
+_policy: HedgePolicy | None = None
+_lock = threading.Lock()
+
+
+def configure_hedging(enabled: bool = False, **kwargs) -> HedgePolicy:
+    """配置进程级对冲策略；已存在时只更新参数，保留已记录的延迟和计数"""
+    global _policy
+    with _lock:
+        if _policy is None:
+            _policy = HedgePolicy(enabled=enabled, **kwargs)
+        else:
+            _policy.enabled = enabled
+            for name, value in kwargs.items():
+                setattr(_policy, name, value)
+        return _policy
+
+
+def get_hedge_policy() -> HedgePolicy:
+    """返回进程级对冲策略，尚未配置时创建一个不对冲、只记录延迟的默认策略"""
+    if _policy is None:
+        return configure_hedging()
+    return _policy
@@ -0,0 +1,50 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+
+_session: requests.Session | None = None
+_settings: tuple | None = None
+_timeout = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+_lock = threading.Lock()
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    # 重试由调用方统一处理，连接池只负责复用keep-alive连接
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+    return session
+
+
+def configure_session(pool_size: int = DEFAULT_POOL_SIZE, connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT) -> requests.Session:
+    """配置进程级共享会话；连接池大小应与工作线程数（NUM_THREADS）一致，相同配置重复调用时复用已有会话"""
+    global _session, _settings, _timeout
+    pool_size = max(int(pool_size), 1)
+    with _lock:
+        _timeout = (connect_timeout, read_timeout)
+        if _session is not None and _settings == pool_size:
+            return _session
+        if _session is not None:
+            _session.close()
+        _session = _build_session(pool_size)
+        _settings = pool_size
+        return _session
+
+
+def get_session() -> requests.Session:
+    """返回进程级共享会话，尚未配置时使用默认连接池大小创建"""
+    if _session is None:
+        return configure_session()
+    return _session
+
+
+def get_timeout() -> tuple:
+    """返回 (连接超时, 读取超时)，避免挂起的socket永久占用工作线程"""
+    return _timeout
@@ -0,0 +1,202 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Dict, List, Optional
+
+DEFAULT_MAX_FINISHED_JOBS = 100
+MAX_JOB_EVENTS = 1000
+# 订阅者两次推送之间的最小间隔（秒），期间到达的高频更新合并后一起推送
+COALESCE_INTERVAL = 0.2
+
+FINISHED_STATUSES = ('completed', 'error', 'cancelled')
+
+
+def is_progress_event(event: dict) -> bool:
+    """只携带进度信息的事件（不是部分译文、文件完成、状态变化或错误），新事件可以覆盖旧事件"""
+    return 'type' not in event and 'status' not in event and 'error' not in event
+
+
+def coalesce_events(events: List[dict]) -> List[dict]:
+    """
+    合并一批待推送的事件：纯进度事件只保留最后一个（字段合并，不丢失 total_files 等早先的字段），
+    同一块相邻的部分译文增量拼接为一个事件；其余事件原样保留。合并后的事件使用被合并事件中最大的序号。
+    """
+    last_progress = max((i for i, event in enumerate(events) if is_progress_event(event)), default=None)
+    progress: dict = {}
+    result: List[dict] = []
+    for i, event in enumerate(events):
+        if is_progress_event(event):
+            progress.update(event)
+            if i == last_progress:
+                result.append(progress)
+            continue
+        previous = result[-1] if result else None
+        if (event.get('type') == 'partial' and previous is not None and previous.get('type') == 'partial'
+                and (previous['file'], previous['chunk']) == (event['file'], event['chunk']) and not event.get('reset')):
+            result[-1] = dict(previous, delta=previous['delta'] + event['delta'], seq=event['seq'])
+            continue
+        result.append(event)
+    return result
+
+
+class Job:
+    """
+    一次翻译任务：保存参数、状态和最近的进度事件。
+    提供 append 方法，可直接作为 progress_queue 传给翻译引擎；事件带递增序号，
+    订阅者按序号增量读取，互不影响。
+    """
+
+    def __init__(self, job_id: str, params: Optional[dict] = None):
+        self.id = job_id
+        self.params = params or {}
+        self.status = 'running'
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.events = deque(maxlen=MAX_JOB_EVENTS)
+        self.latest: dict = {'progress': 0}
+        self.translated_files: List[str] = []
+        self.errors: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+        self._seq = 0
+        self._changed = asyncio.Event()
+
+    def append(self, event: dict) -> None:
+        """发布一个进度事件，唤醒等待中的订阅者；连续的纯进度事件只保留最新一个，避免挤掉保留的其他事件"""
+        self._seq += 1
+        if is_progress_event(event) and self.events and is_progress_event(self.events[-1]):
+            event = dict(self.events.pop(), **event)
+        event = dict(event, job_id=self.id, seq=self._seq)
+        self.events.append(event)
+        if event.get('type') not in ('partial', 'file_done'):
+            self.latest = event
+        self._notify()
+
+    def add_file(self, path: str) -> None:
+        """登记一个已完整写出的输出文件，唤醒等待中的归档下载"""
+        self.translated_files.append(path)
+        self._notify()
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def events_after(self, seq: int) -> List[dict]:
+        return [event for event in list(self.events) if event['seq'] > seq]
+
+    async def wait_events(self, seq: int, timeout: float = 15.0) -> List[dict]:
+        """返回序号大于seq的事件；暂无新事件且任务未结束时最多等待timeout秒"""
+        events = self.events_after(seq)
+        if events or self.done:
+            return events
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.events_after(seq)
+
+    async def wait_files(self, count: int, timeout: float = 15.0) -> List[str]:
+        """返回第count个之后登记的输出文件；暂无新文件且任务未结束时最多等待timeout秒"""
+        if len(self.translated_files) > count or self.done:
+            return self.translated_files[count:]
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.translated_files[count:]
+
+    async def subscribe(self, since: Optional[int] = None, interval: float = COALESCE_INTERVAL) -> AsyncIterator[Optional[dict]]:
+        """
+        订阅任务事件，任意数量的订阅者互不影响，任务结束且事件推送完毕后结束。
+        since 为None时先产出一个 type=snapshot 的当前状态快照，再重放保留的全部事件；
+        断线重连时传入收到的最后一个序号，只推送之后的事件。每批事件经 coalesce_events 合并，
+        两批之间至少间隔 interval 秒；长时间没有新事件时产出None，供调用方发送心跳。
+        """
+        seq = since or 0
+        if since is None:
+            yield dict(self.summary(), type='snapshot', latest=self.latest)
+        while True:
+            events = await self.wait_events(seq)
+            if events:
+                for event in coalesce_events(events):
+                    yield event
+                seq = events[-1]['seq']
+            elif not self.done:
+                yield None
+            if self.done and not self.events_after(seq):
+                return
+            if interval and not self.done:
+                await asyncio.sleep(interval)
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def cancel(self) -> bool:
+        """取消任务：停止调度新块并中止在途请求；任务已结束时返回False"""
+        if self.done or self.task is None or self.task.done():
+            return False
+        self.task.cancel()
+        return True
+
+    def summary(self) -> dict:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'created': self.created,
+            'finished': self.finished,
+            'params': self.params,
+            'total_files': self.params.get('total_files', 0),
+            'progress': self.latest.get('progress'),
+            'message': self.latest.get('message', ''),
+            'error': self.latest.get('error'),
+            'translated_files': self.translated_files,
+            'errors': self.errors,
+        }
+
+
+class JobRegistry:
+    """
+    进程内任务登记表。运行中的任务全部保留，已结束的任务只保留最近 max_finished 个，
+    持续有请求时内存占用保持稳定。
+    """
+
+    def __init__(self, max_finished: int = DEFAULT_MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+
+    def create(self, params: Optional[dict] = None) -> Job:
+        job = Job(uuid.uuid4().hex, params)
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def latest(self) -> Optional[Job]:
+        """最近创建的任务，供兼容旧的 /status 和 /ws/progress 使用"""
+        return next(reversed(self._jobs.values()), None)
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def finish(self, job: Job, status: str) -> None:
+        """标记任务结束，释放任务句柄并清理超出保留数量的旧任务"""
+        job.status = status
+        job.finished = time.time()
+        job.task = None
+        self._prune()
+
+    def _prune(self) -> None:
+        finished = [job for job in self._jobs.values() if job.done]
+        for job in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job.id]
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from translator import PROMPT_VERSION
+
+JOURNAL_NAME = '.translation_journal.jsonl'
+
+logger = logging.getLogger(__name__)
+
+
+def _chunk_hash(chunk: str) -> str:
+    return hashlib.sha1(chunk.encode('utf-8')).hexdigest()
+
+
+class Journal:
+    """
+    翻译检查点日志（JSON Lines，只追加），保存在输出目录中。
+
+    每完成一个块记录其源文本哈希和译文，每写出一个文件记录其输出路径；
+    中断后使用 --resume 重新运行时跳过已写出的文件，并复用未完成文件中已翻译的块。
+    传入 target_lang 和 model 时第一行记录设置指纹（目标语言、模型、提示词版本），
+    续传时指纹不一致（或旧日志没有指纹）的日志会被丢弃，避免复用按其他设置翻译的块。
+    """
+
+    def __init__(self, path: str, settings: Optional[dict] = None):
+        self.path = path
+        self.settings = settings
+        self.files: Dict[str, str] = {}
+        self.chunks: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+        self._fh = None
+
+    @classmethod
+    def open(cls, output_dir: str, resume: bool = False, target_lang: Optional[str] = None, model: Optional[str] = None) -> 'Journal':
+        """打开输出目录中的日志；resume为False或设置指纹不一致时丢弃旧日志重新开始"""
+        os.makedirs(output_dir, exist_ok=True)
+        settings = None
+        if target_lang is not None or model is not None:
+            settings = {'target_lang': target_lang, 'model': model, 'prompt_version': PROMPT_VERSION}
+        journal = cls(os.path.join(output_dir, JOURNAL_NAME), settings)
+        if resume:
+            loaded = journal._load()
+            if loaded is False:
+                logger.warning("检查点日志 %s 的设置（目标语言、模型或提示词版本）与本次运行不一致，忽略该日志重新开始", journal.path)
+                journal.files.clear()
+                journal.chunks.clear()
+            # 没有记录时重新写入日志头
+            resume = bool(loaded)
+        journal._fh = open(journal.path, 'a' if resume else 'w', encoding='utf-8')
+        if not resume and settings is not None:
+            journal._append({'type': 'header', 'settings': settings})
+        return journal
+
+    def _load(self) -> Optional[bool]:
+        """读取已有日志：设置指纹一致时返回True，不一致时返回False，日志不存在或没有记录时返回None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                first = True
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半
+                        continue
+                    if first:
+                        first = False
+                        header = record.get('settings') if record.get('type') == 'header' else None
+                        if self.settings is not None and header != self.settings:
+                            return False
+                    if record.get('type') == 'chunk':
+                        self.chunks.setdefault(record['path'], {})[record['hash']] = record['text']
+                    elif record.get('type') == 'file':
+                        self.files[record['path']] = record['output']
+                        self.chunks.pop(record['path'], None)
+        except FileNotFoundError:
+            return None
+        return None if first else True
+
+    def _append(self, record: dict) -> None:
+        with self._lock:
+            self._fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self._fh.flush()
+
+    def is_done(self, path: str) -> bool:
+        """文件已在之前的运行中写出且输出仍然存在"""
+        output = self.files.get(path)
+        return output is not None and os.path.exists(output)
+
+    def lookup(self, path: str, chunk: str) -> Optional[str]:
+        return self.chunks.get(path, {}).get(_chunk_hash(chunk))
+
+    def record_chunk(self, path: str, chunk: str, text: str) -> None:
+        self._append({'type': 'chunk', 'path': path, 'hash': _chunk_hash(chunk), 'text': text})
+
+    def record_file(self, path: str, output_path: str) -> None:
+        self.files[path] = str(output_path)
+        self.chunks.pop(path, None)
+        self._append({'type': 'file', 'path': path, 'output': str(output_path)})
+
+    def close(self, remove: bool = False) -> None:
+        """关闭日志；整个运行成功完成时传入remove=True删除日志"""
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
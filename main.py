@@ -1,10 +1,168 @@
 #!/usr/bin/env python3
 import argparse
+import logging
+import os
 import sys
-from utils import load_env
-from parallel_translator import translate_parallel
+
+# 顶层只导入标准库：转发给守护进程的调用不需要加载翻译模块，其余模块在 main() 中按需导入
+
+QUEUE_COMMANDS = ('worker', 'status')
+DAEMON_COMMAND = 'daemon'
+MEMORY_COMMAND = 'tm'
+
+logger = logging.getLogger('main')
+
+def queue_main(command, argv):
+    """队列模式子命令：worker 领取并翻译队列中的任务，status 显示队列状态"""
+    from work_queue import WorkQueue, run_worker, DEFAULT_QUEUE_PATH, DEFAULT_LEASE_SECONDS
+    parser = argparse.ArgumentParser(prog=f'main.py {command}', description='工作队列' + ('工作进程' if command == 'worker' else '状态'))
+    parser.add_argument('--queue', type=str, default=DEFAULT_QUEUE_PATH, help=f'队列数据库路径（默认: {DEFAULT_QUEUE_PATH}，多主机时放在共享文件系统上）')
+    if command == 'worker':
+        parser.add_argument('--worker-id', type=str, help='工作进程标识（默认: 主机名:进程号）')
+        parser.add_argument('--batch-size', type=int, help='每次领取的任务数（默认: 线程数的2倍）')
+        parser.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS, help='租约时长，超时未续约的任务会被重新分配')
+        parser.add_argument('--wait', action='store_true', help='队列为空时继续等待新任务而不是退出')
+        parser.add_argument('--chunk-tokens', type=int, help='大文件分块的token预算（覆盖 .env 中的 CHUNK_TOKENS）')
+        parser.add_argument('--pack', action='store_true', help='把多个小文件/小块打包进一次API调用')
+        parser.add_argument('--pack-tokens', type=int, help='打包模式每次调用的token预算（覆盖 .env 中的 PACK_TOKENS）')
+    args = parser.parse_args(argv)
+
+    if command == 'status':
+        if not os.path.exists(args.queue):
+            print(f"错误: 队列 {args.queue} 不存在")
+            sys.exit(1)
+        queue = WorkQueue(args.queue)
+        stats = queue.stats()
+        print(f"队列 {args.queue}: 待处理 {stats['pending']}，处理中 {stats['leased']}（其中租约过期 {stats['expired']}），"
+              f"已完成 {stats['done']}，失败 {stats['failed']}，活跃工作进程 {stats['workers']}")
+        for input_path, error in queue.failures():
+            print(f"失败: {input_path}: {error}")
+        queue.close()
+        return
+
+    from utils import load_env
+    api_key, num_threads, _, mock_mode = load_env()
+    queue = WorkQueue(args.queue, lease_seconds=args.lease_seconds)
+    try:
+        counts = run_worker(queue, api_key, num_threads, worker_id=args.worker_id, batch_size=args.batch_size, wait=args.wait,
+                            mock_mode=mock_mode, chunk_tokens=args.chunk_tokens, pack=args.pack, pack_tokens=args.pack_tokens)
+    except KeyboardInterrupt:
+        print("工作进程已停止，未完成的任务已放回队列")
+        sys.exit(130)
+    finally:
+        queue.close()
+    print(f"工作进程退出: 完成 {counts['done']} 个，放回队列 {counts['requeued']} 个，失败 {counts['failed']} 个")
+
+def daemon_main(argv):
+    """守护进程子命令：常驻并复用连接池、缓存和限流器状态，--status/--stop 查询或停止已运行的守护进程"""
+    from daemon import TranslationDaemon, send_request, get_socket_path, DEFAULT_SOCKET_PATH
+    parser = argparse.ArgumentParser(prog=f'main.py {DAEMON_COMMAND}', description='翻译守护进程')
+    parser.add_argument('--socket', type=str, help=f'unix socket路径（默认: 环境变量 DAEMON_SOCKET 或 {DEFAULT_SOCKET_PATH}）')
+    action_group = parser.add_mutually_exclusive_group()
+    action_group.add_argument('--status', action='store_true', help='显示守护进程状态')
+    action_group.add_argument('--stop', action='store_true', help='停止守护进程')
+    args = parser.parse_args(argv)
+    path = get_socket_path(args.socket)
+
+    if args.status or args.stop:
+        response = send_request({'op': 'stop' if args.stop else 'ping'}, path)
+        if response is None:
+            print(f"守护进程未运行: {path}")
+            sys.exit(1)
+        if args.stop:
+            print(f"守护进程已停止: {path}")
+        else:
+            print(f"守护进程运行中: {path}，pid {response['pid']}，已运行 {response['uptime']:.0f} 秒，处理请求 {response['requests']} 个")
+        return
+
+    try:
+        TranslationDaemon(path).serve()
+    except RuntimeError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+
+def memory_main(argv):
+    """翻译记忆子命令：导出/导入 TMX 或 JSONL（按扩展名判断），便于在机器之间共享"""
+    from dotenv import load_dotenv
+    from memory import TranslationMemory, DEFAULT_MEMORY_PATH
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog=f'main.py {MEMORY_COMMAND}', description='翻译记忆')
+    parser.add_argument('action', choices=('export', 'import', 'stats'), help='export 导出，import 导入，stats 显示条目数')
+    parser.add_argument('file', nargs='?', help='TMX（.tmx）或 JSONL 文件路径')
+    parser.add_argument('--path', type=str, help=f'翻译记忆数据库路径（默认: .env 中的 TM_PATH 或 {DEFAULT_MEMORY_PATH}）')
+    args = parser.parse_args(argv)
+    path = args.path or os.getenv('TM_PATH', DEFAULT_MEMORY_PATH)
+    if args.action != 'stats' and not args.file:
+        parser.error(f"{args.action} 需要指定文件路径")
+    if args.action != 'import' and not os.path.exists(path):
+        print(f"错误: 翻译记忆 {path} 不存在")
+        sys.exit(1)
+    memory = TranslationMemory(path)
+    try:
+        if args.action == 'export':
+            print(f"已导出 {memory.export(args.file)} 条到 {args.file}")
+        elif args.action == 'import':
+            if not os.path.exists(args.file):
+                print(f"错误: 文件 {args.file} 不存在")
+                sys.exit(1)
+            print(f"已从 {args.file} 导入 {memory.import_file(args.file)} 条，共 {len(memory)} 条")
+        else:
+            print(f"翻译记忆 {path}: {len(memory)} 条")
+    finally:
+        memory.close()
+
+def forward_to_daemon(args):
+    """
+    把一段文本或单个文件（需指定 -o）的翻译请求转发给已运行的守护进程，省去导入模块、读取 .env 和建立连接的开销。
+    参数涉及目录、多语言、缓存覆盖、增量/续传/队列/预估时不转发；守护进程未运行时返回False，由调用方在本进程内翻译。
+    --file-types 随请求转发，守护进程按它（未指定时按守护进程的 FILE_TYPES）过滤输入文件，与本进程内翻译一致。
+    """
+    file_types = None
+    if args.file_types is not None:
+        file_types = [t.strip() for t in args.file_types.split(',') if t.strip()]
+        if not file_types:
+            # 由本进程报告无效的文件类型
+            return False
+    if (args.no_daemon or args.input_dir or args.dry_run or args.queue or args.incremental or args.resume
+            or args.cache is not None or args.cache_path or ',' in args.target_lang):
+        return False
+    payload = {'op': 'translate', 'target_lang': args.target_lang.strip(), 'model': args.model, 'chunk_tokens': args.chunk_tokens,
+               'pack': args.pack, 'pack_tokens': args.pack_tokens, 'dedup': args.dedup, 'extract': args.extract, 'file_types': file_types}
+    if args.input:
+        if len(args.input) != 1 or not args.output:
+            return False
+        payload['path'] = os.path.abspath(args.input[0])
+    elif args.text:
+        payload['text'] = ' '.join(args.text)
+    else:
+        return False
+    if args.output:
+        payload['output'] = os.path.abspath(args.output)
+    from daemon import send_request
+    response = send_request(payload, args.daemon_socket)
+    if response is None:
+        return False
+    if not response['ok']:
+        print(f"错误: {response['error']}")
+        sys.exit(1)
+    if response.get('skipped'):
+        print("无匹配文件")
+        return True
+    if response.get('error'):
+        print(f"翻译单文件时出错: {response['error']}。使用原始内容。")
+    if 'text' in response:
+        print(response['text'])
+    return True
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in QUEUE_COMMANDS:
+        return queue_main(sys.argv[1], sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == DAEMON_COMMAND:
+        return daemon_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == MEMORY_COMMAND:
+        return memory_main(sys.argv[2:])
     parser = argparse.ArgumentParser(description='翻译CLI程序，使用OpenRouter API')
     parser.add_argument('--file-types', type=str, help='文件类型列表（逗号分隔，如 txt,md）')
     input_group = parser.add_mutually_exclusive_group(required=False)
@@ -12,68 +170,108 @@ def main():
     input_group.add_argument('--input-dir', type=str, help='输入目录路径（翻译目录下所有.txt文件）')
     parser.add_argument('--output', '-o', type=str, help='单个输出文件路径（仅限单文件输入）')
     parser.add_argument('--output-dir', type=str, help='输出目录路径（用于多文件输入）')
-    parser.add_argument('--target-lang', '-t', type=str, default='zh', help='目标语言（默认: zh）')
+    parser.add_argument('--target-lang', '-t', type=str, default='zh', help='目标语言（默认: zh）；多个语言用逗号分隔（如 zh,ja,de），每个文件只读取一次，各语言写入输出目录下的同名子目录')
     parser.add_argument('--input-file', type=str, default='test_input.txt', help='输入文件路径（默认: test_input.txt）')
-    parser.add_argument('--model', type=str, help='模型名称（覆盖 .env 中的 model）')
-    parser.add_argument('text', nargs='*', help='要翻译的文本（如果未指定输入文件，则使用此参数）')
+    parser.add_argument('--model', type=str, help='模型名称，可用逗号列出回退模型，如 primary,fallback（覆盖 .env 中的 model）')
+    parser.add_argument('--chunk-tokens', type=int, help='大文件分块的token预算（覆盖 .env 中的 CHUNK_TOKENS）')
+    parser.add_argument('--pack', action='store_true', help='把多个小文件/小块打包进一次API调用')
+    parser.add_argument('--pack-tokens', type=int, help='打包模式每次调用的token预算（覆盖 .env 中的 PACK_TOKENS）')
+    parser.add_argument('--dedup', action='store_true', help='按段落切分并在本次运行内跨文件去重，相同段落只翻译一次（隐含 --pack）')
+    parser.add_argument('--ignore', action='append', default=[], help='扫描 --input-dir 时忽略的文件/目录模式（fnmatch，可重复；追加到 .env 中的 SCAN_IGNORE）')
+    parser.add_argument('--dry-run', action='store_true', help='不调用API，只估算请求数、token数、费用和墙钟时间')
+    parser.add_argument('--no-extract', dest='extract', action='store_false', help='不做格式解析，按原文发送整个 md/rst/html 文件（默认只发送正文）')
+    parser.add_argument('--async', dest='async_engine', action='store_true', help='使用asyncio翻译引擎（并发上限由 ASYNC_CONCURRENCY 控制）')
+    parser.add_argument('--incremental', action='store_true', help='增量模式：根据输出目录中的清单只翻译有变化的文件（需配合 --input-dir）')
+    parser.add_argument('--prune', action='store_true', help='增量模式下删除源文件已不存在的输出文件')
+    parser.add_argument('--resume', action='store_true', help='从输出目录中的检查点日志继续上次中断的运行')
+    parser.add_argument('--queue', type=str, help='只把文件加入该工作队列而不翻译，由 `main.py worker` 进程处理')
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument('--cache', dest='cache', action='store_true', default=None, help='启用持久化翻译缓存（覆盖 .env 中的 CACHE_ENABLED）')
+    cache_group.add_argument('--no-cache', dest='cache', action='store_false', help='禁用持久化翻译缓存')
+    parser.add_argument('--cache-path', type=str, help='缓存数据库路径（覆盖 .env 中的 CACHE_PATH，可指向共享路径）')
+    parser.add_argument('--log-level', type=str, help='日志级别（DEBUG/INFO/WARNING/ERROR，覆盖 .env 中的 LOG_LEVEL）')
+    parser.add_argument('--daemon-socket', type=str, help='守护进程的unix socket路径（默认: 环境变量 DAEMON_SOCKET 或 .translation_daemon.sock）')
+    parser.add_argument('--no-daemon', action='store_true', help='不转发给守护进程，总是在本进程内翻译')
+    parser.add_argument('text', nargs='*', help='要翻译的文本（未指定 --input/--input-dir 时使用；未指定 -o 时译文输出到标准输出）')
     
     args = parser.parse_args()
+    if args.queue and (args.incremental or args.resume):
+        print("错误: --queue 不能与 --incremental/--resume 同时使用，队列本身会持久记录进度")
+        sys.exit(1)
+    if forward_to_daemon(args):
+        return
     
+    from utils import load_env, load_model_chain, atomic_copy, AtomicWriter
+    from parallel_translator import iter_translate
+    from journal import Journal
+    from translator import parse_target_langs
     # 加载环境变量
-    import os
     api_key, num_threads, model, mock_mode = load_env()
-    from utils import mock_mode_global
+    from utils import mock_mode_global, load_cache_config, setup_logging
     mock_mode_global = mock_mode
+    if args.log_level:
+        setup_logging(args.log_level)
+    if args.cache is not None or args.cache_path:
+        load_cache_config(args.cache, args.cache_path)
     file_types = None
-    print(f"调试: args.file_types value: {repr(args.file_types)}")  # 临时调试
+    logger.debug("args.file_types value: %r", args.file_types)
     if args.file_types is not None:
         file_types = [t.strip() for t in args.file_types.split(',') if t.strip()]
-        print(f"使用file_types: {file_types}")
+        logger.debug("使用file_types: %s", file_types)
         if not file_types:
             print(f"无效文件类型: '{args.file_types}'")
             sys.exit(1)
     if file_types is None:
         env_types = os.getenv('FILE_TYPES', '').split(',')
         file_types = [t.strip() for t in env_types if t.strip()]
-        print(f"使用file_types: {file_types}")
+        logger.debug("使用file_types: %s", file_types)
         if not file_types:
             print("无效文件类型: '' (从.env加载)")
             sys.exit(1)
     if args.model:
-        model = args.model
+        try:
+            model = load_model_chain(args.model)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+    target_langs = parse_target_langs(args.target_lang)
+    if not target_langs:
+        print(f"无效目标语言: '{args.target_lang}'")
+        sys.exit(1)
+    # 多语言时所有 (块, 语言) 任务共用一个线程池，每种语言有独立的输出目录、检查点日志和清单
+    multi_lang = len(target_langs) > 1
+    target = target_langs if multi_lang else target_langs[0]
     
     # 确定输入文件列表
     file_paths = []
+    text_input = False
     if args.input_dir:
         if not os.path.exists(args.input_dir):
             print(f"错误: 输入目录 {args.input_dir} 不存在")
             sys.exit(1)
-        # 递归遍历目录，收集所有匹配文件类型
-        file_paths = []
-        for root, dirs, files in os.walk(args.input_dir):
-            for file in files:
-                if file_types and any(file.endswith('.' + ft) for ft in file_types):
-                    file_path = os.path.join(root, file)
-                    file_paths.append(file_path)
-        print(f"递归找到匹配文件: {len(file_paths)} 个")
+        # 递归扫描目录，收集所有匹配文件类型（跳过忽略模式匹配的文件和目录）
+        from scanner import scan_files
+        file_paths = scan_files(args.input_dir, file_types, ignore=args.ignore)
+        logger.info("递归找到匹配文件: %d 个", len(file_paths))
     elif args.input:
         file_paths = args.input
+    elif args.text:
+        input_text = ' '.join(args.text)
+        # 对于文本输入，创建临时文件处理
+        import tempfile
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as tmp:
+            tmp.write(input_text)
+            file_paths = [tmp.name]
+        text_input = True
     elif args.input_file:
         if not os.path.exists(args.input_file):
             print(f"错误: 输入文件 {args.input_file} 不存在")
             sys.exit(1)
         file_paths = [args.input_file]
-        print(f"过滤前文件路径: {file_paths}")  # 调试打印
+        logger.debug("过滤前文件路径: %s", file_paths)
         if not file_paths:
             print(f"警告: 目录 {args.input_dir} 中没有找到文件")
             sys.exit(0)
-    elif args.text:
-        input_text = ' '.join(args.text)
-        # 对于文本输入，创建临时文件处理
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as tmp:
-            tmp.write(input_text)
-            file_paths = [tmp.name]
     else:
         input_text = sys.stdin.read()
         if input_text.strip():
@@ -91,101 +289,181 @@ def main():
         sys.exit(0)
     
     from utils import filter_files_by_types
-    file_paths = filter_files_by_types(file_paths, file_types)
-    print(f"过滤后文件路径: {file_paths}")  # 调试打印过滤结果
+    if not text_input:
+        file_paths = filter_files_by_types(file_paths, file_types)
+    logger.debug("过滤后文件路径: %s", file_paths)
     
     if not file_paths:
         print("无匹配文件")
         sys.exit(0)
     
-    # 初始化结果字典
-    translation_results = {}
-    
-    # 并行翻译（统一处理单/多文件）
-    print("开始翻译...")
-    if len(file_paths) == 1:
-        # 单文件模式
-        with open(file_paths[0], 'r', encoding='utf-8') as f:
-            input_text = f.read()
-        from translator import translate_text
-        try:
-            translated_text = translate_text(input_text, api_key, args.target_lang, model, mock_mode=mock_mode_global)
-        except Exception as e:
-            print(f"翻译单文件时出错: {e}。使用原始内容。")
-            translated_text = input_text
-        translation_results[file_paths[0]] = translated_text
-    else:
-        translation_results = translate_parallel(file_paths, api_key, args.target_lang, num_threads, model, file_types, mock_mode_global, len(file_paths))
-    
-    # 统一写入输出（单/多文件）
     output_dir = args.output_dir or 'translated/'
-    os.makedirs(output_dir, exist_ok=True)
-    if len(file_paths) == 1 and args.output:
-        # 单文件指定输出路径
-        input_path = file_paths[0]
-        translated_content = translation_results.get(input_path, '')
-        try:
-            with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(translated_content)
-            print(f"翻译结果已保存到: {args.output}")
-        except IOError:
-            print(f"错误: 无法写入输出文件 {args.output}")
+    lang_dirs = {lang: os.path.join(output_dir, lang) if multi_lang else output_dir for lang in target_langs}
+    manifests = {}
+    if args.incremental:
+        if not args.input_dir:
+            print("错误: --incremental 需要配合 --input-dir 使用")
             sys.exit(1)
-    elif len(file_paths) == 1:
-        # 单文件使用output_dir
-        input_path = file_paths[0]
-        translated_content = translation_results.get(input_path, '')
+        from manifest import Manifest
+        manifests = {lang: Manifest.load(lang_dirs[lang], args.input_dir) for lang in target_langs}
+        # --dry-run 不修改输出目录
+        prune = args.prune and not args.dry_run
+        changed = set()
+        for lang, manifest in manifests.items():
+            for stale_output in manifest.remove_stale(file_paths, prune=prune):
+                if prune:
+                    print(f"源文件已删除，已移除输出: {stale_output}")
+                else:
+                    print(f"源文件已删除，输出已标记为孤立: {stale_output}")
+            changed.update(manifest.plan(file_paths, model, lang)[0])
+        # 任一语言需要更新的文件重新读取一次，其他语言的未变化块由缓存命中
+        unchanged_paths = [path for path in file_paths if path not in changed]
+        file_paths = [path for path in file_paths if path in changed]
+        print(f"增量模式: {len(file_paths)} 个文件需要翻译，{len(unchanged_paths)} 个文件未变化")
+        if not file_paths:
+            if not args.dry_run:
+                for manifest in manifests.values():
+                    manifest.save()
+            print("所有文件均为最新")
+            sys.exit(0)
+    
+    single_file = len(file_paths) == 1
+    
+    def get_output_path(input_path, lang=target_langs[0]):
+        if single_file and args.output:
+            # 单文件指定输出路径，多语言时在扩展名前加上语言代码
+            if multi_lang:
+                root, ext = os.path.splitext(args.output)
+                return f"{root}.{lang}{ext}"
+            return args.output
+        lang_dir = lang_dirs[lang]
         base_name = os.path.basename(input_path)
+        if not single_file and input_path.startswith('/tmp/'):  # 临时文件
+            return os.path.join(lang_dir, f"translated_{base_name}")
+        name, ext = os.path.splitext(base_name)
+        translated_name = f"{name}_translated{ext}"
         if args.input_dir:
             # 计算相对路径，保持目录结构
             rel_path = os.path.relpath(input_path, args.input_dir)
             input_dir_basename = os.path.basename(args.input_dir)
             rel_dir = os.path.dirname(f"{input_dir_basename}/{rel_path}")
-            name, ext = os.path.splitext(base_name)
-            translated_name = f"{name}_translated{ext}"
-            if rel_dir == '.':
-                output_path = os.path.join(output_dir, translated_name)
-            else:
-                output_subdir = os.path.join(output_dir, rel_dir)
-                os.makedirs(output_subdir, exist_ok=True)
-                output_path = os.path.join(output_subdir, translated_name)
+            if rel_dir != '.':
+                return os.path.join(lang_dir, rel_dir, translated_name)
+        return os.path.join(lang_dir, translated_name)
+    
+    if args.dry_run:
+        from planner import plan_translation, format_plan
+        workers = num_threads
+        if args.async_engine:
+            from async_translator import get_concurrency
+            workers = get_concurrency()
+        print(format_plan(plan_translation(file_paths, workers, model, target_langs, chunk_tokens=args.chunk_tokens, pack=args.pack,
+                                           pack_tokens=args.pack_tokens, extract=args.extract, dedup=args.dedup)))
+        return
+    
+    if args.queue:
+        # 队列模式：记录绝对路径，其他主机上的工作进程通过共享文件系统访问
+        from work_queue import WorkQueue
+        queue = WorkQueue(args.queue)
+        added = sum(
+            queue.enqueue([(os.path.abspath(path), os.path.abspath(get_output_path(path, lang))) for path in file_paths], lang, model)
+            for lang in target_langs
+        )
+        print(f"已加入队列 {args.queue}: {added} 个任务（{len(file_paths)} 个文件 × {len(target_langs)} 种语言），使用 `python main.py worker --queue {args.queue}` 开始处理")
+        queue.close()
+        return
+    
+    # 检查点日志：每个块/文件完成后立即记录，中断后可用 --resume 继续
+    journals = {lang: Journal.open(lang_dirs[lang], resume=args.resume, target_lang=lang, model=model) for lang in target_langs}
+    if args.resume:
+        remaining_paths = [path for path in file_paths if not all(journal.is_done(path) for journal in journals.values())]
+        print(f"继续上次的运行: 跳过 {len(file_paths) - len(remaining_paths)} 个已完成文件")
+        for lang, manifest in manifests.items():
+            for path in file_paths:
+                if journals[lang].is_done(path):
+                    manifest.record(path, journals[lang].files[path], model, lang)
+    else:
+        remaining_paths = file_paths
+    
+    def open_output(input_path, lang=target_langs[0]):
+        # 译文按块顺序增量写入临时文件，完成后原子替换，大文件也不在内存中累积
+        return AtomicWriter(get_output_path(input_path, lang))
+    
+    def save_output(input_path, lang=target_langs[0]):
+        # 译文已由 open_output 返回的写入器提交，这里只记录检查点和清单
+        output_path = get_output_path(input_path, lang)
+        logger.info("翻译结果已保存到: %s", output_path)
+        journals[lang].record_file(input_path, output_path)
+        if lang in manifests:
+            manifests[lang].record(input_path, output_path, model, lang)
+    
+    def save_result(*result):
+        # 单语言产出 (路径, 译文)，多语言产出 (路径, 语言, 译文)；译文已写出，为None
+        save_output(result[0], result[1] if multi_lang else target_langs[0])
+    
+    # 并行翻译（统一处理单/多文件，大文件会被切分为多个块并行翻译）
+    logger.info("开始翻译...")
+    options = dict(model=model, mock_mode=mock_mode_global, chunk_tokens=args.chunk_tokens, pack=args.pack, pack_tokens=args.pack_tokens, journal=journals if multi_lang else journals[target], dedup=args.dedup, extract=args.extract, open_output=open_output)
+    try:
+        if args.async_engine:
+            from async_translator import run_iter_translate
+            run_iter_translate(save_result, remaining_paths, api_key, target, total_files=len(file_paths), **options)
         else:
-            name, ext = os.path.splitext(base_name)
-            output_path = os.path.join(output_dir, f"{name}_translated{ext}")
-        try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(translated_content)
-            print(f"翻译结果已保存到: {output_path}")
-        except IOError:
-            print(f"错误: 无法写入输出文件 {output_path}")
+            for result in iter_translate(remaining_paths, api_key, target, num_threads, file_types=file_types, total_files=len(file_paths), **options):
+                save_result(*result)
+    except Exception as e:
+        if not single_file:
+            for journal in journals.values():
+                journal.close()
+            print(f"翻译失败: {e}。已完成的文件已保存，可使用 --resume 继续")
             sys.exit(1)
-    else:
-        # 多文件使用output_dir，保持目录结构
-        for input_path, translated_content in translation_results.items():
-            if input_path.startswith('/tmp/'):  # 临时文件
-                base_name = os.path.basename(input_path)
-                output_path = os.path.join(output_dir, f"translated_{base_name}")
-            else:
-                # 计算相对路径，保持目录结构
-                rel_path = os.path.relpath(input_path, args.input_dir)
-                input_dir_basename = os.path.basename(args.input_dir)
-                rel_dir = os.path.dirname(f"{input_dir_basename}/{rel_path}")
-                base_name = os.path.basename(input_path)
-                name, ext = os.path.splitext(base_name)
-                translated_name = f"{name}_translated{ext}"
-                if rel_dir == '.':
-                    output_path = os.path.join(output_dir, translated_name)
-                else:
-                    output_subdir = os.path.join(output_dir, rel_dir)
-                    os.makedirs(output_subdir, exist_ok=True)
-                    output_path = os.path.join(output_subdir, translated_name)
+        print(f"翻译单文件时出错: {e}。未完成的语言使用原始内容。")
+        for lang in target_langs:
+            # 已写出的语言保留译文；未成功翻译的语言不写入清单，下次增量运行时重试
+            if journals[lang].is_done(file_paths[0]):
+                continue
+            manifests.pop(lang, None)
             try:
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(translated_content)
-                print(f"翻译结果已保存到: {output_path}")
-            except IOError:
-                print(f"错误: 无法写入输出文件 {output_path}")
+                atomic_copy(file_paths[0], get_output_path(file_paths[0], lang))
+            except OSError:
+                print(f"错误: 无法写入输出文件 {get_output_path(file_paths[0], lang)}")
                 sys.exit(1)
+            save_output(file_paths[0], lang)
+    for journal in journals.values():
+        journal.close(remove=True)
+    
+    for manifest in manifests.values():
+        manifest.save()
+    if text_input and not args.output and not multi_lang:
+        # 文本参数的译文输出到标准输出，与转发给守护进程时一致
+        with open(get_output_path(file_paths[0]), encoding='utf-8') as f:
+            print(f.read())
+
+    from metrics import get_metrics, format_summary
+    metrics_snapshot = get_metrics().snapshot()
+    if metrics_snapshot['requests']:
+        print(format_summary(metrics_snapshot))
+    from rate_limiter import get_rate_limiter
+    limiter_stats = get_rate_limiter().stats()
+    if limiter_stats['throttle_events'] or limiter_stats['retries']:
+        print(f"限流统计: 当前并发上限 {limiter_stats['limit']:.1f}，限流事件 {limiter_stats['throttle_events']}，重试 {limiter_stats['retries']}")
+    from cache import get_cache
+    cache = get_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"缓存统计: 命中 {stats['hits']}，未命中 {stats['misses']}，命中率 {stats['hit_rate']:.1%}")
+    from memory import get_memory
+    memory = get_memory()
+    if memory is not None and memory.lookups:
+        stats = memory.stats()
+        print(f"翻译记忆统计: 查询 {stats['lookups']}，直接复用 {stats['reused']}，作为参考 {stats['referenced']}")
+    from backends import get_backend_pool
+    pool = get_backend_pool()
+    if len(pool) > 1:
+        for stats in pool.stats():
+            latency = f"{stats['latency_avg']:.2f}s" if stats['latency_avg'] is not None else "-"
+            print(f"后端 {stats['name']}: 请求 {stats['requests']}，失败 {stats['failures']}，剔除 {stats['ejections']} 次，"
+                  f"吞吐 {stats['throughput']:.2f} 次/秒，平均延迟 {latency}")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
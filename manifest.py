@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Tuple
+
+from translator import PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = '.translation_manifest.json'
+
+
+def file_hash(path: str) -> str:
+    """按块计算文件内容的sha256，避免一次读入整个文件"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    增量翻译清单，保存在输出目录中。
+
+    记录每个源文件（以输入目录名为前缀的相对路径）的大小、修改时间、内容哈希、模型、目标语言和输出路径，
+    下次运行时只调度内容或翻译设置发生变化的文件。
+    """
+
+    def __init__(self, output_dir: str, input_dir: str):
+        self.output_dir = output_dir
+        self.input_dir = input_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.prefix = os.path.basename(os.path.normpath(input_dir))
+        self.entries: Dict[str, dict] = {}
+
+    @classmethod
+    def load(cls, output_dir: str, input_dir: str) -> 'Manifest':
+        manifest = cls(output_dir, input_dir)
+        try:
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                manifest.entries = json.load(f).get('files', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("无法读取清单 %s，将重新翻译全部文件: %s", manifest.path, e)
+        return manifest
+
+    def save(self) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': self.entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def key(self, path: str) -> str:
+        # 以输入目录名作为前缀，多个输入目录共用同一输出目录时互不干扰
+        rel_path = os.path.relpath(path, self.input_dir).replace(os.sep, '/')
+        return f"{self.prefix}/{rel_path}"
+
+    def _settings_match(self, entry: dict, model: str, target_lang: str) -> bool:
+        return (entry.get('model') == model and entry.get('target_lang') == target_lang
+                and entry.get('prompt_version') == PROMPT_VERSION)
+
+    def is_current(self, path: str, model: str, target_lang: str) -> bool:
+        """判断文件自上次翻译以来是否未变化；大小和修改时间一致时不计算哈希"""
+        entry = self.entries.get(self.key(path))
+        if entry is None or not self._settings_match(entry, model, target_lang):
+            return False
+        output = entry.get('output')
+        if not output or not os.path.exists(output):
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size == entry.get('size') and stat.st_mtime == entry.get('mtime'):
+            return True
+        if stat.st_size != entry.get('size'):
+            return False
+        if file_hash(path) != entry.get('hash'):
+            return False
+        # 内容未变只是被touch过，更新修改时间以便下次走快速路径
+        entry['mtime'] = stat.st_mtime
+        return True
+
+    def plan(self, paths: List[str], model: str, target_lang: str) -> Tuple[List[str], List[str]]:
+        """把文件分为 (需要翻译, 已是最新) 两组"""
+        changed, unchanged = [], []
+        for path in paths:
+            (unchanged if self.is_current(path, model, target_lang) else changed).append(path)
+        return changed, unchanged
+
+    def record(self, path: str, output_path: str, model: str, target_lang: str) -> None:
+        stat = os.stat(path)
+        self.entries[self.key(path)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'hash': file_hash(path),
+            'model': model,
+            'target_lang': target_lang,
+            'prompt_version': PROMPT_VERSION,
+            'output': str(output_path),
+        }
+
+    def remove_stale(self, paths: List[str], prune: bool = False) -> List[str]:
+        """
+        处理源文件已消失的条目，返回其输出路径列表。
+        prune为True时删除对应输出文件并移除条目，否则仅标记为孤立。
+        """
+        current = {self.key(path) for path in paths}
+        stale_outputs = []
+        for key in list(self.entries):
+            if key in current or not key.startswith(self.prefix + '/'):
+                continue
+            entry = self.entries[key]
+            output = entry.get('output')
+            stale_outputs.append(output)
+            if prune:
+                if output and os.path.exists(output):
+                    os.remove(output)
+                del self.entries[key]
+            else:
+                entry['orphaned'] = True
+        return stale_outputs
@@ -0,0 +1,338 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from cache import BUSY_TIMEOUT_MS, normalize_text
+
+DEFAULT_MEMORY_PATH = '.translation_memory.sqlite3'
+DEFAULT_MEMORY_THRESHOLD = 0.6
+# 原文语言（提示词总是从英文翻译），用于TMX导出
+SOURCE_LANG = 'en'
+# 词级 n-gram 长度：改动一个词只影响包含它的 SHINGLE_SIZE 个 n-gram
+SHINGLE_SIZE = 3
+# MinHash 签名分为 NUM_BANDS 段、每段 BAND_ROWS 个值，任一段完全相同即成为候选：
+# Jaccard 相似度 0.5 的片段约 93% 成为候选，0.6 时约 99%，更高时几乎必然
+NUM_BANDS = 20
+BAND_ROWS = 3
+# 每个待查片段最多精确比较的候选数（按命中段数排序）
+MAX_CANDIDATES = 32
+# 单条 IN (...) 查询的参数个数，低于SQLite的参数上限
+QUERY_BATCH = 500
+
+_WORD_RE = re.compile(r'\w+')
+_PRIME = (1 << 61) - 1
+# 固定种子：签名写入数据库后必须在所有进程和机器上保持一致
+_rng = random.Random(0x7E57)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_BANDS * BAND_ROWS)]
+_XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+
+def shingles(text: str) -> set:
+    """规范化后（小写，忽略标点和空白差异）的词级 n-gram 集合"""
+    words = _WORD_RE.findall(normalize_text(text).lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {' '.join(words)}
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def similarity(a: set, b: set) -> float:
+    """两个 n-gram 集合的 Jaccard 系数"""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def band_hashes(shingle_set: set) -> List[int]:
+    """计算 MinHash 签名并把每段哈希为有符号64位整数（可直接存为SQLite INTEGER），段号参与哈希"""
+    hashes = [_hash64(shingle) for shingle in shingle_set]
+    signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+    bands = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]
+        digest = hashlib.blake2b(repr((band, rows)).encode('ascii'), digest_size=8).digest()
+        bands.append(int.from_bytes(digest, 'little', signed=True))
+    return bands
+
+
+def _segment_key(source: str, target_lang: str, model: str) -> str:
+    """原文（已规范化）、目标语言和模型共同决定一条记录，不同模型的译文分别保存"""
+    return hashlib.sha256(f"{model}\x00{target_lang}\x00{source}".encode('utf-8')).hexdigest()
+
+
+class MemoryMatch(NamedTuple):
+    source: str
+    target: str
+    similarity: float
+    # 原文完全相同（规范化首尾空白和换行后）且来自同一模型，可以直接使用 target
+    reusable: bool
+
+
+class TranslationMemory:
+    """
+    基于SQLite的模糊翻译记忆。
+
+    按 (原文片段, 目标语言, 模型) 记录译文，用词级 n-gram 的 MinHash/LSH 索引查找相似的旧片段。原文与同一模型的旧记录
+    完全相同时直接复用旧译文；否则 n-gram 集合的 Jaccard 系数不低于 threshold 的最相似旧片段只作为参考附在提示词中，
+    让模型沿用旧译文的措辞（忽略大小写和标点的相似度为 1.0 也不代表原文相同，不直接复用）。与 TranslationCache 一样使用单个加锁连接和回滚日志（不使用WAL），可跨线程、跨进程（包括网络文件系统上的其他主机）共享。
+    """
+
+    def __init__(self, path: str = DEFAULT_MEMORY_PATH, threshold: float = DEFAULT_MEMORY_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.lookups = 0
+        self.reused = 0
+        self.referenced = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            self._conn.execute('PRAGMA journal_mode=DELETE')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS segments ('
+                'id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, target_lang TEXT NOT NULL, '
+                'source TEXT NOT NULL, target TEXT NOT NULL, created REAL NOT NULL, model TEXT NOT NULL DEFAULT \'\')'
+            )
+            # 旧版本的数据库没有 model 列：旧记录的模型为空，只作为参考，不直接复用
+            if 'model' not in {row[1] for row in self._conn.execute('PRAGMA table_info(segments)')}:
+                self._conn.execute("ALTER TABLE segments ADD COLUMN model TEXT NOT NULL DEFAULT ''")
+            self._conn.execute('CREATE TABLE IF NOT EXISTS bands (hash INTEGER NOT NULL, segment_id INTEGER NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_bands_hash ON bands(hash)')
+            self._conn.commit()
+
+    def add(self, source: str, target: str, target_lang: str, model: str) -> None:
+        self.add_many([(source, target)], target_lang, model)
+
+    def add_many(self, pairs: Iterable[Tuple[str, str]], target_lang: str, model: str) -> int:
+        """记录同一模型的多个 (原文, 译文)；相同原文只保留最新译文。签名在锁外计算，返回记录的条数"""
+        rows = []
+        for source, target in pairs:
+            source = normalize_text(source)
+            if not source or not target:
+                continue
+            rows.append((_segment_key(source, target_lang, model), source, target, band_hashes(shingles(source))))
+        if not rows:
+            return 0
+        now = time.time()
+        with self._lock:
+            for key, source, target, bands in rows:
+                existing = self._conn.execute('SELECT id FROM segments WHERE key = ?', (key,)).fetchone()
+                if existing is not None:
+                    self._conn.execute('UPDATE segments SET target = ?, created = ? WHERE id = ?', (target, now, existing[0]))
+                    continue
+                cur = self._conn.execute(
+                    'INSERT INTO segments (key, target_lang, source, target, created, model) VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, target_lang, source, target, now, model)
+                )
+                self._conn.executemany('INSERT INTO bands (hash, segment_id) VALUES (?, ?)', [(band, cur.lastrowid) for band in bands])
+            self.stores += len(rows)
+            self._conn.commit()
+        return len(rows)
+
+    def lookup(self, text: str, target_lang: str, model: str) -> Optional[MemoryMatch]:
+        return self.lookup_many([text], target_lang, model)[0]
+
+    def lookup_many(self, texts: Sequence[str], target_lang: str, model: str) -> List[Optional[MemoryMatch]]:
+        """
+        批量查找每个片段：先按键查找同一模型下原文完全相同的记录（可直接复用），其余片段再查找最相似的旧片段作为参考
+        （候选和原文各一轮查询），相似度低于 threshold 时为None
+        """
+        keys = [_segment_key(normalize_text(text), target_lang, model) for text in texts]
+        exact: Dict[str, Tuple[str, str]] = {}
+        with self._lock:
+            unique_keys = sorted(set(keys))
+            for start in range(0, len(unique_keys), QUERY_BATCH):
+                batch = unique_keys[start:start + QUERY_BATCH]
+                query = f"SELECT key, source, target FROM segments WHERE key IN ({','.join('?' * len(batch))})"
+                for key, source, target in self._conn.execute(query, batch):
+                    exact[key] = (source, target)
+        fuzzy = [i for i, key in enumerate(keys) if key not in exact]
+        shingle_sets = [shingles(texts[i]) for i in fuzzy]
+        text_bands = [band_hashes(shingle_set) for shingle_set in shingle_sets]
+        all_bands = sorted({band for bands in text_bands for band in bands})
+        band_segments: Dict[int, List[int]] = {}
+        segments: Dict[int, Tuple[str, str]] = {}
+        with self._lock:
+            for start in range(0, len(all_bands), QUERY_BATCH):
+                batch = all_bands[start:start + QUERY_BATCH]
+                query = ("SELECT bands.hash, bands.segment_id FROM bands JOIN segments ON segments.id = bands.segment_id "
+                         f"WHERE segments.target_lang = ? AND bands.hash IN ({','.join('?' * len(batch))})")
+                for band, segment_id in self._conn.execute(query, [target_lang] + batch):
+                    band_segments.setdefault(band, []).append(segment_id)
+            candidates = []
+            for bands in text_bands:
+                counts: Dict[int, int] = {}
+                for band in bands:
+                    for segment_id in band_segments.get(band, ()):
+                        counts[segment_id] = counts.get(segment_id, 0) + 1
+                candidates.append(sorted(counts, key=counts.get, reverse=True)[:MAX_CANDIDATES])
+            ids = sorted({segment_id for ids in candidates for segment_id in ids})
+            for start in range(0, len(ids), QUERY_BATCH):
+                batch = ids[start:start + QUERY_BATCH]
+                query = f"SELECT id, source, target FROM segments WHERE id IN ({','.join('?' * len(batch))})"
+                for segment_id, source, target in self._conn.execute(query, batch):
+                    segments[segment_id] = (source, target)
+        matches: List[Optional[MemoryMatch]] = [MemoryMatch(*exact[key], 1.0, True) if key in exact else None for key in keys]
+        for i, shingle_set, ids in zip(fuzzy, shingle_sets, candidates):
+            best = None
+            for segment_id in ids:
+                if segment_id not in segments:
+                    continue
+                source, target = segments[segment_id]
+                score = similarity(shingle_set, shingles(source))
+                if score >= self.threshold and (best is None or score > best[0]):
+                    best = (score, source, target)
+            if best is not None:
+                matches[i] = MemoryMatch(best[1], best[2], best[0], False)
+        with self._lock:
+            self.lookups += len(texts)
+            self.reused += sum(1 for match in matches if match is not None and match.reusable)
+            self.referenced += sum(1 for match in matches if match is not None and not match.reusable)
+        return matches
+
+    def iter_entries(self, page_size: int = 1000) -> Iterator[dict]:
+        """按记录顺序分页遍历所有条目 {source, target, target_lang, model}，不在遍历期间一直持有锁"""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT id, source, target, target_lang, model FROM segments WHERE id > ? ORDER BY id LIMIT ?', (last_id, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for segment_id, source, target, target_lang, model in rows:
+                yield {'source': source, 'target': target, 'target_lang': target_lang, 'model': model}
+            last_id = rows[-1][0]
+
+    def export(self, path: str) -> int:
+        """导出为 TMX（扩展名 .tmx）或 JSONL，原子写出，返回条目数"""
+        from utils import AtomicWriter
+        writer = AtomicWriter(path)
+        count = 0
+        tmx = path.lower().endswith('.tmx')
+        try:
+            if tmx:
+                writer.write('<?xml version="1.0" encoding="UTF-8"?>\n<tmx version="1.4">\n'
+                             f'  <header creationtool="translator" creationtoolversion="1" segtype="paragraph" o-tmf="sqlite" '
+                             f'adminlang="en" srclang={quoteattr(SOURCE_LANG)} datatype="plaintext"/>\n  <body>\n')
+            for entry in self.iter_entries():
+                if tmx:
+                    # 模型记录为 tu 的 x-model 属性，导入时据此恢复（其他工具导出的TMX没有模型，只作为参考）
+                    prop = f'      <prop type="x-model">{escape(entry["model"])}</prop>\n' if entry['model'] else ''
+                    writer.write(f'    <tu>\n{prop}      <tuv xml:lang={quoteattr(SOURCE_LANG)}><seg>{escape(entry["source"])}</seg></tuv>\n'
+                                 f'      <tuv xml:lang={quoteattr(entry["target_lang"])}><seg>{escape(entry["target"])}</seg></tuv>\n    </tu>\n')
+                else:
+                    writer.write(json.dumps(dict(entry, source_lang=SOURCE_LANG), ensure_ascii=False) + '\n')
+                count += 1
+            if tmx:
+                writer.write('  </body>\n</tmx>\n')
+            writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+        return count
+
+    def import_file(self, path: str, batch_size: int = 1000) -> int:
+        """导入 export 生成的（或其他工具导出的）TMX/JSONL 文件，返回导入的条目数"""
+        entries = _iter_tmx(path) if path.lower().endswith('.tmx') else _iter_jsonl(path)
+        count = 0
+        batches: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        for source, target, target_lang, model in entries:
+            batch = batches.setdefault((target_lang, model), [])
+            batch.append((source, target))
+            if len(batch) >= batch_size:
+                count += self.add_many(batch, target_lang, model)
+                batch.clear()
+        for (target_lang, model), batch in batches.items():
+            count += self.add_many(batch, target_lang, model)
+        return count
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+
+    def stats(self) -> dict:
+        return {
+            'lookups': self.lookups,
+            'reused': self.reused,
+            'referenced': self.referenced,
+            'stores': self.stores,
+            'path': self.path,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _iter_jsonl(path: str) -> Iterator[Tuple[str, str, str, str]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry['source'], entry['target'], entry['target_lang'], entry.get('model', '')
+
+
+def _iter_tmx(path: str) -> Iterator[Tuple[str, str, str, str]]:
+    """流式解析TMX：header 的 srclang 对应的 tuv 为原文，其余每个 tuv 产出一条 (原文, 译文, 语言, 模型)"""
+    import xml.etree.ElementTree as ET
+    srclang = SOURCE_LANG
+    for event, element in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'header' and element.get('srclang', '*all*') != '*all*':
+                srclang = element.get('srclang')
+            continue
+        if element.tag != 'tu':
+            continue
+        prop = element.find("prop[@type='x-model']")
+        model = (prop.text or '') if prop is not None else ''
+        variants = {}
+        for tuv in element.iter('tuv'):
+            lang = tuv.get(_XML_LANG) or tuv.get('lang')
+            seg = tuv.find('seg')
+            if lang and seg is not None:
+                variants[lang] = ''.join(seg.itertext())
+        element.clear()
+        source = next((text for lang, text in variants.items() if lang.lower() == srclang.lower()), None)
+        if source is None:
+            continue
+        for lang, target in variants.items():
+            if lang.lower() != srclang.lower():
+                yield source, target, lang, model
+
+
+_default_memory: TranslationMemory | None = None
+_default_settings: tuple | None = None
+_default_lock = threading.Lock()
+
+
+def configure_memory(enabled: bool, path: str = DEFAULT_MEMORY_PATH, threshold: float = DEFAULT_MEMORY_THRESHOLD) -> TranslationMemory | None:
+    """配置进程级翻译记忆；相同配置重复调用时复用已有实例"""
+    global _default_memory, _default_settings
+    settings = (enabled, os.path.abspath(path), threshold)
+    with _default_lock:
+        if settings == _default_settings:
+            return _default_memory
+        if _default_memory is not None:
+            _default_memory.close()
+        _default_memory = TranslationMemory(path, threshold) if enabled else None
+        _default_settings = settings
+        return _default_memory
+
+
+def get_memory() -> TranslationMemory | None:
+    """返回当前进程的翻译记忆，未启用时返回None"""
+    return _default_memory
@@ -0,0 +1,199 @@
+import bisect
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 请求延迟直方图的桶上界（秒）
+DEFAULT_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """累积桶直方图，与Prometheus的histogram语义一致"""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶估算分位数（返回所在桶的上界），落在最后一个桶时返回最大桶上界"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    进程级翻译指标：API请求延迟直方图、按状态码统计的请求数、usage中的token数、
+    重试次数、发送/收到的文本字节数、在途任务队列深度以及完成的块/文件数。
+    所有方法线程安全，可在线程池工作线程和事件循环中调用。
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.latency = Histogram(self._buckets)
+            self.requests: Dict[str, int] = {}
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.retries = 0
+            self.bytes_out = 0
+            self.bytes_in = 0
+            self.queue_depth = 0
+            self.chunks = 0
+            self.files = 0
+            self.dedup_segments = 0
+            self.dedup_unique = 0
+            self.hedges = 0
+            self.hedge_wins = 0
+            self.fallbacks = 0
+
+    def observe_request(self, latency: float, status: int | str, bytes_out: int = 0) -> None:
+        """记录一次API请求尝试；网络错误时status为 'error'"""
+        with self._lock:
+            self.latency.observe(latency)
+            key = str(status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_out += bytes_out
+
+    def record_response(self, content: str, usage: Optional[dict] = None) -> None:
+        """记录成功解析的回复内容字节数和usage中的token数"""
+        with self._lock:
+            self.bytes_in += len(content.encode('utf-8'))
+            if usage:
+                self.prompt_tokens += int(usage.get('prompt_tokens') or 0)
+                self.completion_tokens += int(usage.get('completion_tokens') or 0)
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def set_queue_depth(self, depth: int) -> None:
+        self.queue_depth = depth
+
+    def record_chunk(self, finished_file: bool = False) -> None:
+        with self._lock:
+            self.chunks += 1
+            if finished_file:
+                self.files += 1
+
+    def record_dedup(self, segments: int, unique: int) -> None:
+        """记录一次运行的段落去重结果"""
+        with self._lock:
+            self.dedup_segments += segments
+            self.dedup_unique += unique
+
+    def record_hedge(self, won: bool) -> None:
+        """记录一次发出的对冲请求，won 表示对冲请求先于原请求成功"""
+        with self._lock:
+            self.hedges += 1
+            if won:
+                self.hedge_wins += 1
+
+    def record_fallback(self) -> None:
+        """记录一次主模型失败后改用回退模型"""
+        with self._lock:
+            self.fallbacks += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': sum(self.requests.values()),
+                'requests_by_status': dict(self.requests),
+                'throttled': self.requests.get('429', 0),
+                'server_errors': sum(count for status, count in self.requests.items() if status.isdigit() and int(status) >= 500),
+                'network_errors': self.requests.get('error', 0),
+                'retries': self.retries,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'bytes_out': self.bytes_out,
+                'bytes_in': self.bytes_in,
+                'queue_depth': self.queue_depth,
+                'chunks': self.chunks,
+                'files': self.files,
+                'dedup_segments': self.dedup_segments,
+                'dedup_unique': self.dedup_unique,
+                'dedup_ratio': 1 - self.dedup_unique / self.dedup_segments if self.dedup_segments else 0.0,
+                'hedges': self.hedges,
+                'hedge_wins': self.hedge_wins,
+                'fallbacks': self.fallbacks,
+                'latency_sum': self.latency.sum,
+                'latency_p50': self.latency.quantile(0.5),
+                'latency_p95': self.latency.quantile(0.95),
+                'latency_p99': self.latency.quantile(0.99),
+            }
+
+    def render_prometheus(self, extra_gauges: Iterable[Tuple[str, str, float]] = ()) -> str:
+        """生成Prometheus文本格式；extra_gauges 为 (名称, 说明, 值) 列表，用于附加限流器、任务数等状态"""
+        with self._lock:
+            lines: List[str] = [
+                '# HELP translator_request_duration_seconds API request latency per attempt.',
+                '# TYPE translator_request_duration_seconds histogram',
+            ]
+            cumulative = 0
+            for bound, count in zip(self.latency.buckets, self.latency.counts):
+                cumulative += count
+                lines.append(f'translator_request_duration_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'translator_request_duration_seconds_bucket{{le="+Inf"}} {self.latency.count}')
+            lines.append(f'translator_request_duration_seconds_sum {self.latency.sum}')
+            lines.append(f'translator_request_duration_seconds_count {self.latency.count}')
+            lines += ['# HELP translator_requests_total API request attempts by HTTP status.', '# TYPE translator_requests_total counter']
+            lines += [f'translator_requests_total{{status="{status}"}} {count}' for status, count in sorted(self.requests.items())]
+            counters = [
+                ('translator_retries_total', 'Retried API requests.', self.retries),
+                ('translator_prompt_tokens_total', 'Prompt tokens reported by the API usage field.', self.prompt_tokens),
+                ('translator_completion_tokens_total', 'Completion tokens reported by the API usage field.', self.completion_tokens),
+                ('translator_bytes_sent_total', 'UTF-8 bytes of prompts sent to the API.', self.bytes_out),
+                ('translator_bytes_received_total', 'UTF-8 bytes of translations received from the API.', self.bytes_in),
+                ('translator_chunks_total', 'Translated chunks.', self.chunks),
+                ('translator_files_total', 'Translated files.', self.files),
+                ('translator_dedup_segments_total', 'Segments seen by the deduplication stage.', self.dedup_segments),
+                ('translator_dedup_unique_segments_total', 'Unique segments actually scheduled for translation.', self.dedup_unique),
+                ('translator_hedged_requests_total', 'Hedge requests sent after the latency threshold.', self.hedges),
+                ('translator_hedge_wins_total', 'Hedge requests that finished before the original request.', self.hedge_wins),
+                ('translator_model_fallbacks_total', 'Requests retried on a fallback model after the previous model failed.', self.fallbacks),
+            ]
+            for name, help_text, value in counters:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter', f'{name} {value}']
+            gauges = [('translator_queue_depth', 'Scheduled chunk tasks not yet collected.', self.queue_depth)] + list(extra_gauges)
+        for name, help_text, value in gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+def format_summary(snapshot: dict) -> str:
+    """CLI运行结束时的单行指标摘要"""
+    p50 = snapshot['latency_p50']
+    p95 = snapshot['latency_p95']
+    latency = f"p50≤{p50}s p95≤{p95}s" if p50 is not None else "无"
+    dedup = ""
+    if snapshot.get('dedup_segments'):
+        dedup = f"，去重 {snapshot['dedup_segments']} 段中 {snapshot['dedup_unique']} 段唯一（节省 {snapshot['dedup_ratio']:.1%}）"
+    if snapshot.get('hedges') or snapshot.get('fallbacks'):
+        dedup += f"，对冲 {snapshot['hedges']} 次（胜出 {snapshot['hedge_wins']}），模型回退 {snapshot['fallbacks']} 次"
+    return (f"指标: 请求 {snapshot['requests']}（429 {snapshot['throttled']}，5xx {snapshot['server_errors']}，网络错误 {snapshot['network_errors']}），"
+            f"重试 {snapshot['retries']}，延迟 {latency}，tokens {snapshot['prompt_tokens']}+{snapshot['completion_tokens']}，"
+            f"发送 {snapshot['bytes_out']} 字节，接收 {snapshot['bytes_in']} 字节，完成 {snapshot['chunks']} 块/{snapshot['files']} 文件{dedup}")
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """返回进程级指标对象"""
+    return _metrics
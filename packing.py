@@ -0,0 +1,179 @@
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+from cache import get_cache, make_cache_key
+from segmenter import estimate_tokens
+from extraction import has_placeholders
+from memory import get_memory
+from translator import PROMPT_VERSION, chat_completion, language_name, request_completion, translate_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PACK_TOKENS = 1500
+# 单批段数上限，段数越多模型越容易打乱分隔符
+MAX_PACK_SEGMENTS = 40
+
+_SEGMENT_RE = re.compile(r'<<<SEG (\d+)>>>\n?(.*?)\n?<<<END \1>>>', re.S)
+
+
+def get_pack_tokens(pack_tokens: int | None = None) -> int:
+    """返回打包token预算，优先使用参数，其次是 .env 中的 PACK_TOKENS"""
+    if pack_tokens:
+        return pack_tokens
+    return int(os.getenv('PACK_TOKENS', DEFAULT_PACK_TOKENS))
+
+
+def build_packed_prompt(texts: Sequence[str], target_lang: str = 'zh', references: Optional[Sequence] = None) -> str:
+    """
+    把多个段落用带编号的分隔符拼成一个提示词。
+    references 与 texts 一一对应，非None的项为翻译记忆中相似的旧片段（MemoryMatch），附在段落之后供模型沿用措辞。
+    """
+    parts = [
+        f"Translate each of the following segments from English to {language_name(target_lang)}. "
+        "Each segment is wrapped between <<<SEG n>>> and <<<END n>>> markers. "
+        "Return every segment translated, wrapped in the same markers with the same ids "
+        "and in the same order. Do not merge, split or omit segments and output nothing else.",
+    ]
+    if any(has_placeholders(text) for text in texts):
+        parts[0] += " Keep placeholders such as ⟦0⟧ unchanged."
+    for i, text in enumerate(texts):
+        parts.append(f"<<<SEG {i}>>>\n{text}\n<<<END {i}>>>")
+    referenced = [(i, reference) for i, reference in enumerate(references or ()) if reference is not None]
+    if referenced:
+        parts.append("For consistency, earlier versions of some segments and their existing translations follow. "
+                     "Reuse their wording where a segment is unchanged; do not output them.")
+        for i, reference in referenced:
+            parts.append(f"<<<REF {i}>>>\nEarlier text: {reference.source}\nEarlier translation: {reference.target}\n<<<END REF {i}>>>")
+    return "\n\n".join(parts)
+
+
+def parse_packed_response(content: str, count: int) -> Dict[int, str]:
+    """解析打包回复，返回 {段编号: 译文}；编号越界或重复的段被丢弃"""
+    parsed: Dict[int, str] = {}
+    duplicated = set()
+    for match in _SEGMENT_RE.finditer(content):
+        seg_id = int(match.group(1))
+        if seg_id >= count:
+            continue
+        if seg_id in parsed:
+            duplicated.add(seg_id)
+        parsed[seg_id] = match.group(2).strip()
+    for seg_id in duplicated:
+        del parsed[seg_id]
+    return parsed
+
+
+def pack_segments(items: Sequence[Tuple[object, str]], pack_tokens: int) -> List[List[Tuple[object, str]]]:
+    """按token预算把 (键, 文本) 列表贪心分组，每组作为一次API调用"""
+    batches = []
+    current = []
+    current_tokens = 0
+    for key, text in items:
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > pack_tokens or len(current) >= MAX_PACK_SEGMENTS):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append((key, text))
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class PackedBatch:
+    """
+    translate_batch 的状态：缓存和翻译记忆查询、分组提示词、回复解析和写回，同步与异步版本共用，只有发送请求的方式不同。
+    lookup 和 accept 会读写缓存和翻译记忆（SQLite），异步版本在线程中调用它们。
+    """
+
+    def __init__(self, texts: Sequence[str], target_lang: str, model: str):
+        self.texts = texts
+        self.target_lang = target_lang
+        self.model = model
+        self.results: List[str | None] = [None] * len(texts)
+        self.references = {}
+        self.cache = get_cache()
+        self.memory = get_memory()
+
+    def _cache_set(self, i: int, text: str) -> None:
+        if self.cache is not None:
+            self.cache.set(make_cache_key(self.texts[i], self.target_lang, self.model, PROMPT_VERSION), text)
+
+    def lookup(self) -> List[int]:
+        """填入命中缓存和可直接复用翻译记忆的段，返回仍需翻译的段序号"""
+        pending = []
+        for i, text in enumerate(self.texts):
+            if self.cache is not None:
+                cached = self.cache.get(make_cache_key(text, self.target_lang, self.model, PROMPT_VERSION))
+                if cached is not None:
+                    self.results[i] = cached
+                    continue
+            pending.append(i)
+        # 只剩一段时由 translate_text 查询翻译记忆
+        if self.memory is None or len(pending) <= 1:
+            return pending
+        remaining = []
+        for i, match in zip(pending, self.memory.lookup_many([self.texts[i] for i in pending], self.target_lang, self.model)):
+            if match is not None and match.reusable:
+                self.results[i] = match.target
+                self._cache_set(i, match.target)
+                continue
+            self.references[i] = match
+            remaining.append(i)
+        return remaining
+
+    def prompt(self, indexes: List[int]) -> str:
+        return build_packed_prompt([self.texts[i] for i in indexes], self.target_lang, [self.references.get(i) for i in indexes])
+
+    def accept(self, indexes: List[int], content: str) -> List[List[int]]:
+        """
+        采用打包回复中正确解析的段并写回缓存和翻译记忆，返回需要重新请求的分组：
+        部分段缺失时缺失的段作为一组，全部缺失时对半拆分。
+        """
+        parsed = parse_packed_response(content, len(indexes))
+        missing = []
+        for seg_id, i in enumerate(indexes):
+            if seg_id in parsed:
+                self.results[i] = parsed[seg_id]
+                self._cache_set(i, parsed[seg_id])
+            else:
+                missing.append(i)
+        if self.memory is not None:
+            self.memory.add_many([(self.texts[i], parsed[seg_id]) for seg_id, i in enumerate(indexes) if seg_id in parsed], self.target_lang, self.model)
+        if not missing:
+            return []
+        logger.info("打包回复中有 %d/%d 段分隔符异常，拆分后重试", len(missing), len(indexes))
+        if len(missing) < len(indexes):
+            return [missing]
+        middle = len(missing) // 2
+        return [missing[:middle], missing[middle:]]
+
+
+def translate_batch(texts: Sequence[str], api_key: str, target_lang: str, model: str = "gpt-3.5-turbo", max_retries: int = 5, mock_mode: bool = False) -> List[str]:
+    """
+    在一次chat completion中翻译多个段落。
+
+    模型打乱分隔符时，已正确解析的段直接采用，缺失的段拆成更小的批次重试，
+    最终退化为逐段调用 translate_text。
+    开启翻译记忆时一次批量查询所有未命中缓存的段：足够相似的旧译文直接复用，其余相似片段作为参考附在提示词中。
+    """
+    if mock_mode:
+        # mock后端保留分段标记，与真实请求走同一套解析
+        parsed = parse_packed_response(request_completion(build_packed_prompt(texts, target_lang), api_key, model, max_retries, mock=True), len(texts))
+        return [parsed[i] if i in parsed else translate_text(text, api_key, target_lang, model, max_retries, mock_mode=True) for i, text in enumerate(texts)]
+    batch = PackedBatch(texts, target_lang, model)
+
+    def translate_group(indexes: List[int]) -> None:
+        if len(indexes) == 1:
+            i = indexes[0]
+            batch.results[i] = translate_text(texts[i], api_key, target_lang, model, max_retries)
+            return
+        for group in batch.accept(indexes, chat_completion(batch.prompt(indexes), api_key, model, max_retries)):
+            translate_group(group)
+
+    pending = batch.lookup()
+    if pending:
+        translate_group(pending)
+    return batch.results
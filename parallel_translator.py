@@ -1,72 +1,86 @@
 import concurrent.futures
-import time
-from typing import List
-from translator import translate_text, TranslationFailedError
+import logging
+from typing import Iterator, List
+from translator import translate_text
+from packing import translate_batch
+from metrics import get_metrics
+from pipeline import BatchJob, TranslationPipeline
 
-def translate_parallel(file_paths: List[str], api_key: str, target_lang: str, num_threads: int, model: str = "gpt-3.5-turbo", file_types: List[str] | None = None, mock_mode: bool = False, total_files: int = 0, progress_queue=None) -> dict:
+logger = logging.getLogger(__name__)
+
+def iter_translate(file_paths: List[str], api_key: str, target_lang: str | List[str], num_threads: int, model: str = "gpt-3.5-turbo", file_types: List[str] | None = None, mock_mode: bool = False, total_files: int = 0, progress_queue=None, chunk_tokens: int | None = None, pack: bool = False, pack_tokens: int | None = None, journal=None, dedup: bool = False, extract: bool = True, open_output=None) -> Iterator[tuple]:
     """
-    并行翻译多个文件，每个文件作为独立单元进行翻译。
+    并行翻译多个文件，每个文件全部块完成后立即产出 (路径, 译文)。
+    大文件按段落/标题边界切分为多个块，所有块作为独立任务调度到同一线程池；
+    文件按大小从大到小提交、按需读取，在途任务数有上限，内存占用与在途窗口而非语料总量成正比。
+    开启pack时，多个小块会被打包进一次API调用；传入journal时已完成的块会被跳过并记录新完成的块。
+    开启dedup时文件按段落切分，本次运行中相同的段落只翻译一次（在途请求也会合并），译文分发到所有用到它的文件；
+    段落通常较小，dedup 模式总是打包小段落。
+    extract 为True时按文件格式（md/rst/html）只发送正文：代码块、front matter、标签等原样保留，
+    行内代码、链接目标和URL替换为占位符，译文返回后还原。
+    传入 open_output(路径) 时每个文件的译文按块顺序增量写入其返回的 AtomicWriter，完成时提交并产出 (路径, None)，
+    超大文件也只需与在途窗口成正比的内存。
+    target_lang 为语言列表时每个文件只读取和切分一次，所有 (块, 语言) 任务调度到同一线程池，
+    每个文件的每种语言完成后产出 (路径, 语言, 译文)；此时 open_output 以 (路径, 语言) 调用，journal 为 {语言: Journal}。
     """
-    import os
-    
     from utils import mock_mode_global
     mock_mode = mock_mode or mock_mode_global
-    total_files = len(file_paths) if total_files == 0 else total_files
-    results = {}
-    
-    def translate_file_with_retry(path, content, max_retries=5):
-        for attempt in range(max_retries):
-            print(f"文件 {path} API call attempt {attempt + 1}/{max_retries}")
-            try:
-                translated = translate_text(content, api_key, target_lang, model, mock_mode=mock_mode)
-                return translated
-            except TranslationFailedError as e:
-                print(f"文件 {path} 翻译失败: {e}")
-                raise
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** (attempt + 1)
-                    print(f"文件 {path} 翻译重试 {attempt + 1}/{max_retries}，等待 {wait_time} 秒: {e}")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    print(f"文件 {path} 翻译失败 after {max_retries} attempts: {e}")
-                    raise TranslationFailedError(f"文件 {path} 翻译失败 after {max_retries} attempts: {e}")
-    
-    def translate_file(path):
+    pipeline = TranslationPipeline(file_paths, target_lang, model, total_files, progress_queue, chunk_tokens, pack, pack_tokens, journal, dedup, extract, open_output)
+    window = max(num_threads * 4, 1)
+    metrics = get_metrics()
+
+    def run_job(job):
+        # 重试和退避由 translator 中的进程级自适应限流器统一处理
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            if not content.strip():
-                return path, content
-            translated = translate_file_with_retry(path, content)
-            return path, translated
-        except TranslationFailedError as e:
-            print(f"文件 {path} 翻译失败，标记整个翻译失败: {e}")
-            raise
+            if isinstance(job, BatchJob):
+                translated = translate_batch(job.cores, api_key, job.lang, model, mock_mode=mock_mode)
+            else:
+                translated = translate_text(job.core, api_key, job.lang, model, mock_mode=mock_mode)
         except Exception as e:
-            print(f"处理文件 {path} 时出错: {e}")
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-            except:
-                content = ""
-            return path, content
-    
+            translated = job.fallback(e)
+        return job.results(translated)
+
     with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-        future_to_path = {executor.submit(translate_file, path): path for path in file_paths}
-        completed_count = 0
-        for future in concurrent.futures.as_completed(future_to_path):
-            path, translated_content = future.result()
-            results[path] = translated_content
-            completed_count += 1
-            if total_files > 1:
-                percentage = (completed_count / total_files * 100)
-                print(f"进度: {completed_count}/{total_files} 文件完成 ({percentage:.1f}%)")
-                if progress_queue:
-                    progress_queue.append({
-                        'progress': percentage,
-                        'message': f'进度: {completed_count}/{total_files} 文件完成 ({percentage:.1f}%)'
-                    })
-    
-    return results
\ No newline at end of file
+        pending = set()
+
+        def collect(block=True):
+            done, _ = concurrent.futures.wait(pending, timeout=None if block else 0, return_when=concurrent.futures.FIRST_COMPLETED)
+            pending.difference_update(done)
+            metrics.set_queue_depth(len(pending))
+            return pipeline.deliver_done(done)
+
+        try:
+            for path in pipeline.file_paths:
+                units = pipeline.open_file(path)
+                # 块在读取文件时逐个产出，受在途窗口限制，大文件不会整体读入内存；每个块为每种语言各生成一个任务
+                for index, (source, translatable) in enumerate(pipeline.read_chunks(path)):
+                    finished, jobs = pipeline.add_chunk(units, index, source, translatable)
+                    yield from finished
+                    for job in jobs:
+                        pending.add(executor.submit(run_job, job))
+                    metrics.set_queue_depth(len(pending))
+                    while len(pending) >= window:
+                        yield from collect()
+                yield from pipeline.close_file(units)
+                # 不阻塞地产出已完成的文件，尽早写出结果
+                if pending:
+                    yield from collect(block=False)
+            for job in pipeline.flush():
+                pending.add(executor.submit(run_job, job))
+            while pending:
+                yield from collect()
+            pipeline.finish_run()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            pipeline.abort()
+            raise
+
+def translate_parallel(file_paths: List[str], api_key: str, target_lang: str | List[str], num_threads: int, model: str = "gpt-3.5-turbo", file_types: List[str] | None = None, mock_mode: bool = False, total_files: int = 0, progress_queue=None, chunk_tokens: int | None = None, pack: bool = False, pack_tokens: int | None = None, dedup: bool = False, extract: bool = True) -> dict:
+    """
+    并行翻译多个文件并返回 {路径: 译文}；需要边翻译边写出结果时使用 iter_translate。
+    target_lang 为语言列表时返回 {(路径, 语言): 译文}。
+    """
+    if not isinstance(target_lang, str):
+        return {(path, lang): text for path, lang, text in iter_translate(file_paths, api_key, target_lang, num_threads, model, file_types, mock_mode, total_files, progress_queue, chunk_tokens, pack, pack_tokens, dedup=dedup, extract=extract)}
+    return dict(iter_translate(file_paths, api_key, target_lang, num_threads, model, file_types, mock_mode, total_files, progress_queue, chunk_tokens, pack, pack_tokens, dedup=dedup, extract=extract))
\ No newline at end of file
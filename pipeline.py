@@ -0,0 +1,300 @@
+import logging
+import os
+from typing import Iterator, List, Tuple
+
+from dedup import SegmentDeduplicator
+from extraction import iter_document, protect, restore
+from metrics import get_metrics
+from packing import get_pack_tokens, MAX_PACK_SEGMENTS
+from planner import largest_first
+from segmenter import get_chunk_tokens, estimate_tokens
+from translator import parse_target_langs, TranslationFailedError
+
+logger = logging.getLogger(__name__)
+
+
+def split_whitespace(chunk: str) -> Tuple[str, str, str]:
+    """只翻译去除首尾空白后的内容，再补回原有空白，保证块之间的分隔符不丢失"""
+    core = chunk.strip()
+    return chunk[:len(chunk) - len(chunk.lstrip())], core, chunk[len(chunk.rstrip()):]
+
+
+class ChunkJob:
+    """一个单独请求的块；task 为 (路径, 语言)，去重模式下为 (段落键, 语言)"""
+
+    def __init__(self, task: tuple, index: int, chunk: str):
+        self.task = task
+        self.index = index
+        self.lang = task[1]
+        self.leading, self.core, self.trailing = split_whitespace(chunk)
+
+    def fallback(self, error: Exception) -> str:
+        """TranslationFailedError 使整个翻译失败；其他异常只跳过这一块，保留原文"""
+        if isinstance(error, TranslationFailedError):
+            logger.error("文件 %s 翻译失败，标记整个翻译失败: %s", self.task[0], error)
+            raise error
+        logger.warning("处理文件 %s 第 %d 块时出错，保留原文: %s", self.task[0], self.index + 1, error)
+        return self.core
+
+    def results(self, translated: str) -> List[tuple]:
+        return [(self.task, self.index, self.leading + translated + self.trailing)]
+
+
+class BatchJob:
+    """打包进一次请求的多个小块，batch 为 [((task, 块序号), 块), ...]，同一批只翻译为一种语言"""
+
+    def __init__(self, batch: List[tuple], lang: str):
+        self.keys = [key for key, _ in batch]
+        self.lang = lang
+        self.parts = [split_whitespace(chunk) for _, chunk in batch]
+        self.cores = [core for _, core, _ in self.parts]
+
+    def fallback(self, error: Exception) -> List[str]:
+        label = ', '.join(sorted({str(task[0]) for task, _ in self.keys}))
+        if isinstance(error, TranslationFailedError):
+            logger.error("文件 %s 翻译失败，标记整个翻译失败: %s", label, error)
+            raise error
+        logger.warning("处理打包批次 %s 时出错，保留原文: %s", label, error)
+        return self.cores
+
+    def results(self, translated: List[str]) -> List[tuple]:
+        return [
+            (task, index, leading + text + trailing)
+            for (task, index), (leading, _, trailing), text in zip(self.keys, self.parts, translated)
+        ]
+
+
+class TranslationPipeline:
+    """
+    线程池引擎（parallel_translator.iter_translate）和异步引擎（async_translator.iter_translate_async）共用的调度与簿记：
+    读取和切分文件、格式提取的占位符、断点日志、段落去重、小块打包、按块顺序写出、进度统计。
+    引擎只负责执行 add_chunk/close_file/flush 返回的 ChunkJob/BatchJob，并把结果交给 deliver_done。
+
+    这里的调用都是同步的：断点日志的查询在内存中完成，记录只是追加一行并flush；
+    输出在 AtomicWriter 中缓冲，超过缓冲区才写入临时文件；异步引擎在事件循环中直接调用它们，
+    只有文件读取（read_chunks）放到线程中。缓存和翻译记忆（SQLite）的读写在翻译函数中，不经过这里。
+    """
+
+    def __init__(self, file_paths: List[str], target_lang: str | List[str], model: str, total_files: int = 0, progress_queue=None,
+                 chunk_tokens: int | None = None, pack: bool = False, pack_tokens: int | None = None, journal=None,
+                 dedup: bool = False, extract: bool = True, open_output=None):
+        self.multi = not isinstance(target_lang, str)
+        self.langs = parse_target_langs(target_lang) if self.multi else [target_lang]
+        self.journals = journal if isinstance(journal, dict) else {lang: journal for lang in self.langs}
+        # 大文件先提交，避免最后才读到的大文件成为长尾
+        self.file_paths = largest_first(file_paths)
+        self.chunk_tokens = get_chunk_tokens(chunk_tokens)
+        self.pack_tokens = get_pack_tokens(pack_tokens)
+        self.deduplicator = SegmentDeduplicator(self.langs[0], model) if dedup else None
+        # 段落通常较小，dedup 模式总是打包小段落
+        self.pack = pack or dedup
+        self.extract = extract
+        self.open_output = open_output
+        self.progress_queue = progress_queue
+        self.total_outputs = (total_files or len(file_paths)) * len(self.langs)
+        total_bytes = 0
+        for path in file_paths:
+            try:
+                total_bytes += os.path.getsize(path)
+            except OSError:
+                pass
+        self.total_bytes = total_bytes * len(self.langs)
+        # 以 (路径, 语言) 为单位记录每个输出的状态
+        self.buffers = {}
+        # 读取中途出错的文件 {路径: 异常}，这些文件的输出不提交
+        self.failed = {}
+        self.placeholders = {}
+        self.progress = {'chunks': 0, 'files': 0, 'bytes': 0}
+        # 打包批次按语言分开，一次调用只翻译为一种语言
+        self.small_batches = {lang: [] for lang in self.langs}
+        self.small_tokens = dict.fromkeys(self.langs, 0)
+        self.metrics = get_metrics()
+
+    def read_chunks(self, path: str) -> Iterator[Tuple[str, bool]]:
+        """
+        逐块读取文件；读取或解码出错（包括流式读取大文件的中途）时记录该文件失败并停止产出，
+        close_file 会放弃它的输出，其余文件照常翻译，finish_run 最后抛出 TranslationFailedError。
+        """
+        try:
+            yield from iter_document(path, self.chunk_tokens, segments=self.deduplicator is not None, extract=self.extract)
+        except (OSError, ValueError) as e:
+            logger.error("处理文件 %s 时出错，放弃该文件的输出: %s", path, e)
+            self.failed[path] = e
+
+    def open_file(self, path: str) -> List[tuple]:
+        """开始读取一个文件，返回它的输出单元 [(路径, 语言), ...]"""
+        units = [(path, lang) for lang in self.langs]
+        for unit in units:
+            writer = None
+            if self.open_output is not None:
+                writer = self.open_output(*unit) if self.multi else self.open_output(path)
+            self.buffers[unit] = {'sources': {}, 'parts': {}, 'count': 0, 'remaining': 0, 'reading': True, 'written': 0, 'writer': writer, 'failed': False}
+        return units
+
+    def add_chunk(self, units: List[tuple], index: int, source: str, translatable: bool) -> Tuple[List[tuple], list]:
+        """
+        登记文件的第index块，每种语言各一个任务；返回 (已完成的文件, 需要执行的任务)。
+        断点日志中已有、不可翻译、空白或去重后已有译文的块直接完成；小块先攒进打包批次，批次满时作为任务返回。
+        """
+        finished, jobs = [], []
+        path = units[0][0]
+        masked = protected = None
+        for unit in units:
+            lang = unit[1]
+            state = self.buffers[unit]
+            state['sources'][index] = source
+            state['count'] += 1
+            state['remaining'] += 1
+            unit_journal = self.journals[lang]
+            resumed = unit_journal.lookup(path, source) if unit_journal is not None and translatable else None
+            if resumed is not None or not translatable or not source.strip():
+                finished += self._complete(unit, index, source if resumed is None else resumed, from_journal=resumed is not None)
+                continue
+            chunk = source
+            if self.extract:
+                if masked is None:
+                    masked, protected = protect(source, path)
+                chunk = masked
+                if protected:
+                    self.placeholders[(unit, index)] = protected
+            task, task_index = unit, index
+            if self.deduplicator is not None:
+                leading, core, trailing = split_whitespace(chunk)
+                key, known, is_new = self.deduplicator.claim(core, (unit, index, leading, trailing), lang)
+                if known is not None:
+                    finished += self._complete(unit, index, leading + known + trailing)
+                    continue
+                if not is_new:
+                    # 相同段落已在队列或在途中，等其结果分发
+                    continue
+                task, task_index, chunk = (key, lang), 0, core
+            tokens = estimate_tokens(chunk)
+            if self.pack and tokens < self.pack_tokens:
+                batch = self.small_batches[lang]
+                if batch and (self.small_tokens[lang] + tokens > self.pack_tokens or len(batch) >= MAX_PACK_SEGMENTS):
+                    jobs.append(BatchJob(batch, lang))
+                    self.small_batches[lang] = batch = []
+                    self.small_tokens[lang] = 0
+                batch.append(((task, task_index), chunk))
+                self.small_tokens[lang] += tokens
+            else:
+                jobs.append(ChunkJob(task, task_index, chunk))
+        return finished, jobs
+
+    def close_file(self, units: List[tuple]) -> List[tuple]:
+        """文件已读完，返回其中全部块都已完成的输出；读取失败的文件删除已写出的部分，不产出"""
+        finished = []
+        failed = units[0][0] in self.failed
+        for unit in units:
+            state = self.buffers[unit]
+            state['reading'] = False
+            if failed:
+                state['failed'] = True
+                state['parts'].clear()
+                if state['writer'] is not None:
+                    state['writer'].abort()
+                if state['remaining'] == 0:
+                    del self.buffers[unit]
+            elif state['remaining'] == 0:
+                finished.append(self._finish(unit))
+        return finished
+
+    def flush(self) -> List[BatchJob]:
+        """所有文件读完后，把未满的打包批次作为任务返回"""
+        jobs = [BatchJob(batch, lang) for lang, batch in self.small_batches.items() if batch]
+        self.small_batches = {lang: [] for lang in self.langs}
+        self.small_tokens = dict.fromkeys(self.langs, 0)
+        return jobs
+
+    def partial_text(self, job: ChunkJob, translated: str) -> str:
+        """流式翻译中途的部分译文（还原占位符，补回前导空白）"""
+        return restore(job.leading + translated, self.placeholders.get((job.task, job.index)), warn=False)
+
+    def deliver(self, task: tuple, index: int, text: str) -> List[tuple]:
+        """登记任务结果；去重模式下任务以 (段落键, 语言) 代替 (路径, 语言)，译文分发给所有等待的文件块"""
+        if self.deduplicator is None:
+            return self._complete(task, index, text)
+        finished = []
+        for unit, waiter_index, leading, trailing in self.deduplicator.resolve(task[0], text):
+            finished += self._complete(unit, waiter_index, leading + text + trailing)
+        return finished
+
+    def deliver_done(self, futures) -> List[tuple]:
+        """
+        登记已完成任务（concurrent.futures 或 asyncio 的 Future）的结果，返回已完成的文件。
+        先登记同批完成的块，再抛出第一个失败，避免已完成的译文在续传时重复请求。
+        """
+        finished = []
+        error = None
+        for future in futures:
+            if future.exception() is not None:
+                error = error or future.exception()
+                continue
+            for task, index, text in future.result():
+                finished += self.deliver(task, index, text)
+        if error is not None:
+            raise error
+        return finished
+
+    def finish_run(self) -> None:
+        """所有任务完成后调用；有文件读取失败时抛出 TranslationFailedError，其余文件已经产出"""
+        if self.deduplicator is not None:
+            stats = self.deduplicator.stats()
+            self.metrics.record_dedup(stats['segments'], stats['unique'])
+            logger.info("段落去重: %d 段中 %d 段唯一，节省 %.1f%% 的段落请求", stats['segments'], stats['unique'], stats['ratio'] * 100, extra=stats)
+        if self.failed:
+            details = '; '.join(f"{path}: {error}" for path, error in self.failed.items())
+            raise TranslationFailedError(f"读取 {len(self.failed)} 个文件时出错，未写出译文: {details}")
+
+    def abort(self) -> None:
+        """运行失败或被取消时删除未提交输出的临时文件"""
+        for state in self.buffers.values():
+            if state['writer'] is not None:
+                state['writer'].abort()
+
+    def _finish(self, unit: tuple) -> tuple:
+        """文件已读完且全部块完成：提交输出并返回 (路径, 译文)；使用 open_output 时译文已写出，返回 (路径, None)"""
+        state = self.buffers.pop(unit)
+        self.progress['files'] += 1
+        text = None
+        if state['writer'] is not None:
+            state['writer'].commit()
+        else:
+            text = ''.join(state['parts'][index] for index in range(state['count']))
+        return (unit[0], unit[1], text) if self.multi else (unit[0], text)
+
+    def _complete(self, unit: tuple, index: int, text: str, from_journal: bool = False) -> List[tuple]:
+        """登记一个已完成的块，文件已读完且全部块完成时返回 [_finish 的结果]"""
+        text = restore(text, self.placeholders.pop((unit, index), None))
+        state = self.buffers[unit]
+        chunk = state['sources'].pop(index)
+        if state['failed']:
+            # 文件读取失败，输出已放弃，在途块的译文直接丢弃
+            state['remaining'] -= 1
+            if state['remaining'] == 0:
+                del self.buffers[unit]
+            return []
+        unit_journal = self.journals[unit[1]]
+        if unit_journal is not None and not from_journal:
+            unit_journal.record_chunk(unit[0], chunk, text)
+        state['parts'][index] = text
+        state['remaining'] -= 1
+        if state['writer'] is not None:
+            # 按顺序写出已完成的前缀，释放对应的译文
+            while state['written'] in state['parts']:
+                state['writer'].write(state['parts'].pop(state['written']))
+                state['written'] += 1
+        progress = self.progress
+        progress['chunks'] += 1
+        progress['bytes'] += len(chunk.encode('utf-8'))
+        finished = []
+        if state['remaining'] == 0 and not state['reading']:
+            finished.append(self._finish(unit))
+        self.metrics.record_chunk(finished_file=bool(finished))
+        if self.total_outputs > 1 or progress['chunks'] > 1:
+            percentage = min(progress['bytes'] / self.total_bytes * 100, 100.0) if self.total_bytes else 100.0
+            message = f"进度: {progress['chunks']} 块完成，{progress['files']}/{self.total_outputs} 文件完成 ({percentage:.1f}%)"
+            logger.info(message, extra={'chunks': progress['chunks'], 'files': progress['files'], 'total_files': self.total_outputs, 'progress': round(percentage, 1)})
+            if self.progress_queue:
+                self.progress_queue.append({'progress': percentage, 'message': message})
+        return finished
@@ -0,0 +1,150 @@
+import heapq
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from cache import get_cache, make_cache_key
+from extraction import iter_document, protect
+from packing import MAX_PACK_SEGMENTS, build_packed_prompt, get_pack_tokens
+from segmenter import estimate_tokens, get_chunk_tokens
+from translator import PROMPT_VERSION, build_prompt, parse_target_langs
+
+logger = logging.getLogger(__name__)
+
+# 估算墙钟时间用的默认值：每个请求的固定延迟（秒）和模型输出速率（tokens/s）
+DEFAULT_REQUEST_LATENCY = 1.0
+DEFAULT_TOKENS_PER_SECOND = 50.0
+# 译文token数相对原文token数的估算比例
+COMPLETION_RATIO = 1.0
+# 常见模型的价格（美元/百万token，输入, 输出），可用 .env 中的 PROMPT_PRICE/COMPLETION_PRICE 覆盖
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.5, 1.5),
+    'gpt-4o-mini': (0.15, 0.6),
+    'gpt-4o': (2.5, 10.0),
+    'gpt-4.1-mini': (0.4, 1.6),
+    'gpt-4.1': (2.0, 8.0),
+}
+_PACK_MARKER_TOKENS = estimate_tokens("<<<SEG 00>>>\n\n<<<END 00>>>\n\n")
+
+
+def largest_first(file_paths: List[str]) -> List[str]:
+    """按文件大小从大到小排序，让大文件的块最先提交，避免最后才开始的大文件拖长整体耗时"""
+    def size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    return sorted(file_paths, key=size, reverse=True)
+
+
+def get_model_prices(model: str) -> Optional[Tuple[float, float]]:
+    """返回模型的 (输入, 输出) 价格（美元/百万token），未知模型且未配置时返回None"""
+    prompt_price = os.getenv('PROMPT_PRICE')
+    completion_price = os.getenv('COMPLETION_PRICE')
+    if prompt_price and completion_price:
+        return float(prompt_price), float(completion_price)
+    return MODEL_PRICES.get(model.split('/')[-1])
+
+
+def estimate_makespan(durations: List[float], workers: int) -> float:
+    """按提交顺序把请求分配给最早空闲的工作线程，返回全部完成的时间"""
+    finish = [0.0] * max(workers, 1)
+    for duration in durations:
+        heapq.heapreplace(finish, finish[0] + duration)
+    return max(finish)
+
+
+def plan_translation(file_paths: List[str], num_threads: int, model: str, target_lang: str | List[str] = 'zh', chunk_tokens: int | None = None,
+                     pack: bool = False, pack_tokens: int | None = None, extract: bool = True, dedup: bool = False,
+                     latency: float | None = None, tokens_per_second: float | None = None) -> dict:
+    """
+    不调用API，按与翻译引擎相同的切分、打包、去重和缓存规则估算一次运行的请求数、token数、费用和墙钟时间。
+    target_lang 为多个语言时每个块对每种语言各估算一次，打包批次按语言分开。
+    """
+    langs = parse_target_langs(target_lang)
+    chunk_tokens = get_chunk_tokens(chunk_tokens)
+    pack_tokens = get_pack_tokens(pack_tokens)
+    pack = pack or dedup
+    latency = latency if latency is not None else float(os.getenv('PLAN_LATENCY', DEFAULT_REQUEST_LATENCY))
+    tokens_per_second = tokens_per_second or float(os.getenv('PLAN_TOKENS_PER_SECOND', DEFAULT_TOKENS_PER_SECOND))
+    cache = get_cache()
+    seen = set()
+    requests = []  # 每个请求的 (提示词token数, 译文token数)
+    plan = {'files': 0, 'chunks': 0, 'skipped_chunks': 0, 'cached_chunks': 0, 'duplicate_chunks': 0, 'unreadable_files': 0}
+    small_batches = {lang: [] for lang in langs}
+    small_tokens = dict.fromkeys(langs, 0)
+
+    def flush(lang):
+        batch = small_batches[lang]
+        completion = sum(estimate_tokens(text) for text in batch) * COMPLETION_RATIO + _PACK_MARKER_TOKENS * len(batch)
+        requests.append((estimate_tokens(build_packed_prompt(batch, lang)), completion))
+        small_batches[lang] = []
+        small_tokens[lang] = 0
+
+    for path in largest_first(file_paths):
+        # 与 TranslationPipeline.read_chunks 一样按需读取和切分：超大文件逐行流式读取，不整体读入内存
+        try:
+            for chunk, translatable in iter_document(path, chunk_tokens, segments=dedup, extract=extract):
+                plan['chunks'] += 1
+                core = chunk.strip()
+                if not translatable or not core:
+                    plan['skipped_chunks'] += 1
+                    continue
+                if extract:
+                    core = protect(core, path)[0]
+                tokens = estimate_tokens(core)
+                for lang in langs:
+                    key = make_cache_key(core, lang, model, PROMPT_VERSION)
+                    if dedup:
+                        if key in seen:
+                            plan['duplicate_chunks'] += 1
+                            continue
+                        seen.add(key)
+                    if cache is not None and cache.contains(key):
+                        plan['cached_chunks'] += 1
+                        continue
+                    if pack and tokens < pack_tokens:
+                        if small_batches[lang] and (small_tokens[lang] + tokens > pack_tokens or len(small_batches[lang]) >= MAX_PACK_SEGMENTS):
+                            flush(lang)
+                        small_batches[lang].append(core)
+                        small_tokens[lang] += tokens
+                    else:
+                        requests.append((estimate_tokens(build_prompt(core, lang)), tokens * COMPLETION_RATIO))
+        except (OSError, ValueError) as e:
+            logger.error("处理文件 %s 时出错: %s", path, e)
+            plan['unreadable_files'] += 1
+            continue
+        plan['files'] += 1
+    for lang in langs:
+        if small_batches[lang]:
+            flush(lang)
+
+    prompt_tokens = sum(prompt for prompt, _ in requests)
+    completion_tokens = int(sum(completion for _, completion in requests))
+    prices = get_model_prices(model)
+    plan.update({
+        'model': model,
+        'target_langs': langs,
+        'num_threads': num_threads,
+        'requests': len(requests),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cost': (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000 if prices else None,
+        'wall_clock': estimate_makespan([latency + completion / tokens_per_second for _, completion in requests], num_threads),
+    })
+    return plan
+
+
+def format_plan(plan: dict) -> str:
+    """CLI --dry-run 的输出"""
+    cost = f"${plan['cost']:.4f}" if plan['cost'] is not None else "未知（在 .env 中设置 PROMPT_PRICE/COMPLETION_PRICE）"
+    lines = [
+        f"预估（模型 {plan['model']}，目标语言 {','.join(plan['target_langs'])}，并发 {plan['num_threads']}，未调用API）:",
+        f"  文件 {plan['files']} 个，块 {plan['chunks']} 个（跳过非正文 {plan['skipped_chunks']}，缓存命中 {plan['cached_chunks']}，重复 {plan['duplicate_chunks']}）",
+        f"  请求 {plan['requests']} 次，tokens {plan['prompt_tokens']}+{plan['completion_tokens']}",
+        f"  费用 {cost}",
+        f"  墙钟时间约 {plan['wall_clock']:.1f} 秒",
+    ]
+    if plan['unreadable_files']:
+        lines.append(f"  无法读取的文件 {plan['unreadable_files']} 个")
+    return '\n'.join(lines)
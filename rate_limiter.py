@@ -0,0 +1,178 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+DEFAULT_MAX_LIMIT = 100
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_CAP = 60.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或HTTP日期），无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttle_status(status_code: int) -> bool:
+    """429和5xx视为拥塞信号"""
+    return status_code == 429 or status_code >= 500
+
+
+class AdaptiveLimiter:
+    """
+    进程级AIMD并发控制器和全局重试预算。
+
+    所有工作线程/协程在发出请求前获取一个槽位：成功时并发上限加性增长（首次限流前为慢启动），
+    遇到429/5xx或网络错误时乘性减小，并在 Retry-After 指定的时间内暂停发放新槽位。
+    重试需要从全局预算中扣除，预算随成功请求数按比例补充，避免限流时所有线程同时重试。
+    """
+
+    def __init__(self, initial_limit: float = 5, min_limit: float = 1, max_limit: float = DEFAULT_MAX_LIMIT,
+                 decrease_factor: float = 0.5, retry_ratio: float = 0.2, min_retries: int = 10,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_cap: float = DEFAULT_BACKOFF_CAP):
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.retry_ratio = retry_ratio
+        self.min_retries = min_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.in_flight = 0
+        self.requests = 0
+        self.successes = 0
+        self.retries = 0
+        self.throttle_events = 0
+        self.budget_exhausted = 0
+        self.blocked_until = 0.0
+        self.events = deque(maxlen=100)
+        self._slow_start = True
+        self._cond = threading.Condition()
+
+    def _wait_time_locked(self) -> float:
+        """返回距离可以获取槽位的等待秒数，0表示可立即获取；调用方需持有锁"""
+        remaining = self.blocked_until - time.monotonic()
+        if remaining > 0:
+            return remaining
+        if self.in_flight >= int(self.limit):
+            return 0.05
+        return 0.0
+
+    def acquire(self) -> None:
+        with self._cond:
+            while True:
+                wait = self._wait_time_locked()
+                if wait == 0:
+                    break
+                self._cond.wait(timeout=wait)
+            self.in_flight += 1
+            self.requests += 1
+
+    def try_acquire(self) -> bool:
+        """不等待地获取一个槽位，当前不能获取时返回False"""
+        with self._cond:
+            if self._wait_time_locked() != 0:
+                return False
+            self.in_flight += 1
+            self.requests += 1
+            return True
+
+    async def acquire_async(self) -> None:
+        while True:
+            with self._cond:
+                wait = self._wait_time_locked()
+                if wait == 0:
+                    self.in_flight += 1
+                    self.requests += 1
+                    return
+            await asyncio.sleep(wait)
+
+    def release(self, success: bool | None = True, status_code: int | None = None, retry_after: float | None = None) -> None:
+        """归还槽位并根据结果调整并发上限；success为None（如请求被取消）时不调整"""
+        with self._cond:
+            # 只有并发上限确实成为瓶颈时才增长，避免线程数较少时上限无意义地膨胀
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight = max(self.in_flight - 1, 0)
+            if success:
+                self.successes += 1
+                if saturated:
+                    step = 1 if self._slow_start else 1 / self.limit
+                    self.limit = min(self.limit + step, self.max_limit)
+            elif success is False:
+                self._slow_start = False
+                self.throttle_events += 1
+                self.limit = max(self.limit * self.decrease_factor, self.min_limit)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+                self.events.append({
+                    'time': time.time(),
+                    'status_code': status_code,
+                    'retry_after': retry_after,
+                    'limit': self.limit,
+                })
+            self._cond.notify_all()
+
+    def allow_retry(self) -> bool:
+        """从全局重试预算中扣除一次重试，预算耗尽时返回False"""
+        with self._cond:
+            if self.retries >= self.min_retries + self.retry_ratio * self.successes:
+                self.budget_exhausted += 1
+                return False
+            self.retries += 1
+            return True
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """全抖动指数退避；服务端给出 Retry-After 时不短于该值"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'requests': self.requests,
+                'successes': self.successes,
+                'retries': self.retries,
+                'throttle_events': self.throttle_events,
+                'budget_exhausted': self.budget_exhausted,
+                'blocked_for': max(self.blocked_until - time.monotonic(), 0.0),
+                'recent_events': list(self.events)[-10:],
+            }
+
+
+_limiter: AdaptiveLimiter | None = None
+_lock = threading.Lock()
+
+
+def configure_rate_limiter(initial_limit: float = 5, max_limit: float = DEFAULT_MAX_LIMIT, **kwargs) -> AdaptiveLimiter:
+    """配置进程级限流器；已存在时只调整上下限，保留当前状态和计数"""
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter(initial_limit=initial_limit, max_limit=max_limit, **kwargs)
+        else:
+            _limiter.max_limit = max(max_limit, _limiter.min_limit)
+            _limiter.limit = min(_limiter.limit, _limiter.max_limit)
+        return _limiter
+
+
+def get_rate_limiter() -> AdaptiveLimiter:
+    """返回进程级限流器，尚未配置时使用默认参数创建"""
+    if _limiter is None:
+        return configure_rate_limiter()
+    return _limiter
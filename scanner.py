@@ -0,0 +1,156 @@
+import fnmatch
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 默认忽略的版本控制、缓存和依赖目录
+DEFAULT_IGNORE = ('.git', '.hg', '.svn', '__pycache__', 'node_modules', '.venv', '.translation_*')
+# 修改时间距当前不足该值（纳秒）的目录不信任缓存，避免同一时间戳内的后续修改被漏掉
+_RACY_NS = 2_000_000_000
+
+
+def get_ignore_patterns(extra: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+    """返回忽略模式：默认模式 + .env 中的 SCAN_IGNORE（逗号分隔）+ 参数传入的模式"""
+    patterns = list(DEFAULT_IGNORE)
+    patterns += [p.strip() for p in os.getenv('SCAN_IGNORE', '').split(',') if p.strip()]
+    patterns += [p.strip() for p in (extra or []) if p.strip()]
+    return tuple(dict.fromkeys(patterns))
+
+
+def normalize_types(file_types: Optional[Iterable[str]]) -> frozenset:
+    """把文件类型列表转换为扩展名集合（去掉点前缀和空项）"""
+    return frozenset(t.strip().lstrip('.') for t in (file_types or []) if t.strip())
+
+
+class DirectoryIndex:
+    """
+    单个输入根目录的文件索引。
+
+    记录每个目录的修改时间和直接包含的文件/子目录；刷新时只对每个目录调用一次 stat，
+    修改时间未变的目录复用缓存的列表，只有新增、删除或重命名过条目的目录才重新 scandir。
+    所有目录都未变化时直接返回上次的结果，按扩展名过滤的结果也会缓存。
+    """
+
+    def __init__(self, root: str, ignore: Iterable[str] = DEFAULT_IGNORE):
+        self.root = os.path.abspath(root)
+        self.ignore = tuple(ignore)
+        # 不含路径分隔符的模式只匹配名称，其余匹配相对路径；合并为一个正则减少每个条目的匹配开销
+        self._name_re = self._compile(p for p in self.ignore if '/' not in p)
+        self._path_re = self._compile(p for p in self.ignore if '/' in p)
+        self.rescanned = 0
+        self._dirs: Dict[str, Tuple[Optional[int], List[str], List[str]]] = {}
+        self._files: List[str] = []
+        self._filtered: Dict[Tuple[frozenset, Optional[str]], List[str]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compile(patterns: Iterable[str]):
+        patterns = list(patterns)
+        return re.compile('|'.join(fnmatch.translate(p) for p in patterns)) if patterns else None
+
+    def _ignored(self, name: str, rel_path: str) -> bool:
+        return bool((self._name_re and self._name_re.match(name)) or (self._path_re and self._path_re.match(rel_path)))
+
+    def _list(self, rel_dir: str, path: str) -> Tuple[List[str], List[str]]:
+        files, subdirs = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if self._ignored(entry.name, os.path.join(rel_dir, entry.name) if rel_dir else entry.name):
+                        continue
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    # 与 os.walk 一致：不进入指向目录的符号链接
+                    if is_dir:
+                        if not entry.is_symlink():
+                            subdirs.append(entry.name)
+                    else:
+                        files.append(entry.name)
+        except OSError as e:
+            logger.warning("无法读取目录 %s: %s", path, e)
+        files.sort()
+        subdirs.sort()
+        return files, subdirs
+
+    def refresh(self) -> List[str]:
+        """按目录修改时间增量更新索引，返回根目录下所有文件的相对路径（已排序）"""
+        with self._lock:
+            changed = False
+            seen = {}
+            stack = ['']
+            now = time.time_ns()
+            while stack:
+                rel_dir = stack.pop()
+                path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    changed = True
+                    continue
+                cached = self._dirs.get(rel_dir)
+                if cached is not None and cached[0] == mtime:
+                    entry = cached
+                else:
+                    files, subdirs = self._list(rel_dir, path)
+                    entry = (mtime if now - mtime > _RACY_NS else None, files, subdirs)
+                    self.rescanned += 1
+                    changed = True
+                seen[rel_dir] = entry
+                stack.extend(os.path.join(rel_dir, name) if rel_dir else name for name in reversed(entry[2]))
+            if changed or len(seen) != len(self._dirs):
+                self._dirs = seen
+                self._files = sorted(
+                    os.path.join(rel_dir, name) if rel_dir else name
+                    for rel_dir, (_, files, _) in seen.items()
+                    for name in files
+                )
+                self._filtered = {}
+            return self._files
+
+    def files(self, file_types: Optional[Iterable[str]] = None, prefix: Optional[str] = None) -> List[str]:
+        """
+        返回匹配扩展名的文件路径；file_types 为空时返回所有文件。
+        默认返回相对路径，传入 prefix 时返回 os.path.join(prefix, 相对路径)。
+        """
+        all_files = self.refresh()
+        types = normalize_types(file_types)
+        if not types and prefix is None:
+            return all_files
+        with self._lock:
+            filtered = self._filtered.get((types, prefix))
+            if filtered is None:
+                filtered = [path for path in all_files if os.path.splitext(path)[1][1:] in types] if types else all_files
+                if prefix is not None:
+                    filtered = [os.path.join(prefix, path) for path in filtered]
+                self._filtered[(types, prefix)] = filtered
+            return filtered
+
+
+_indexes: Dict[Tuple[str, Tuple[str, ...]], DirectoryIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(root: str, ignore: Optional[Iterable[str]] = None) -> DirectoryIndex:
+    """返回根目录的进程级共享索引，同一进程中的重复扫描复用缓存"""
+    patterns = get_ignore_patterns(ignore)
+    key = (os.path.abspath(root), patterns)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = DirectoryIndex(root, patterns)
+        return index
+
+
+def scan_files(root: str, file_types: Optional[Iterable[str]] = None, ignore: Optional[Iterable[str]] = None, relative: bool = False) -> List[str]:
+    """
+    递归扫描目录，返回匹配扩展名的文件路径（已排序）。
+    默认返回以 root 开头的路径（与 os.path.join(root, ...) 形式一致），relative=True 时返回相对路径。
+    """
+    return list(get_index(root, ignore).files(file_types, None if relative else root))
@@ -0,0 +1,135 @@
+import os
+import re
+from typing import Iterable, Iterator, List
+
+DEFAULT_CHUNK_TOKENS = 2000
+
+_CJK_RE = re.compile('[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+# 在空行之后或Markdown标题行之前切分，切分点不消耗任何字符
+_BLOCK_RE = re.compile(r'(?<=\n\n)|(?<=\n)(?=#{1,6}\s)')
+_HEADING_RE = re.compile(r'#{1,6}\s')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：CJK字符按1个token计，其余字符约4个算1个token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def get_chunk_tokens(chunk_tokens: int | None = None) -> int:
+    """返回分块token预算，优先使用参数，其次是 .env 中的 CHUNK_TOKENS"""
+    if chunk_tokens:
+        return chunk_tokens
+    return int(os.getenv('CHUNK_TOKENS', DEFAULT_CHUNK_TOKENS))
+
+
+def _split_oversized(block: str, max_tokens: int) -> List[str]:
+    """将超出预算的块按行切分，单行仍超出时按字符硬切分"""
+    pieces = []
+    for line in block.splitlines(keepends=True):
+        if estimate_tokens(line) <= max_tokens:
+            pieces.append(line)
+            continue
+        # 含CJK的长行每个字符约1个token，按token预算换算切分步长
+        step = max(max_tokens, 1) if _CJK_RE.search(line) else max(max_tokens, 1) * 4
+        pieces.extend(line[i:i + step] for i in range(0, len(line), step))
+    return pieces
+
+
+def split_text(text: str, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> List[str]:
+    """
+    按段落/标题边界把文本切分为不超过max_tokens的块。
+
+    切分是无损的：''.join(split_text(text)) == text，便于按顺序重新组装。
+    """
+    if not text:
+        return []
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    units = []
+    for block in _BLOCK_RE.split(text):
+        if not block:
+            continue
+        if estimate_tokens(block) > max_tokens:
+            units.extend(_split_oversized(block, max_tokens))
+        else:
+            units.append(block)
+
+    chunks = []
+    current = ''
+    current_tokens = 0
+    for unit in units:
+        unit_tokens = estimate_tokens(unit)
+        # 超出预算时换块；已用过半预算且遇到新标题时也提前换块，让章节尽量完整
+        starts_section = _HEADING_RE.match(unit) is not None and current_tokens >= max_tokens // 2
+        if current and (current_tokens + unit_tokens > max_tokens or starts_section):
+            chunks.append(current)
+            current = ''
+            current_tokens = 0
+        current += unit
+        current_tokens += unit_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_segments(text: str, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> List[str]:
+    """
+    按段落/标题边界把文本切分为段落级片段，不做合并，便于跨文件识别重复的段落（许可证头、页脚等）。
+
+    与 split_text 一样是无损的，超出预算的段落按行继续切分。
+    """
+    segments = []
+    for block in _BLOCK_RE.split(text):
+        if not block:
+            continue
+        if estimate_tokens(block) > max_tokens:
+            segments.extend(_split_oversized(block, max_tokens))
+        else:
+            segments.append(block)
+    return segments
+
+
+def _iter_blocks(lines: Iterable[str], max_tokens: int) -> Iterator[str]:
+    """按与 _BLOCK_RE 相同的边界（空行之后、标题行之前）把行流组合成块；没有空行的长文本在超出预算时按行切出"""
+    block = []
+    block_tokens = 0
+    for line in lines:
+        if block and (_HEADING_RE.match(line) or block_tokens > max_tokens):
+            yield ''.join(block)
+            block = []
+            block_tokens = 0
+        block.append(line)
+        block_tokens += estimate_tokens(line)
+        if line == '\n':
+            yield ''.join(block)
+            block = []
+            block_tokens = 0
+    if block:
+        yield ''.join(block)
+
+
+def iter_split(lines: Iterable[str], max_tokens: int = DEFAULT_CHUNK_TOKENS, merge: bool = True) -> Iterator[str]:
+    """
+    split_text（merge=False 时为 split_segments）的流式版本：从行迭代器（如文件对象）增量读取并产出块，
+    内存占用与块大小而非文本总长度成正比。切分同样是无损的，块边界与一次性切分可能略有不同。
+    """
+    current = ''
+    current_tokens = 0
+    for block in _iter_blocks(lines, max_tokens):
+        units = _split_oversized(block, max_tokens) if estimate_tokens(block) > max_tokens else [block]
+        for unit in units:
+            if not merge:
+                yield unit
+                continue
+            unit_tokens = estimate_tokens(unit)
+            starts_section = _HEADING_RE.match(unit) is not None and current_tokens >= max_tokens // 2
+            if current and (current_tokens + unit_tokens > max_tokens or starts_section):
+                yield current
+                current = ''
+                current_tokens = 0
+            current += unit
+            current_tokens += unit_tokens
+    if current:
+        yield current
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import httpx
+
+import async_translator
+from async_translator import translate_parallel_async, translate_text_async
+
+
+def make_client(state):
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        text = prompt.split(": ", 1)[1]
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"[zh]{text}"}}]})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_translate_text_async():
+    state = {"in_flight": 0, "peak": 0}
+
+    async def run():
+        async with make_client(state) as client:
+            return await translate_text_async("Hello", "k", "zh", "m", client=client)
+
+    assert asyncio.run(run()) == "[zh]Hello"
+
+
+def test_translate_parallel_async_bounds_concurrency(monkeypatch, tmp_path):
+    state = {"in_flight": 0, "peak": 0}
+    paths = []
+    for i in range(20):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text(f"text {i}\n", encoding="utf-8")
+        paths.append(str(path))
+
+    async def run():
+        client = make_client(state)
+        monkeypatch.setattr(async_translator, "get_async_client", lambda concurrency=None: client)
+        try:
+            return await translate_parallel_async(paths, "k", "zh", concurrency=4)
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(run())
+
+    assert results == {path: f"[zh]text {i}\n" for i, path in enumerate(paths)}
+    assert 1 < state["peak"] <= 4
+
+
+def test_unexpected_chunk_error_keeps_source(monkeypatch, tmp_path):
+    path = tmp_path / "a.md"
+    path.write_text("# Title\n\nGood paragraph.\n\nBad paragraph.\n", encoding="utf-8")
+
+    async def fake_translate(text, api_key, lang, model, mock_mode=False, client=None):
+        if text.startswith("Bad"):
+            raise ValueError("unexpected response shape")
+        return f"[zh]{text}"
+
+    async def fake_batch(texts, api_key, lang, model, mock_mode=False, client=None):
+        if any(text.startswith("Bad") for text in texts):
+            raise ValueError("unexpected response shape")
+        return [f"[zh]{text}" for text in texts]
+
+    monkeypatch.setattr(async_translator, "translate_text_async", fake_translate)
+    monkeypatch.setattr(async_translator, "translate_batch_async", fake_batch)
+    for pack in (False, True):
+        results = asyncio.run(translate_parallel_async([str(path)], "k", "zh", chunk_tokens=5, pack=pack))
+        translated = results[str(path)]
+        assert "Bad paragraph." in translated and "[zh]Bad" not in translated
+        if not pack:
+            assert "[zh]Good paragraph." in translated
+
+
+def test_sync_and_async_engines_report_progress_by_bytes(tmp_path):
+    from parallel_translator import translate_parallel
+
+    path = tmp_path / "a.md"
+    path.write_text("# Title\n\nFirst paragraph.\n\nSecond paragraph.\n", encoding="utf-8")
+    sync_progress, async_progress = [None], [None]
+
+    sync_results = translate_parallel([str(path)], "k", "zh", 2, mock_mode=True, progress_queue=sync_progress, chunk_tokens=5)
+    async_results = asyncio.run(translate_parallel_async([str(path)], "k", "zh", 2, mock_mode=True, progress_queue=async_progress, chunk_tokens=5))
+
+    assert sync_results == async_results
+    for progress in (sync_progress[1:], async_progress[1:]):
+        values = [item["progress"] for item in progress]
+        # 按已完成的字节数计算，文件完成前进度已经增加
+        assert len(values) == 2 and 0 < values[0] < values[1] == 100.0
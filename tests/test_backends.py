@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from collections import Counter
+
+import pytest
+
+import backends
+import packing
+import rate_limiter
+import translator
+from backends import Backend, BackendPool, parse_backends
+from rate_limiter import AdaptiveLimiter
+from translator import AuthenticationError
+
+
+class DummyResponse:
+    def __init__(self, content: str = "", status_code: int = 200):
+        self.status_code = status_code
+        self.headers = {}
+        self._content = content
+
+    def json(self):
+        return {"choices": [{"message": {"content": self._content}}]}
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def fast_limiter(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_limiter", AdaptiveLimiter(backoff_base=0.001))
+
+
+def use_pool(monkeypatch, pool: BackendPool) -> BackendPool:
+    monkeypatch.setattr(backends, "_pool", pool)
+    return pool
+
+
+def test_parse_backends_expands_keys():
+    env = {
+        "BACKEND_OR_KEYS": "k1, k2",
+        "BACKEND_OR_WEIGHT": "3",
+        "BACKEND_OR_CONCURRENCY": "4",
+        "BACKEND_LOCAL_URL": "http://localhost:8000/v1/chat/completions",
+        "BACKEND_LOCAL_MODEL": "qwen",
+    }
+    parsed = parse_backends("or, local, mock, or", env)
+
+    assert [b.name for b in parsed] == ["or#1", "or#2", "local", "mock"]
+    assert [b.api_key for b in parsed] == ["k1", "k2", "", None]
+    assert parsed[0].weight == 3 and parsed[0].get_limiter().max_limit == 4
+    assert parsed[0].get_limiter() is not parsed[1].get_limiter()
+    assert "Authorization" not in parsed[2].headers("caller")
+    assert parsed[2].payload("hi", "gpt")["model"] == "qwen"
+    assert parsed[3].mock
+    with pytest.raises(ValueError):
+        parse_backends("x", {"BACKEND_X_TYPE": "grpc"})
+
+
+def test_weighted_round_robin_and_ejection():
+    heavy, light = Backend("heavy", weight=3, concurrency=100), Backend("light", weight=1, concurrency=100)
+    pool = BackendPool([heavy, light], eject_after=2, eject_seconds=60)
+    picks = []
+    for _ in range(8):
+        backend = pool.acquire()
+        picks.append(backend.name)
+        pool.release(backend)
+    assert Counter(picks) == {"heavy": 6, "light": 2}
+
+    def finish(backend, success):
+        backend.get_limiter().try_acquire()
+        pool.release(backend, success=success, status_code=None if success else 503)
+
+    finish(heavy, False)
+    finish(heavy, True)
+    finish(heavy, False)
+    # 成功会清零连续失败计数
+    assert heavy.ejections == 0
+    finish(heavy, False)
+    assert heavy.ejections == 1
+    assert {pool.acquire().name for _ in range(3)} == {"light"}
+
+    assert pool.eject(light, "test") is False
+    # 所有后端都被剔除时仍照常分发
+    assert pool.acquire() in (heavy, light)
+
+
+def test_request_completion_spreads_over_backends_and_ejects_bad_keys(monkeypatch):
+    bad = Backend("bad", api_key="bad", concurrency=10)
+    use_pool(monkeypatch, BackendPool([Backend("good", api_key="good", concurrency=10), bad, Backend("mock", kind="mock")]))
+    keys = []
+
+    def fake_post(self, url, json=None, headers=None, **kwargs):
+        keys.append(headers["Authorization"])
+        if headers["Authorization"] == "Bearer bad":
+            return DummyResponse(status_code=401)
+        return DummyResponse("你好")
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    results = [translator.request_completion("Translate the following English text to Chinese: hi", "", "m") for _ in range(6)]
+
+    assert keys.count("Bearer bad") == 1
+    # 无效密钥记为失败，不会先按成功放大该后端的并发上限
+    assert (bad.successes, bad.failures, bad.ejections) == (0, 1, 1)
+    assert bad.get_limiter().limit < bad.get_limiter().max_limit
+    assert sorted(results) == ["hi (mock translated)"] * 3 + ["你好"] * 3
+
+
+def test_single_backend_auth_error_is_not_retried(monkeypatch):
+    use_pool(monkeypatch, BackendPool([Backend("only")]))
+    calls = []
+
+    def fake_post(self, url, json=None, headers=None, **kwargs):
+        calls.append(headers["Authorization"])
+        return DummyResponse(status_code=401)
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    with pytest.raises(AuthenticationError):
+        translator.request_completion("hi", "caller", "m")
+    assert calls == ["Bearer caller"]
+
+
+def test_mock_backend_keeps_packed_markers_and_ignores_references():
+    from memory import MemoryMatch
+
+    reference = MemoryMatch("old text", "旧译文", 0.8, False)
+    assert translator.mock_complete(translator.build_prompt("a: b", "zh", reference)) == "a: b (mock translated)"
+    prompt = "Translate...\n\n<<<SEG 0>>>\nfoo\n<<<END 0>>>\n\n<<<SEG 1>>>\nbar\n<<<END 1>>>"
+    assert translator.mock_complete(prompt) == "<<<SEG 0>>>\nfoo (mock translated)\n<<<END 0>>>\n\n<<<SEG 1>>>\nbar (mock translated)\n<<<END 1>>>"
+
+
+def test_mock_mode_goes_through_the_mock_backend():
+    backend = backends.get_backend_pool(mock=True).backends[0]
+    before = backend.requests
+    assert translator.translate_text("hi", "", "zh", mock_mode=True) == "hi (mock translated)"
+    assert packing.translate_batch(["a", "b c"], "", "zh", "m", mock_mode=True) == ["a (mock translated)", "b c (mock translated)"]
+    assert backend.mock and backend.requests == before + 2
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import cache
+import translator
+from cache import TranslationCache, make_cache_key
+
+
+class DummyResponse:
+    def __init__(self, payload: Dict[str, Any], status_code: int = 200):
+        self._payload = payload
+        self.status_code = status_code
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+def test_cache_key_normalizes_text():
+    key = make_cache_key("Hello\r\nworld  ", "zh", "m", "v1")
+    assert key == make_cache_key("Hello\nworld", "zh", "m", "v1")
+    assert key != make_cache_key("Hello\nworld", "ja", "m", "v1")
+    assert key != make_cache_key("Hello\nworld", "zh", "m", "v2")
+
+
+def test_cache_hit_miss_and_eviction(tmp_path):
+    store = TranslationCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    assert store.get("a") is None
+    store.set("a", "A")
+    store.set("b", "B")
+    assert store.get("a") == "A"
+    store.set("c", "C")
+    assert len(store) == 2
+    assert store.get("b") is None
+    assert store.stats()["hits"] == 1
+    assert store.stats()["evictions"] == 1
+
+
+def test_cache_batches_access_time_updates(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    store = TranslationCache(path, max_entries=2)
+    store.set("a", "A")
+    created = store._conn.execute("SELECT accessed FROM translations WHERE key = 'a'").fetchone()[0]
+    reader = TranslationCache(path)
+    assert store.get("a") == "A"
+    # 命中不立即写入数据库
+    assert reader._conn.execute("SELECT accessed FROM translations WHERE key = 'a'").fetchone()[0] == created
+    store.close()
+    assert reader._conn.execute("SELECT accessed FROM translations WHERE key = 'a'").fetchone()[0] > created
+
+
+def test_cache_max_age(tmp_path):
+    store = TranslationCache(str(tmp_path / "cache.sqlite3"), max_age=0)
+    store.set("a", "A")
+    assert store.get("a") is None
+
+
+def test_translate_text_uses_cache(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_post(self, url, json=None, headers=None, **kwargs):
+        calls.append(json)
+        return DummyResponse({"choices": [{"message": {"content": "你好"}}]})
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+    cache.configure_cache(True, str(tmp_path / "cache.sqlite3"))
+    try:
+        assert translator.translate_text("Hello", "key", "zh", "m") == "你好"
+        assert translator.translate_text("Hello ", "key", "zh", "m") == "你好"
+        assert len(calls) == 1
+        assert cache.get_cache().stats()["hits"] == 1
+    finally:
+        cache.configure_cache(False)
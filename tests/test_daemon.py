@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+import utils
+from daemon import TranslationDaemon, send_request
+
+
+@pytest.fixture
+def running_daemon(monkeypatch):
+    if not hasattr(socket, "AF_UNIX"):
+        pytest.skip("unix socket only")
+    monkeypatch.setattr(utils, "load_env", lambda: ("k", 2, "m", True))
+    # unix socket 路径长度有限，不使用 pytest 的 tmp_path
+    socket_dir = tempfile.mkdtemp()
+    path = os.path.join(socket_dir, "d.sock")
+    daemon = TranslationDaemon(path)
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    deadline = time.time() + 5
+    while send_request({"op": "ping"}, path) is None:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    yield path
+    send_request({"op": "stop"}, path)
+    thread.join(5)
+    os.rmdir(socket_dir)
+
+
+def test_client_returns_none_without_daemon(tmp_path):
+    assert send_request({"op": "ping"}, str(tmp_path / "missing.sock")) is None
+
+
+def test_daemon_translates_text_and_files(running_daemon, tmp_path):
+    path = running_daemon
+    assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+
+    response = send_request({"op": "translate", "text": "hello", "target_lang": "zh"}, path)
+    assert response == {"ok": True, "text": "hello (mock translated)", "error": None}
+
+    source = tmp_path / "a.txt"
+    source.write_text("hello world\n", encoding="utf-8")
+    output = tmp_path / "out" / "a.txt"
+    response = send_request({"op": "translate", "path": str(source), "output": str(output)}, path)
+    assert response["ok"] and response["error"] is None
+    assert output.read_text(encoding="utf-8") == "hello world (mock translated)\n"
+
+    response = send_request({"op": "translate", "path": str(tmp_path / "missing.txt")}, path)
+    assert response["ok"] is False
+    assert send_request({"op": "ping"}, path)["requests"] == 3
+
+
+def test_daemon_applies_file_type_filter(running_daemon, tmp_path, monkeypatch):
+    monkeypatch.setenv("FILE_TYPES", "md")
+    source = tmp_path / "a.txt"
+    source.write_text("hello\n", encoding="utf-8")
+    output = tmp_path / "out" / "a.txt"
+
+    # 未指定 file_types 时按守护进程的 FILE_TYPES 过滤
+    assert send_request({"op": "translate", "path": str(source), "output": str(output)}, running_daemon) == {"ok": True, "skipped": True}
+    assert not output.exists()
+    response = send_request({"op": "translate", "path": str(source), "output": str(output), "file_types": ["txt"]}, running_daemon)
+    assert response["ok"] and output.read_text(encoding="utf-8") == "hello (mock translated)\n"
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import re
+
+import pytest
+
+import packing
+from async_translator import run_translate_parallel
+from dedup import SegmentDeduplicator
+from parallel_translator import translate_parallel
+from segmenter import split_segments
+
+LICENSE = "Licensed under the Apache License, Version 2.0."
+
+
+def make_corpus(tmp_path, count=4):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"f{i}.md"
+        path.write_text(f"# Doc {i}\n\nBody {i}.\n\n{LICENSE}\n", encoding="utf-8")
+        paths.append(str(path))
+    return paths
+
+
+def expected(i):
+    return f"[zh]# Doc {i}\n\n[zh]Body {i}.\n\n[zh]{LICENSE}\n"
+
+
+def test_split_segments_is_lossless_and_unmerged():
+    text = "# Title\n\nFirst.\n\nSecond.\n"
+    segments = split_segments(text)
+    assert "".join(segments) == text
+    assert len(segments) == 3
+
+
+def test_deduplicator_coalesces_in_flight_segments():
+    dedup = SegmentDeduplicator("zh", "m")
+    key, known, is_new = dedup.claim("Hello", ("a", 0, "", "\n"))
+    assert known is None and is_new
+    assert dedup.claim(" Hello ", ("b", 1, "", "")) == (key, None, False)
+    assert dedup.resolve(key, "你好") == [("a", 0, "", "\n"), ("b", 1, "", "")]
+    assert dedup.claim("Hello", ("c", 0, "", "")) == (key, "你好", False)
+    stats = dedup.stats()
+    assert (stats["segments"], stats["unique"], stats["duplicates"]) == (3, 1, 2)
+    assert stats["ratio"] == pytest.approx(2 / 3)
+
+
+def test_translate_parallel_dedup_translates_shared_segments_once(monkeypatch, tmp_path):
+    prompts = []
+
+    def echo_completion(prompt, api_key, model, max_retries=5):
+        prompts.append(prompt)
+        segments = re.findall(r"<<<SEG (\d+)>>>\n(.*?)\n<<<END \1>>>", prompt, re.S)
+        return "\n".join(f"<<<SEG {i}>>>\n[zh]{text}\n<<<END {i}>>>" for i, text in segments)
+
+    monkeypatch.setattr(packing, "chat_completion", echo_completion)
+    monkeypatch.setattr(packing, "translate_text", lambda text, *args, **kwargs: f"[zh]{text}")
+    paths = make_corpus(tmp_path)
+
+    results = translate_parallel(paths, "k", "zh", 2, dedup=True)
+
+    assert results == {path: expected(i) for i, path in enumerate(paths)}
+    assert sum(prompt.count(LICENSE) for prompt in prompts) == 1
+
+
+def test_async_dedup_matches_sync(tmp_path):
+    paths = make_corpus(tmp_path)
+    results = run_translate_parallel(paths, "k", "zh", 4, mock_mode=True, dedup=True)
+    assert set(results) == set(paths)
+    assert all(results[path].count(LICENSE) == 1 for path in paths)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import packing
+from extraction import protect, restore, split_document
+from parallel_translator import translate_parallel
+
+MARKDOWN = """---
+title: Guide
+---
+
+# Install
+
+Run `pip install tool` and open https://example.com/docs for details.
+
+```python
+print("hello")
+```
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+See the [manual](docs/manual.md).
+"""
+
+RST = """Title
+=====
+
+Use ``make`` to build::
+
+    make all
+    make test
+
+.. code-block:: python
+
+    import os
+
+.. note::
+
+   Read the `docs <https://example.com>`_ first.
+"""
+
+HTML = """<html><head><script>var a = 1;</script></head>
+<body><p>Hello <b>world</b> &amp; friends.</p><pre>code here</pre></body></html>
+"""
+
+
+def prose(pieces):
+    return "".join(chunk for chunk, translatable in pieces if translatable)
+
+
+def test_markdown_skips_code_front_matter_and_number_tables():
+    pieces = split_document(MARKDOWN, "guide.md", 2000)
+    assert "".join(chunk for chunk, _ in pieces) == MARKDOWN
+    text = prose(pieces)
+    assert "# Install" in text and "See the [manual]" in text
+    assert "print(" not in text and "title:" not in text and "| 1 | 2 |" not in text
+
+
+def test_rst_skips_literal_blocks_and_code_directives():
+    pieces = split_document(RST, "guide.rst", 2000)
+    assert "".join(chunk for chunk, _ in pieces) == RST
+    text = prose(pieces)
+    assert "Use ``make`` to build::" in text and "Read the" in text
+    assert "make all" not in text and "import os" not in text
+
+
+def test_html_translates_text_nodes_only():
+    pieces = split_document(HTML, "page.html", 2000)
+    assert "".join(chunk for chunk, _ in pieces) == HTML
+    assert prose(pieces) == "Hello <b>world</b> &amp; friends."
+
+
+def test_protect_and_restore_round_trip():
+    masked, protected = protect("Run `pip install tool` via https://example.com/x.", "a.md")
+    assert masked == "Run ⟦0⟧ via ⟦1⟧."
+    assert restore("运行 ⟦0⟧，参见 ⟦ 1 ⟧。", protected) == "运行 `pip install tool`，参见 https://example.com/x。"
+
+
+def test_translate_parallel_sends_only_prose(monkeypatch, tmp_path):
+    sent = []
+
+    def fake_translate(text, *args, **kwargs):
+        sent.append(text)
+        return f"[zh]{text}"
+
+    monkeypatch.setattr("parallel_translator.translate_text", fake_translate)
+    monkeypatch.setattr(packing, "translate_text", fake_translate)
+    path = tmp_path / "guide.md"
+    path.write_text(MARKDOWN, encoding="utf-8")
+
+    result = translate_parallel([str(path)], "k", "zh", 2)[str(path)]
+
+    assert all("print(" not in text and "`" not in text for text in sent)
+    assert '```python\nprint("hello")\n```' in result
+    assert "[zh]# Install" in result
+    assert "`pip install tool`" in result and "(docs/manual.md)" in result
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import async_translator
+import hedging
+import translator
+from hedging import HedgePolicy, parse_model_chain, register_model_chain
+from metrics import get_metrics
+from translator import AuthenticationError, TranslationFailedError
+
+
+@pytest.fixture(autouse=True)
+def isolated_policy(monkeypatch):
+    monkeypatch.setattr(hedging, "_fallbacks", {})
+    monkeypatch.setattr(hedging, "_policy", HedgePolicy())
+
+
+def trained_policy(**kwargs) -> HedgePolicy:
+    policy = HedgePolicy(enabled=True, min_samples=3, min_delay=0.05, **kwargs)
+    for _ in range(3):
+        policy.observe("slow", 0.01)
+    return policy
+
+
+def test_model_chain_falls_back_but_not_on_auth_errors(monkeypatch):
+    assert parse_model_chain(" a, b,,a ") == ["a", "b"]
+    assert register_model_chain("a,b") == "a"
+    calls = []
+
+    def fake_request(prompt, api_key, model, max_retries=5, cancelled=None):
+        calls.append(model)
+        if model == "a":
+            raise TranslationFailedError("down")
+        return f"{model}:{prompt}"
+
+    monkeypatch.setattr(translator, "request_completion", fake_request)
+    before = get_metrics().snapshot()["fallbacks"]
+    assert translator.chat_completion("hi", "k", "a") == "b:hi"
+    assert calls == ["a", "b"]
+    assert get_metrics().snapshot()["fallbacks"] == before + 1
+
+    def auth_failure(prompt, api_key, model, max_retries=5, cancelled=None):
+        calls.append(model)
+        raise AuthenticationError("Invalid API key")
+
+    calls.clear()
+    monkeypatch.setattr(translator, "request_completion", auth_failure)
+    with pytest.raises(AuthenticationError):
+        translator.chat_completion("hi", "k", "a")
+    assert calls == ["a"]
+
+
+def test_slow_request_is_hedged_within_budget():
+    policy = trained_policy(budget=0.0)
+    cancelled_seen = []
+
+    def call(model, cancelled):
+        if model == "slow":
+            cancelled.wait(0.5)
+            cancelled_seen.append(cancelled.is_set())
+            return "slow"
+        return "fast"
+
+    assert policy.delay("slow") == 0.05
+    assert policy.run(call, "slow", "fast") == "fast"
+    assert policy.stats()["hedge_wins"] == 1
+
+    # 预算用完后不再对冲，等待原请求返回
+    assert policy.run(call, "slow", "fast") == "slow"
+    assert policy.stats()["denied"] == 1
+    assert cancelled_seen[0] is True
+
+
+def test_policy_without_samples_does_not_hedge():
+    policy = HedgePolicy(enabled=True, min_samples=3)
+    threads = []
+
+    def call(model, cancelled):
+        threads.append(threading.current_thread())
+        return model
+
+    assert policy.delay("m") is None
+    assert policy.run(call, "m", "other") == "m"
+    assert threads == [threading.current_thread()]
+
+
+def test_async_hedge_cancels_losing_request(monkeypatch):
+    policy = trained_policy()
+    monkeypatch.setattr(hedging, "_policy", policy)
+    register_model_chain("slow,fast")
+    cancelled = []
+
+    async def fake_request(prompt, api_key, model, max_retries=5, client=None):
+        if model == "slow":
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+        return model
+
+    monkeypatch.setattr(async_translator, "request_completion_async", fake_request)
+    started = time.perf_counter()
+    result = asyncio.run(async_translator.chat_completion_async("hi", "k", "slow", client=object()))
+    assert result == "fast"
+    assert cancelled == ["slow"]
+    assert time.perf_counter() - started < 0.5
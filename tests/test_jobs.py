@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from jobs import Job, JobRegistry, coalesce_events
+
+
+def test_registry_keeps_bounded_finished_jobs():
+    registry = JobRegistry(max_finished=2)
+    running = registry.create()
+    finished = [registry.create() for _ in range(4)]
+    for job in finished:
+        registry.finish(job, "completed")
+
+    assert len(registry) == 3
+    assert registry.get(running.id) is running
+    assert [job.id for job in registry.list()] == [running.id, finished[2].id, finished[3].id]
+    assert registry.latest() is finished[3]
+
+
+def test_job_events_are_per_job_and_replayable():
+    registry = JobRegistry()
+    first, second = registry.create(), registry.create()
+    first.append({"progress": 0, "message": "a"})
+    first.append({"type": "partial", "file": "x", "chunk": 0, "delta": "你"})
+    second.append({"progress": 50, "message": "b"})
+
+    assert [event["seq"] for event in first.events_after(0)] == [1, 2]
+    assert first.latest["message"] == "a"
+    assert second.latest["progress"] == 50
+
+    async def wait_for_next():
+        waiter = asyncio.ensure_future(first.wait_events(2))
+        await asyncio.sleep(0)
+        first.append({"progress": 100, "message": "done"})
+        return await waiter
+
+    assert [event["message"] for event in asyncio.run(wait_for_next())] == ["done"]
+
+
+def test_cancel_stops_translation(monkeypatch, tmp_path):
+    import web.app as web_app
+
+    registry = JobRegistry()
+    monkeypatch.setattr(web_app, "jobs", registry)
+    started = {}
+
+    async def slow_iter(paths, *args, **kwargs):
+        started["yes"] = True
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            started["aborted"] = True
+            raise
+        yield paths[0], "never"
+
+    monkeypatch.setattr(web_app, "iter_translate_async", slow_iter)
+
+    async def run():
+        job = registry.create()
+        job.task = asyncio.ensure_future(web_app.run_translation(job, ["test/a.txt"], "k", "zh", "m", True, "test", str(tmp_path)))
+        await asyncio.sleep(0.05)
+        assert job.cancel()
+        try:
+            await job.task
+        except asyncio.CancelledError:
+            pass
+        return job
+
+    job = asyncio.run(run())
+
+    assert started == {"yes": True, "aborted": True}
+    assert job.status == "cancelled"
+    assert job.latest["status"] == "cancelled"
+    assert not job.cancel()
+
+
+def test_progress_events_are_coalesced():
+    registry = JobRegistry()
+    job = registry.create()
+    job.append({"progress": 0, "total_files": 2, "message": "start"})
+    for i in range(1, 50):
+        job.append({"progress": i, "message": f"p{i}"})
+    job.append({"type": "partial", "file": "a", "chunk": 0, "delta": "你"})
+    job.append({"type": "partial", "file": "a", "chunk": 0, "delta": "好"})
+    job.append({"progress": 80, "message": "p80"})
+
+    # 连续的进度事件在保存时合并为一个，保留最早的 total_files
+    assert len(job.events) == 4
+    assert job.events[0] == {"progress": 49, "total_files": 2, "message": "p49", "job_id": job.id, "seq": 50}
+
+    events = coalesce_events(job.events_after(0))
+    assert [event.get("type") for event in events] == ["partial", None]
+    assert events[0]["delta"] == "你好" and events[0]["seq"] == 52
+    assert events[1]["progress"] == 80 and events[1]["total_files"] == 2 and events[1]["seq"] == 53
+
+
+def test_subscribe_replays_snapshot_and_resumes_from_seq():
+    registry = JobRegistry()
+    job = registry.create({"total_files": 1})
+    job.append({"progress": 50, "message": "half"})
+
+    async def collect(since=None):
+        return [event async for event in job.subscribe(since, interval=0) if event is not None]
+
+    async def run():
+        late = asyncio.ensure_future(collect())
+        resumed = asyncio.ensure_future(collect(since=1))
+        await asyncio.sleep(0.01)
+        job.append({"progress": 100, "status": "completed", "message": "done"})
+        registry.finish(job, "completed")
+        return await late, await resumed
+
+    late, resumed = asyncio.run(run())
+
+    assert late[0]["type"] == "snapshot" and late[0]["progress"] == 50 and late[0]["total_files"] == 1
+    assert [event["seq"] for event in late[1:]] == [1, 2]
+    assert [event["seq"] for event in resumed] == [2]
+
+
+def test_sse_endpoint_streams_job_events(monkeypatch):
+    from fastapi.testclient import TestClient
+    import web.app as web_app
+
+    registry = JobRegistry()
+    monkeypatch.setattr(web_app, "jobs", registry)
+    job = registry.create()
+    job.append({"progress": 0, "total_files": 1, "message": "start"})
+    job.append({"progress": 100, "status": "completed", "message": "done"})
+    registry.finish(job, "completed")
+
+    client = TestClient(web_app.app)
+    response = client.get(f"/jobs/{job.id}/events", headers={"Last-Event-ID": "1"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == f"id: 2\ndata: {json.dumps(job.events[-1], ensure_ascii=False)}\n\n"
+    assert client.get("/jobs/missing/events").status_code == 404
+
+
+def test_archive_endpoint_streams_job_outputs(monkeypatch, tmp_path):
+    import io
+    import tarfile
+    import zipfile
+    from fastapi.testclient import TestClient
+    import web.app as web_app
+
+    output_dir = tmp_path / "output"
+    (output_dir / "demo").mkdir(parents=True)
+    (output_dir / "demo" / "a_translated.txt").write_text("你好\n", encoding="utf-8")
+    (output_dir / "b_translated.md").write_bytes(b"x" * 200000)
+    registry = JobRegistry()
+    monkeypatch.setattr(web_app, "jobs", registry)
+    job = registry.create({"output_dir": str(output_dir)})
+    for name in ("demo/a_translated.txt", "b_translated.md", "missing.txt"):
+        job.add_file(str(output_dir / name))
+    registry.finish(job, "completed")
+
+    client = TestClient(web_app.app)
+    response = client.get(f"/jobs/{job.id}/archive")
+    assert response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["demo/a_translated.txt", "b_translated.md"]
+        assert archive.read("demo/a_translated.txt").decode("utf-8") == "你好\n"
+        assert archive.read("b_translated.md") == b"x" * 200000
+    response = client.get(f"/jobs/{job.id}/archive", params={"format": "tar"})
+    assert len(response.content) % tarfile.RECORDSIZE == 0
+    with tarfile.open(fileobj=io.BytesIO(response.content)) as archive:
+        assert archive.getnames() == ["demo/a_translated.txt", "b_translated.md"]
+        assert archive.extractfile("b_translated.md").read() == b"x" * 200000
+    assert client.get(f"/jobs/{job.id}/archive", params={"format": "rar"}).status_code == 400
+
+
+def test_wait_files_wakes_on_new_output():
+    async def scenario():
+        job = Job("j")
+        waiter = asyncio.create_task(job.wait_files(0, timeout=5))
+        await asyncio.sleep(0)
+        job.add_file("output/a.txt")
+        return await waiter
+
+    assert asyncio.run(scenario()) == ["output/a.txt"]
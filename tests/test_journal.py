@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import pytest
+
+import parallel_translator
+from journal import Journal
+from parallel_translator import iter_translate
+from translator import TranslationFailedError
+from utils import atomic_write
+
+
+def test_journal_round_trip(tmp_path):
+    output = tmp_path / "out.txt"
+    output.write_text("done", encoding="utf-8")
+    journal = Journal.open(str(tmp_path))
+    journal.record_chunk("a.txt", "Hello", "你好")
+    journal.record_file("b.txt", str(output))
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"type": "chunk", "pa')
+
+    resumed = Journal.open(str(tmp_path), resume=True)
+    assert resumed.lookup("a.txt", "Hello") == "你好"
+    assert resumed.is_done("b.txt")
+    assert not resumed.is_done("a.txt")
+    resumed.close(remove=True)
+    assert not (tmp_path / ".translation_journal.jsonl").exists()
+
+
+def test_journal_ignores_other_settings_on_resume(tmp_path):
+    journal = Journal.open(str(tmp_path), target_lang="zh", model="m")
+    journal.record_chunk("a.txt", "Hello", "你好")
+    journal.close()
+
+    resumed = Journal.open(str(tmp_path), resume=True, target_lang="zh", model="m")
+    assert resumed.lookup("a.txt", "Hello") == "你好"
+    resumed.close()
+
+    # 换了模型后旧日志被丢弃，新日志记录新的设置
+    other = Journal.open(str(tmp_path), resume=True, target_lang="zh", model="other")
+    assert other.lookup("a.txt", "Hello") is None
+    other.record_chunk("a.txt", "Hello", "您好")
+    other.close()
+    again = Journal.open(str(tmp_path), resume=True, target_lang="zh", model="other")
+    assert again.lookup("a.txt", "Hello") == "您好"
+    again.close()
+
+
+def test_iter_translate_resumes_from_journal(monkeypatch, tmp_path):
+    path = tmp_path / "big.md"
+    path.write_text("\n\n".join(f"para {i}" for i in range(6)), encoding="utf-8")
+    calls = []
+
+    def flaky_translate(text, *args, **kwargs):
+        calls.append(text)
+        if text == "para 4" and calls.count(text) == 1:
+            raise TranslationFailedError("boom")
+        return text.upper()
+
+    monkeypatch.setattr(parallel_translator, "translate_text", flaky_translate)
+    journal = Journal.open(str(tmp_path / "out"))
+    with pytest.raises(TranslationFailedError):
+        list(iter_translate([str(path)], "k", "zh", 1, chunk_tokens=3, journal=journal))
+    journal.close()
+    first_run = len(calls)
+
+    journal = Journal.open(str(tmp_path / "out"), resume=True)
+    results = dict(iter_translate([str(path)], "k", "zh", 1, chunk_tokens=3, journal=journal))
+
+    assert results[str(path)] == "\n\n".join(f"PARA {i}" for i in range(6))
+    assert "para 4" in calls[first_run:]
+    assert set(calls[first_run:]) <= {"para 4", "para 5"}
+
+
+def test_atomic_write_replaces_without_leftovers(tmp_path):
+    target = tmp_path / "nested" / "out.txt"
+    atomic_write(target, "one")
+    atomic_write(target, "two")
+    assert target.read_text(encoding="utf-8") == "two"
+    assert [p.name for p in target.parent.iterdir()] == ["out.txt"]
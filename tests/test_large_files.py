@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import io
+import os
+
+from extraction import iter_document
+from parallel_translator import iter_translate
+from segmenter import estimate_tokens, iter_split
+from utils import AtomicWriter
+
+LOG = "".join(f"line {i} of a long log without paragraph breaks\n" for i in range(500))
+
+
+def test_iter_split_is_lossless_and_bounded():
+    chunks = list(iter_split(io.StringIO(LOG), 100))
+    assert "".join(chunks) == LOG
+    assert len(chunks) > 10
+    assert max(estimate_tokens(chunk) for chunk in chunks) <= 100
+
+    text = "# A\n\npara one\n\n# B\n\npara two\n"
+    assert "".join(iter_split(io.StringIO(text), 5, merge=False)) == text
+
+
+def test_atomic_writer_spills_to_temp_file(tmp_path):
+    target = tmp_path / "out.txt"
+    writer = AtomicWriter(target, buffer_size=10)
+    writer.write("x" * 20)
+    assert not target.exists()
+    assert len(os.listdir(tmp_path)) == 1
+    writer.write("tail")
+    writer.commit()
+    assert target.read_text(encoding="utf-8") == "x" * 20 + "tail"
+    assert os.listdir(tmp_path) == ["out.txt"]
+
+    aborted = AtomicWriter(tmp_path / "other.txt", buffer_size=0)
+    aborted.write("partial")
+    aborted.abort()
+    assert os.listdir(tmp_path) == ["out.txt"]
+
+
+def test_iter_translate_streams_large_file_to_writer(monkeypatch, tmp_path):
+    monkeypatch.setenv("STREAM_THRESHOLD_MB", "0.001")
+    source = tmp_path / "big.log"
+    source.write_text(LOG, encoding="utf-8")
+    assert all(translatable for _, translatable in iter_document(str(source), 100))
+    monkeypatch.setattr("parallel_translator.translate_text", lambda text, *args, **kwargs: text.upper())
+
+    target = tmp_path / "big_translated.log"
+    results = list(iter_translate([str(source)], "k", "zh", 4, chunk_tokens=100, open_output=lambda path: AtomicWriter(target, buffer_size=256)))
+
+    assert results == [(str(source), None)]
+    assert target.read_text(encoding="utf-8") == LOG.upper()
+
+
+def test_decode_error_midway_abandons_only_that_file(monkeypatch, tmp_path):
+    import asyncio
+
+    import pytest
+
+    from async_translator import iter_translate_async
+    from translator import TranslationFailedError
+
+    monkeypatch.setenv("STREAM_THRESHOLD_MB", "0.001")
+    monkeypatch.setattr("parallel_translator.translate_text", lambda text, *args, **kwargs: text.upper())
+    big = tmp_path / "big.log"
+    big.write_bytes(LOG.encode("utf-8") + b"\xff broken\n" + LOG.encode("utf-8"))
+    small = tmp_path / "small.txt"
+    small.write_text("hello\n", encoding="utf-8")
+    out = tmp_path / "out"
+    out.mkdir()
+
+    def open_output(path):
+        return AtomicWriter(out / os.path.basename(path), buffer_size=256)
+
+    results = []
+    with pytest.raises(TranslationFailedError, match="big.log"):
+        for result in iter_translate([str(big), str(small)], "k", "zh", 4, chunk_tokens=100, open_output=open_output):
+            results.append(result)
+    # 读取失败的大文件不产出也不留下输出（包括临时文件），其余文件照常完成
+    assert results == [(str(small), None)]
+    assert os.listdir(out) == ["small.txt"]
+    assert (out / "small.txt").read_text(encoding="utf-8") == "HELLO\n"
+
+    async def run_async():
+        produced = []
+        async for result in iter_translate_async([str(big), str(small)], "k", "zh", 4, mock_mode=True, chunk_tokens=100, open_output=open_output):
+            produced.append(result)
+        return produced
+
+    (out / "small.txt").unlink()
+    with pytest.raises(TranslationFailedError, match="big.log"):
+        asyncio.run(run_async())
+    assert os.listdir(out) == ["small.txt"]
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import os
+
+from manifest import Manifest
+
+
+def make_tree(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    out = tmp_path / "out"
+    out.mkdir()
+    for name in ("a.txt", "b.txt"):
+        (src / name).write_text(f"Hello {name}", encoding="utf-8")
+    return src, out
+
+
+def record_all(manifest, src, out, paths):
+    for path in paths:
+        output = out / (os.path.basename(path) + ".zh")
+        output.write_text("translated", encoding="utf-8")
+        manifest.record(path, str(output), "m", "zh")
+    manifest.save()
+
+
+def test_manifest_skips_unchanged_files(tmp_path):
+    src, out = make_tree(tmp_path)
+    paths = sorted(str(p) for p in src.iterdir())
+    manifest = Manifest.load(str(out), str(src))
+    changed, unchanged = manifest.plan(paths, "m", "zh")
+    assert changed == paths and unchanged == []
+    record_all(manifest, src, out, paths)
+
+    manifest = Manifest.load(str(out), str(src))
+    assert manifest.plan(paths, "m", "zh") == ([], paths)
+    (src / "a.txt").write_text("Hello changed", encoding="utf-8")
+    assert manifest.plan(paths, "m", "zh") == ([paths[0]], [paths[1]])
+    assert manifest.plan(paths, "m", "ja") == (paths, [])
+
+
+def test_manifest_touched_file_is_still_current(tmp_path):
+    src, out = make_tree(tmp_path)
+    paths = sorted(str(p) for p in src.iterdir())
+    manifest = Manifest.load(str(out), str(src))
+    record_all(manifest, src, out, paths)
+    os.utime(paths[0], (1, 1))
+    assert manifest.plan(paths, "m", "zh") == ([], paths)
+
+
+def test_manifest_prunes_outputs_of_deleted_sources(tmp_path):
+    src, out = make_tree(tmp_path)
+    paths = sorted(str(p) for p in src.iterdir())
+    manifest = Manifest.load(str(out), str(src))
+    record_all(manifest, src, out, paths)
+
+    assert manifest.remove_stale(paths[1:]) == [str(out / "a.txt.zh")]
+    assert (out / "a.txt.zh").exists()
+    assert manifest.remove_stale(paths[1:], prune=True) == [str(out / "a.txt.zh")]
+    assert not (out / "a.txt.zh").exists()
+    assert len(manifest.entries) == 1
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import re
+
+import packing
+import translator
+from memory import TranslationMemory
+from packing import translate_batch
+
+PARAGRAPH = ("The scheduler submits the largest files first so that a single huge document "
+             "does not become the long tail of the whole run, and it keeps the number of in-flight requests bounded.")
+EDITED = PARAGRAPH.replace("huge", "very large")
+
+
+def test_lookup_reuses_only_identical_source_and_references_similar(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    memory.add(PARAGRAPH, "调度器优先提交最大的文件。", "zh", "m")
+    memory.add("Unrelated text about caching and eviction policies in SQLite databases.", "无关", "zh", "m")
+
+    same, shouted, edited, other = memory.lookup_many(
+        ["\n" + PARAGRAPH + "  ", PARAGRAPH.upper().replace(",", ""), EDITED,
+         "Completely different words here for testing purposes only."], "zh", "m"
+    )
+    japanese = memory.lookup(PARAGRAPH, "ja", "m")
+    other_model = memory.lookup(PARAGRAPH, "zh", "other")
+
+    assert same.reusable and same.target == "调度器优先提交最大的文件。"
+    # 忽略大小写和标点后 n-gram 完全相同，但原文不同：只作为参考
+    assert not shouted.reusable and shouted.similarity == 1.0
+    assert not edited.reusable and 0.6 <= edited.similarity < 1.0
+    assert other is None
+    assert japanese is None
+    assert not other_model.reusable and other_model.target == "调度器优先提交最大的文件。"
+    assert memory.stats()["reused"] == 1 and memory.stats()["referenced"] == 3
+
+
+def test_translate_batch_reuses_and_sends_references(monkeypatch, tmp_path):
+    memory = TranslationMemory(str(tmp_path / "tm.sqlite3"))
+    memory.add(PARAGRAPH, "[旧]", "zh", "m")
+    monkeypatch.setattr(packing, "get_memory", lambda: memory)
+    monkeypatch.setattr(translator, "get_memory", lambda: memory)
+    prompts = []
+
+    def fake_completion(prompt, api_key, model, max_retries=5):
+        prompts.append(prompt)
+        segments = re.findall(r"<<<SEG (\d+)>>>\n(.*?)\n<<<END \1>>>", prompt, re.S)
+        return "\n".join(f"<<<SEG {i}>>>\n[新]{text[:10]}\n<<<END {i}>>>" for i, text in segments)
+
+    monkeypatch.setattr(packing, "chat_completion", fake_completion)
+    results = translate_batch([PARAGRAPH + " ", EDITED, "Brand new sentence."], "k", "zh", "m")
+
+    assert results == ["[旧]", f"[新]{EDITED[:10]}", "[新]Brand new"]
+    assert len(prompts) == 1
+    assert "<<<REF 0>>>\nEarlier text: " + PARAGRAPH in prompts[0]
+    assert "<<<REF 1>>>" not in prompts[0]
+    assert memory.lookup(EDITED, "zh", "m").target == f"[新]{EDITED[:10]}"
+
+
+def test_export_import_round_trip(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "a.sqlite3"))
+    memory.add("Use <b> & ⟦0⟧ tags", "使用 <b> & ⟦0⟧ 标签", "zh", "m")
+    memory.add("Use <b> & ⟦0⟧ tags", "<b> & ⟦0⟧ タグを使う", "ja", "m")
+    memory.add("Use <b> & ⟦0⟧ tags", "使用 <b> 标签", "zh", "other")
+    for name in ("tm.jsonl", "tm.tmx"):
+        assert memory.export(str(tmp_path / name)) == 3
+        copy = TranslationMemory(str(tmp_path / f"{name}.sqlite3"))
+        assert copy.import_file(str(tmp_path / name)) == 3
+        assert list(copy.iter_entries()) == list(memory.iter_entries())
+        assert copy.lookup("Use <b> & ⟦0⟧ tags", "ja", "m").reusable
+        assert copy.lookup("Use <b> & ⟦0⟧ tags", "zh", "other").target == "使用 <b> 标签"
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+import logging
+
+import metrics
+import rate_limiter
+from metrics import Histogram, Metrics
+from rate_limiter import AdaptiveLimiter
+from translator import chat_completion
+from utils import JsonFormatter
+
+
+class DummyResponse:
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+        self.headers = {"Retry-After": "0"} if status_code == 429 else {}
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        pass
+
+
+def test_histogram_quantiles():
+    histogram = Histogram((0.1, 1.0, 10.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1.0
+    assert histogram.quantile(1.0) == 10.0
+    assert Histogram().quantile(0.5) is None
+
+
+def test_chat_completion_records_metrics(monkeypatch):
+    registry = Metrics()
+    monkeypatch.setattr(metrics, "_metrics", registry)
+    monkeypatch.setattr(rate_limiter, "_limiter", AdaptiveLimiter(backoff_base=0.001))
+    responses = [
+        DummyResponse({}, status_code=429),
+        DummyResponse({"choices": [{"message": {"content": " 你好 "}}], "usage": {"prompt_tokens": 7, "completion_tokens": 2}}),
+    ]
+    monkeypatch.setattr("requests.Session.post", lambda self, url, **kwargs: responses.pop(0))
+
+    assert chat_completion("Hello", "k", "m") == "你好"
+
+    snapshot = registry.snapshot()
+    assert snapshot["requests_by_status"] == {"429": 1, "200": 1}
+    assert snapshot["throttled"] == 1
+    assert snapshot["retries"] == 1
+    assert (snapshot["prompt_tokens"], snapshot["completion_tokens"]) == (7, 2)
+    assert snapshot["bytes_out"] == 10
+    assert snapshot["bytes_in"] == len("你好".encode("utf-8"))
+
+    text = registry.render_prometheus([("translator_jobs_running", "Running jobs.", 3)])
+    assert 'translator_requests_total{status="429"} 1' in text
+    assert 'translator_request_duration_seconds_bucket{le="+Inf"} 2' in text
+    assert "translator_prompt_tokens_total 7" in text
+    assert "translator_jobs_running 3" in text
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("parallel_translator", logging.INFO, __file__, 1, "进度 %d", (3,), None)
+    record.files = 3
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "进度 3"
+    assert entry["level"] == "INFO"
+    assert entry["files"] == 3
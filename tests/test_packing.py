@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import re
+
+import packing
+from packing import build_packed_prompt, pack_segments, parse_packed_response, translate_batch
+from parallel_translator import translate_parallel
+
+
+def echo_completion(prompt: str, api_key: str, model: str, max_retries: int = 5) -> str:
+    segments = re.findall(r"<<<SEG (\d+)>>>\n(.*?)\n<<<END \1>>>", prompt, re.S)
+    return "\n".join(f"<<<SEG {i}>>>\n[zh]{text}\n<<<END {i}>>>" for i, text in segments)
+
+
+def test_parse_packed_response_round_trip():
+    prompt = build_packed_prompt(["one", "two\nlines"])
+    parsed = parse_packed_response(echo_completion(prompt, "k", "m"), 2)
+    assert parsed == {0: "[zh]one", 1: "[zh]two\nlines"}
+
+
+def test_parse_packed_response_drops_duplicates_and_unknown_ids():
+    content = "<<<SEG 0>>>a<<<END 0>>><<<SEG 0>>>b<<<END 0>>><<<SEG 1>>>c<<<END 1>>><<<SEG 5>>>x<<<END 5>>>"
+    assert parse_packed_response(content, 2) == {1: "c"}
+
+
+def test_pack_segments_respects_budget():
+    items = [(i, "word " * 20) for i in range(10)]
+    batches = pack_segments(items, 60)
+    assert [len(batch) for batch in batches] == [2, 2, 2, 2, 2]
+
+
+def test_translate_batch_retries_only_missing_segments(monkeypatch):
+    def dropping_completion(prompt, api_key, model, max_retries=5):
+        content = echo_completion(prompt, api_key, model)
+        return re.sub(r"<<<SEG 1>>>.*?<<<END 1>>>", "", content, flags=re.S)
+
+    monkeypatch.setattr(packing, "chat_completion", dropping_completion)
+    monkeypatch.setattr(packing, "translate_text", lambda text, *args, **kwargs: f"[single]{text}")
+
+    assert translate_batch(["a", "b", "c", "d"], "k", "zh", "m") == ["[zh]a", "[single]b", "[zh]c", "[zh]d"]
+
+
+def test_translate_batch_splits_when_delimiters_mangled(monkeypatch):
+    calls = []
+
+    def mangling_completion(prompt, api_key, model, max_retries=5):
+        calls.append(prompt)
+        if "<<<SEG 2>>>" in prompt:
+            return "garbled output"
+        return echo_completion(prompt, api_key, model)
+
+    monkeypatch.setattr(packing, "chat_completion", mangling_completion)
+
+    assert translate_batch(["a", "b", "c", "d"], "k", "zh", "m") == ["[zh]a", "[zh]b", "[zh]c", "[zh]d"]
+    assert len(calls) == 3
+
+
+def test_translate_parallel_pack_mode(monkeypatch, tmp_path):
+    monkeypatch.setattr(packing, "chat_completion", echo_completion)
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text(f"text {i}\n", encoding="utf-8")
+        paths.append(str(path))
+
+    results = translate_parallel(paths, "k", "zh", 2, pack=True)
+
+    assert results == {path: f"[zh]text {i}\n" for i, path in enumerate(paths)}
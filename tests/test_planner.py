@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import pytest
+
+import cache
+from planner import estimate_makespan, largest_first, plan_translation
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(cache, "_default_cache", None)
+
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_largest_first_orders_by_size(tmp_path):
+    small = write(tmp_path, "a.txt", "x")
+    big = write(tmp_path, "b.txt", "x" * 100)
+    medium = write(tmp_path, "c.txt", "x" * 10)
+    assert largest_first([small, big, medium]) == [big, medium, small]
+
+
+def test_estimate_makespan_balances_workers():
+    assert estimate_makespan([4, 3, 2, 1], 2) == 5
+    assert estimate_makespan([1, 1, 4], 2) == 5
+    assert estimate_makespan([], 3) == 0
+
+
+def test_plan_counts_requests_without_calling_api(tmp_path, monkeypatch):
+    monkeypatch.delenv("PROMPT_PRICE", raising=False)
+    monkeypatch.delenv("COMPLETION_PRICE", raising=False)
+    paths = [write(tmp_path, f"f{i}.md", f"# Title {i}\n\n```\ncode\n```\n\nShared footer.\n") for i in range(3)]
+
+    plain = plan_translation(paths, 4, "gpt-4o-mini", chunk_tokens=2000)
+    assert plain["files"] == 3
+    assert plain["requests"] == 6
+    assert plain["skipped_chunks"] == 3
+    assert plain["cost"] > 0 and plain["wall_clock"] > 0
+
+    deduped = plan_translation(paths, 4, "unknown-model", dedup=True)
+    assert deduped["duplicate_chunks"] == 2
+    assert deduped["requests"] == 1
+    assert deduped["cost"] is None
+
+
+def test_plan_streams_large_files_like_the_pipeline(tmp_path, monkeypatch):
+    from extraction import iter_document
+
+    monkeypatch.setenv("STREAM_THRESHOLD_MB", "0.001")
+    log = write(tmp_path, "big.log", "".join(f"line {i} of a long log\n" for i in range(500)))
+    broken = tmp_path / "broken.log"
+    broken.write_bytes(b"fine\n" * 400 + b"\xff\n")
+
+    plan = plan_translation([log, str(broken)], 4, "gpt-4o-mini", chunk_tokens=100)
+    assert plan["chunks"] == len(list(iter_document(log, 100))) > 10
+    assert plan["files"] == 1 and plan["unreadable_files"] == 1
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import pytest
+
+import rate_limiter
+import translator
+from rate_limiter import AdaptiveLimiter, parse_retry_after
+from translator import TranslationFailedError
+
+
+class DummyResponse:
+    def __init__(self, payload: Dict[str, Any], status_code: int = 200, headers: Dict[str, str] | None = None):
+        self._payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+
+def test_limiter_aimd():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=10)
+    limiter.acquire()
+    limiter.acquire()
+    limiter.release(success=True)
+    assert limiter.limit == 3
+    limiter.release(success=False, status_code=429)
+    assert limiter.limit == 1.5
+    assert limiter.stats()["throttle_events"] == 1
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_retry_budget():
+    limiter = AdaptiveLimiter(min_retries=2, retry_ratio=0.5)
+    assert limiter.allow_retry()
+    assert limiter.allow_retry()
+    assert not limiter.allow_retry()
+    limiter.acquire()
+    limiter.release(success=True)
+    limiter.acquire()
+    limiter.release(success=True)
+    assert limiter.allow_retry()
+
+
+def test_chat_completion_honors_retry_after(monkeypatch):
+    limiter = AdaptiveLimiter(initial_limit=4)
+    monkeypatch.setattr(rate_limiter, "_limiter", limiter)
+    sleeps = []
+    monkeypatch.setattr(translator.time, "sleep", sleeps.append)
+    responses = [
+        DummyResponse({}, 429, {"Retry-After": "0.2"}),
+        DummyResponse({"choices": [{"message": {"content": "你好"}}]}),
+    ]
+    monkeypatch.setattr("requests.Session.post", lambda self, *args, **kwargs: responses.pop(0))
+
+    assert translator.chat_completion("Hello", "k", "m") == "你好"
+    assert sleeps and sleeps[0] >= 0.2
+    assert limiter.stats()["throttle_events"] == 1
+    assert limiter.stats()["retries"] == 1
+
+
+def test_chat_completion_stops_when_budget_exhausted(monkeypatch):
+    limiter = AdaptiveLimiter(min_retries=0)
+    monkeypatch.setattr(rate_limiter, "_limiter", limiter)
+    monkeypatch.setattr("requests.Session.post", lambda self, *args, **kwargs: DummyResponse({}, 503))
+
+    with pytest.raises(TranslationFailedError):
+        translator.chat_completion("Hello", "k", "m")
+    assert limiter.stats()["requests"] == 1
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import os
+
+from scanner import DirectoryIndex, scan_files
+
+
+def make_tree(root):
+    (root / "docs" / "sub").mkdir(parents=True)
+    (root / ".git").mkdir()
+    (root / "docs" / "a.md").write_text("a", encoding="utf-8")
+    (root / "docs" / "sub" / "b.txt").write_text("b", encoding="utf-8")
+    (root / "docs" / "c.py").write_text("c", encoding="utf-8")
+    (root / ".git" / "d.txt").write_text("d", encoding="utf-8")
+    (root / "e.txt").write_text("e", encoding="utf-8")
+
+
+def age(path, seconds=10):
+    """把目录修改时间调到过去，使索引信任缓存"""
+    for dirpath, dirnames, _ in os.walk(path):
+        stat = os.stat(dirpath)
+        os.utime(dirpath, ns=(stat.st_atime_ns, stat.st_mtime_ns - seconds * 1_000_000_000))
+
+
+def test_scan_filters_types_and_ignores(tmp_path):
+    make_tree(tmp_path)
+    root = str(tmp_path)
+    assert scan_files(root, ["txt", "md"], relative=True) == ["docs/a.md", "docs/sub/b.txt", "e.txt"]
+    assert scan_files(root, ["txt"]) == [os.path.join(root, "docs/sub/b.txt"), os.path.join(root, "e.txt")]
+    assert scan_files(root, ["txt"], ignore=["sub"], relative=True) == ["e.txt"]
+
+
+def test_index_rescans_only_changed_directories(tmp_path):
+    make_tree(tmp_path)
+    age(tmp_path)
+    index = DirectoryIndex(str(tmp_path), [".git"])
+    first = index.files(["txt"])
+    scanned = index.rescanned
+    assert index.files(["txt"]) is first
+    assert index.rescanned == scanned
+
+    (tmp_path / "docs" / "sub" / "new.txt").write_text("n", encoding="utf-8")
+    assert index.files(["txt"]) == ["docs/sub/b.txt", "docs/sub/new.txt", "e.txt"]
+    assert index.rescanned == scanned + 1
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+from parallel_translator import translate_parallel
+from segmenter import estimate_tokens, split_text
+
+
+def test_split_text_is_lossless_and_bounded():
+    text = "# Title\n\nintro\n\n" + ("word " * 60 + "\n\n") * 5 + "## Section\nbody\n" + "x" * 500
+    chunks = split_text(text, 40)
+    assert "".join(chunks) == text
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 40 for chunk in chunks)
+
+
+def test_split_text_prefers_heading_boundaries():
+    text = "para " * 30 + "\n# Next\n" + "tail " * 5
+    chunks = split_text(text, 40)
+    assert chunks[1].startswith("# Next")
+
+
+def test_translate_parallel_reassembles_chunks_in_order(tmp_path):
+    path = tmp_path / "big.md"
+    paragraphs = [f"Hello {i}" for i in range(20)]
+    path.write_text("\n\n".join(paragraphs) + "\n", encoding="utf-8")
+    progress = [{"progress": 0}]
+
+    results = translate_parallel([str(path)], "key", "zh", 4, mock_mode=True, progress_queue=progress, chunk_tokens=5)
+
+    assert results[str(path)] == "\n\n".join(f"你好 {i}" for i in range(20)) + "\n"
+    assert len(progress) > 2
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import List
+
+import httpx
+import requests
+
+import rate_limiter
+from async_translator import translate_text_stream_async
+from rate_limiter import AdaptiveLimiter
+from translator import parse_stream_line, translate_text_stream
+
+
+def sse(*deltas: str) -> List[str]:
+    lines = [": OPENROUTER PROCESSING", ""]
+    for delta in deltas:
+        lines.append("data: " + json.dumps({"choices": [{"delta": {"content": delta}}]}))
+        lines.append("")
+    return lines
+
+
+class StreamResponse:
+    def __init__(self, lines: List[str], status_code: int = 200, break_after: int | None = None):
+        self.lines = lines
+        self.status_code = status_code
+        self.headers = {}
+        self.encoding = None
+        self.break_after = break_after
+
+    def iter_lines(self, decode_unicode: bool = False):
+        for i, line in enumerate(self.lines):
+            if self.break_after is not None and i >= self.break_after:
+                raise requests.exceptions.ChunkedEncodingError("connection broken")
+            yield line
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_parse_stream_line():
+    assert parse_stream_line("") == ""
+    assert parse_stream_line(": keep-alive") == ""
+    assert parse_stream_line('data: {"choices": [{"delta": {"content": "你"}}]}') == "你"
+    assert parse_stream_line('data: {"choices": [{"delta": {"role": "assistant"}}]}') == ""
+    assert parse_stream_line("data: [DONE]") is None
+
+
+def test_translate_text_stream_yields_partials(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_limiter", AdaptiveLimiter(backoff_base=0.01))
+    captured = {}
+
+    def fake_post(self, url, json=None, headers=None, timeout=None, stream=False):
+        captured.update(json=json, stream=stream)
+        return StreamResponse(sse("你好", "，", "世界 ") + ["data: [DONE]"])
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+
+    partials = list(translate_text_stream("Hello, world", "k", "zh", "m"))
+
+    assert partials == ["你好", "你好，", "你好，世界 ", "你好，世界"]
+    assert captured["stream"] is True
+    assert captured["json"]["stream"] is True
+
+
+def test_translate_text_stream_retries_broken_stream(monkeypatch):
+    limiter = AdaptiveLimiter(backoff_base=0.01)
+    monkeypatch.setattr(rate_limiter, "_limiter", limiter)
+    calls = {"count": 0}
+
+    def fake_post(self, url, json=None, headers=None, timeout=None, stream=False):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            return StreamResponse(sse("部分", "译文"), break_after=4)
+        return StreamResponse(sse("完整", "译文") + ["data: [DONE]"])
+
+    monkeypatch.setattr("requests.Session.post", fake_post)
+
+    partials = list(translate_text_stream("text", "k", "zh", "m"))
+
+    assert calls["count"] == 2
+    assert partials[0] == "部分"
+    assert partials[-1] == "完整译文"
+    assert limiter.throttle_events == 1
+    assert limiter.in_flight == 0
+
+
+def test_translate_text_stream_releases_slot_when_abandoned(monkeypatch):
+    limiter = AdaptiveLimiter()
+    monkeypatch.setattr(rate_limiter, "_limiter", limiter)
+    monkeypatch.setattr("requests.Session.post", lambda self, url, **kw: StreamResponse(sse("a", "b", "c")))
+
+    stream = translate_text_stream("text", "k", "zh", "m")
+    assert next(stream) == "a"
+    stream.close()
+
+    assert limiter.in_flight == 0
+
+
+def test_translate_text_stream_async_retries_broken_stream(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_limiter", AdaptiveLimiter(backoff_base=0.01))
+    calls = {"count": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls["count"] += 1
+        if calls["count"] == 1:
+            return httpx.Response(503)
+        body = "\n".join(sse("你好", "世界") + ["data: [DONE]", ""])
+        return httpx.Response(200, content=body.encode("utf-8"), headers={"Content-Type": "text/event-stream"})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return [partial async for partial in translate_text_stream_async("Hello world", "k", "zh", "m", client=client)]
+
+    assert asyncio.run(run()) == ["你好", "你好世界"]
+    assert calls["count"] == 2
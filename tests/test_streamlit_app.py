@@ -1,9 +1,12 @@
 from __future__ import annotations
 
 import os
+from pathlib import Path
 from typing import Any, Dict
 from streamlit.testing.v1 import AppTest
 
+APP_PATH = str(Path(__file__).resolve().parents[1] / "web" / "streamlit_app.py")
+
 
 class DummyResponse:
     def __init__(self, payload: Dict[str, Any], status_code: int = 200):
@@ -24,7 +27,7 @@ class DummyResponse:
 
 def test_app_warns_when_no_input_dirs(monkeypatch, tmp_path):
     monkeypatch.setenv("STREAMLIT_INPUT_ROOT", str(tmp_path / "inputs"))
-    apptest = AppTest.from_file("web/streamlit_app.py")
+    apptest = AppTest.from_file(APP_PATH)
     apptest.run()
     warnings = [message.value for message in apptest.warning]
     assert any("未找到任何输入目录" in message for message in warnings)
@@ -66,7 +69,7 @@ def test_scan_and_translate_flow(monkeypatch, tmp_path):
     monkeypatch.setattr("requests.get", fake_get)
     monkeypatch.setattr("requests.post", fake_post)
 
-    apptest = AppTest.from_file("web/streamlit_app.py")
+    apptest = AppTest.from_file(APP_PATH)
     apptest.run()
 
     # 执行扫描
@@ -88,3 +91,55 @@ def test_scan_and_translate_flow(monkeypatch, tmp_path):
     assert call_log["status_calls"] >= 1
     assert any("翻译完成！" in message.value for message in apptest.success)
 
+
+class DummyStreamResponse(DummyResponse):
+    def __init__(self, lines):
+        super().__init__({})
+        self._lines = lines
+
+    def iter_lines(self, decode_unicode: bool = False):
+        return iter(self._lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def test_translate_consumes_job_event_stream(monkeypatch, tmp_path):
+    input_root = tmp_path / "inputs"
+    (input_root / "demo").mkdir(parents=True)
+
+    monkeypatch.setenv("STREAMLIT_INPUT_ROOT", str(input_root))
+    monkeypatch.setenv("STREAMLIT_OUTPUT_ROOT", str(tmp_path / "outputs"))
+
+    requested = []
+
+    def fake_get(url: str, params: Dict[str, Any] | None = None, **kwargs):
+        requested.append(url)
+        if url.endswith("/jobs/abc/events") and kwargs.get("stream"):
+            return DummyStreamResponse(
+                [
+                    'data: {"type": "snapshot", "status": "running", "progress": 0, "total_files": 1, "message": "开始"}',
+                    "",
+                    ": ping",
+                    'id: 2',
+                    'data: {"progress": 100, "status": "completed", "message": "翻译完成", "translated_files": ["out.txt"], "seq": 2}',
+                ]
+            )
+        raise AssertionError(f"Unexpected GET {url}")
+
+    def fake_post(url: str, json: Dict[str, Any] | None = None):
+        return DummyResponse({"status": "started", "job_id": "abc"})
+
+    monkeypatch.setattr("requests.get", fake_get)
+    monkeypatch.setattr("requests.post", fake_post)
+
+    apptest = AppTest.from_file(APP_PATH)
+    apptest.run()
+    apptest.button[1].click().run()
+
+    # 只订阅事件流，不再轮询状态
+    assert requested == ["http://localhost:8000/jobs/abc/events"]
+    assert any("翻译完成！" in message.value for message in apptest.success)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import pytest
+
+import rate_limiter
+from benchmarks.stub_server import StubServer
+from packing import build_packed_prompt, parse_packed_response
+from rate_limiter import AdaptiveLimiter
+from translator import TranslationFailedError, chat_completion, translate_text, translate_text_stream
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_limiter", AdaptiveLimiter(backoff_base=0.01))
+    server = StubServer(latency=0.0, seed=1).start()
+    monkeypatch.setenv("OPENROUTER_API_URL", server.url)
+    yield server
+    server.stop()
+
+
+def test_stub_translates_plain_packed_and_streamed_prompts(stub):
+    assert translate_text("Hello", "k", "zh", "m") == "[译]Hello"
+    content = chat_completion(build_packed_prompt(["a", "b"]), "k", "m")
+    assert parse_packed_response(content, 2) == {0: "[译]a", 1: "[译]b"}
+    assert list(translate_text_stream("Hi", "k", "zh", "m"))[-1] == "[译]Hi"
+    assert [record["status"] for record in stub.snapshot()] == [200, 200, 200]
+
+
+def test_stub_injects_throttling_and_context_limit(stub):
+    stub.rate_429 = 0.3
+    stub.retry_after = 0.01
+    for i in range(10):
+        assert translate_text(f"text {i}", "k", "zh", "m") == f"[译]text {i}"
+    statuses = [record["status"] for record in stub.snapshot()]
+    assert statuses.count(200) == 10
+    assert statuses.count(429) > 0
+
+    stub.rate_429 = 0.0
+    stub.context_limit = 5
+    with pytest.raises(TranslationFailedError):
+        translate_text("word " * 50, "k", "zh", "m")
+    assert stub.snapshot()[-1]["status"] == 400
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import re
+
+import packing
+import pipeline
+from async_translator import run_translate_parallel
+from packing import build_packed_prompt
+from parallel_translator import translate_parallel
+from planner import plan_translation
+from translator import build_prompt, parse_target_langs
+
+LANG_RE = re.compile(r"English (?:text )?to (\w+)")
+
+
+def lang_completion(prompt: str, api_key: str, model: str, max_retries: int = 5) -> str:
+    language = LANG_RE.search(prompt).group(1)
+    segments = re.findall(r"<<<SEG (\d+)>>>\n(.*?)\n<<<END \1>>>", prompt, re.S)
+    return "\n".join(f"<<<SEG {i}>>>\n[{language}]{text}\n<<<END {i}>>>" for i, text in segments)
+
+
+def test_prompts_use_target_language():
+    assert parse_target_langs(" zh, ja,,zh ,de") == ["zh", "ja", "de"]
+    assert parse_target_langs(["ja", "ja"]) == ["ja"]
+    assert "to Japanese:" in build_prompt("Hello", "ja")
+    assert "to Chinese:" in build_prompt("Hello", "zh")
+    assert "to pt-BR:" in build_prompt("Hello", "pt-BR")
+    assert "from English to German." in build_packed_prompt(["a"], "de")
+
+
+def test_translate_parallel_fans_out_languages_reading_each_file_once(monkeypatch, tmp_path):
+    reads = []
+    iter_document = pipeline.iter_document
+
+    def counting_iter_document(path, *args, **kwargs):
+        reads.append(path)
+        return iter_document(path, *args, **kwargs)
+
+    monkeypatch.setattr(pipeline, "iter_document", counting_iter_document)
+    monkeypatch.setattr(packing, "chat_completion", lang_completion)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text(f"text {i}\n\nmore {i}\n", encoding="utf-8")
+        paths.append(str(path))
+
+    results = translate_parallel(paths, "k", ["zh", "ja"], 2, pack=True)
+
+    assert sorted(reads) == paths
+    assert results == {
+        (path, lang): f"[{name}]text {i}\n\nmore {i}\n"
+        for i, path in enumerate(paths)
+        for lang, name in (("zh", "Chinese"), ("ja", "Japanese"))
+    }
+
+
+def test_async_fan_out_and_plan(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("Hello world\n", encoding="utf-8")
+
+    results = run_translate_parallel([str(path)], "k", ["zh", "ja", "de"], 4, mock_mode=True)
+
+    assert set(results) == {(str(path), lang) for lang in ("zh", "ja", "de")}
+    single = plan_translation([str(path)], 1, "m", "zh")
+    multi = plan_translation([str(path)], 1, "m", ["zh", "ja", "de"])
+    assert (single["chunks"], single["requests"]) == (1, 1)
+    assert (multi["chunks"], multi["requests"]) == (1, 3)
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import time
+
+from work_queue import WorkQueue, run_worker
+
+
+def test_claims_are_exclusive_and_acked(tmp_path):
+    queue = WorkQueue(str(tmp_path / "q.db"))
+    assert queue.enqueue([("a.txt", "out/a.txt"), ("b.txt", "out/b.txt")], "zh", "m") == 2
+    assert queue.enqueue([("a.txt", "out/a.txt")], "zh", "m") == 0
+
+    other = WorkQueue(str(tmp_path / "q.db"))
+    first = queue.claim("w1", limit=1)
+    second = other.claim("w2", limit=5)
+
+    assert [item["input_path"] for item in first] == ["a.txt"]
+    assert [item["input_path"] for item in second] == ["b.txt"]
+    assert not other.ack(first[0]["id"], "w2")
+    assert queue.ack(first[0]["id"], "w1")
+    assert queue.stats()["done"] == 1
+    assert queue.stats()["leased"] == 1
+
+
+def test_expired_lease_is_reclaimed_until_attempts_run_out(tmp_path):
+    queue = WorkQueue(str(tmp_path / "q.db"), lease_seconds=0.05, max_attempts=2)
+    queue.enqueue([("a.txt", "out/a.txt")], "zh", "m")
+
+    assert queue.claim("crashed")[0]["attempts"] == 1
+    assert queue.claim("w2") == []
+    time.sleep(0.1)
+    reclaimed = queue.claim("w2")
+    assert reclaimed[0]["attempts"] == 2
+
+    time.sleep(0.1)
+    assert queue.claim("w3") == []
+    assert queue.stats()["failed"] == 1
+
+    # 重新入队后失败的任务重新开始计数
+    assert queue.enqueue([("a.txt", "out/a.txt")], "zh", "m") == 1
+    assert queue.claim("w3")[0]["attempts"] == 1
+
+
+def test_run_worker_translates_and_acks(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.txt").write_text(f"Hello {name}", encoding="utf-8")
+    queue = WorkQueue(str(tmp_path / "q.db"))
+    queue.enqueue([(str(tmp_path / f"{name}.txt"), str(tmp_path / "out" / f"{name}.txt")) for name in ("a", "b", "c")], "zh", "m")
+
+    counts = run_worker(queue, "k", 2, worker_id="w", batch_size=2, mock_mode=True)
+
+    assert counts == {"done": 3, "requeued": 0, "failed": 0}
+    assert (tmp_path / "out" / "b.txt").read_text(encoding="utf-8") == "你好 b"
+    assert queue.stats()["done"] == 3
+    assert not queue.has_work()
+
+
+def test_run_worker_counts_requeued_and_failed_separately(tmp_path, monkeypatch):
+    import parallel_translator
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("backend down")
+        yield
+
+    monkeypatch.setattr(parallel_translator, "iter_translate", broken)
+    (tmp_path / "a.txt").write_text("Hello", encoding="utf-8")
+    queue = WorkQueue(str(tmp_path / "q.db"), max_attempts=2)
+    queue.enqueue([(str(tmp_path / "a.txt"), str(tmp_path / "out" / "a.txt"))], "zh", "m")
+
+    # 第一次失败放回队列，第二次用完尝试次数后标记为失败
+    assert run_worker(queue, "k", 1, worker_id="w", poll_interval=0) == {"done": 0, "requeued": 1, "failed": 1}
+    assert queue.stats()["failed"] == 1
+
+
+def test_interrupted_worker_releases_items_without_using_attempts(tmp_path, monkeypatch):
+    import pytest
+
+    import parallel_translator
+
+    (tmp_path / "a.txt").write_text("Hello", encoding="utf-8")
+    queue = WorkQueue(str(tmp_path / "q.db"), max_attempts=1)
+    queue.enqueue([(str(tmp_path / "a.txt"), str(tmp_path / "out" / "a.txt"))], "zh", "m")
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+        yield
+
+    monkeypatch.setattr(parallel_translator, "iter_translate", interrupted)
+    for _ in range(3):
+        with pytest.raises(KeyboardInterrupt):
+            run_worker(queue, "k", 1, worker_id="w", mock_mode=True)
+        assert queue.stats()["pending"] == 1
+
+    item = queue.claim("w2")[0]
+    assert item["attempts"] == 1
+    # 只有持有租约的进程能归还任务
+    assert not queue.release(item["id"], "w")
+    assert queue.release(item["id"], "w2")
+    assert queue.failures() == []
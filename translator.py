@@ -1,67 +1,403 @@
+import json
+import logging
+import os
+import re
 import requests
+import threading
 import time
-from typing import Optional
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from backends import get_backend_pool
+from cache import get_cache, make_cache_key
+from extraction import has_placeholders
+from hedging import get_hedge_policy, get_model_chain
+from http_session import get_session, get_timeout
+from memory import MemoryMatch, get_memory
+from metrics import get_metrics
+from rate_limiter import get_rate_limiter, parse_retry_after, is_throttle_status
+
+logger = logging.getLogger(__name__)
+
+# 修改提示词时递增，使旧缓存自动失效
+# v2: 提示词使用 target_lang 指定的目标语言（v1 总是翻译为中文，其他语言的缓存条目实际是中文）
+PROMPT_VERSION = "v2"
+
+# 提示词中使用的语言名称，未列出的语言代码原样写入提示词
+LANGUAGE_NAMES = {
+    'zh': 'Chinese', 'zh-cn': 'Simplified Chinese', 'zh-tw': 'Traditional Chinese',
+    'en': 'English', 'ja': 'Japanese', 'ko': 'Korean', 'de': 'German', 'fr': 'French',
+    'es': 'Spanish', 'pt': 'Portuguese', 'it': 'Italian', 'ru': 'Russian', 'ar': 'Arabic',
+    'vi': 'Vietnamese', 'th': 'Thai', 'id': 'Indonesian', 'nl': 'Dutch', 'pl': 'Polish', 'tr': 'Turkish',
+}
+
+_MOCK_SEGMENT_RE = re.compile(r'<<<SEG (\d+)>>>\n(.*?)\n<<<END \1>>>', re.S)
+# 单段提示词中的原文：指令之后、翻译记忆参考（如有）之前
+_MOCK_PROMPT_RE = re.compile(r'Translate the following English text to [^:]+: (.*?)(?:\n\nFor consistency, here is an earlier version .*)?\Z', re.S)
 
 class TranslationFailedError(Exception):
     pass
 
+class AuthenticationError(TranslationFailedError):
+    """API密钥无效，换模型重试也没有意义"""
+
+def mock_translate(text: str) -> str:
+    """简单mock翻译，供 mock_mode 使用"""
+    if 'Hello' in text:
+        return text.replace('Hello', '你好')
+    # 其他简单替换或fallback
+    return text + " (mock translated)"
+
+def mock_complete(prompt: str) -> str:
+    """mock 后端的回复：对提示词中的原文调用 mock_translate，打包提示词保留分段标记"""
+    if '<<<SEG ' in prompt:
+        return "\n\n".join(f"<<<SEG {i}>>>\n{mock_translate(text)}\n<<<END {i}>>>" for i, text in _MOCK_SEGMENT_RE.findall(prompt))
+    match = _MOCK_PROMPT_RE.search(prompt)
+    return mock_translate(match.group(1) if match else prompt)
+
+def language_name(target_lang: str) -> str:
+    """返回提示词中使用的目标语言名称"""
+    return LANGUAGE_NAMES.get(target_lang.strip().lower(), target_lang.strip())
+
+def parse_target_langs(target_langs: str | Iterable[str]) -> List[str]:
+    """把 "zh,ja,de" 或语言列表解析为去重后的语言代码列表（保持顺序）"""
+    if isinstance(target_langs, str):
+        target_langs = target_langs.split(',')
+    return list(dict.fromkeys(lang.strip() for lang in target_langs if lang.strip()))
+
+def build_prompt(text: str, target_lang: str, reference=None) -> str:
+    """构造单段翻译的提示词；reference 为翻译记忆中相似的旧片段（MemoryMatch），附上后模型沿用其措辞"""
+    language = language_name(target_lang)
+    if has_placeholders(text):
+        prompt = f"Translate the following English text to {language}, keeping placeholders such as ⟦0⟧ unchanged: {text}"
+    else:
+        prompt = f"Translate the following English text to {language}: {text}"
+    if reference is not None:
+        prompt = (f"{prompt}\n\nFor consistency, here is an earlier version of similar text and its existing translation. "
+                  f"Reuse its wording where the text is unchanged and output only the new translation.\n"
+                  f"Earlier text: {reference.source}\nEarlier translation: {reference.target}")
+    return prompt
+
+def parse_stream_line(line: str) -> Optional[str]:
+    """
+    解析SSE流中的一行，返回其中的内容增量（无内容时为空字符串），遇到 [DONE] 时返回None。
+    """
+    if not line or not line.startswith('data:'):
+        # 空行、注释（": OPENROUTER PROCESSING"）和其他字段忽略
+        return ''
+    data = line[len('data:'):].strip()
+    if data == '[DONE]':
+        return None
+    chunk = json.loads(data)
+    if 'error' in chunk:
+        raise ValueError(f"Stream error: {chunk['error']}")
+    choices = chunk.get('choices') or []
+    if not choices:
+        return ''
+    return (choices[0].get('delta') or {}).get('content') or ''
+
+def iter_model_chain(model: str) -> Iterator[Tuple[str, str, Optional[str]]]:
+    """按回退链（MODEL=primary,fallback）依次产出 (模型, 对冲模型, 下一个回退模型)；没有回退模型时对冲到同一模型"""
+    chain = get_model_chain(model)
+    for i, candidate in enumerate(chain):
+        fallback = chain[i + 1] if i + 1 < len(chain) else None
+        yield candidate, fallback or candidate, fallback
+
+def fall_back(error: TranslationFailedError, model: str, fallback: Optional[str]) -> None:
+    """某个模型失败后决定是否回退：API密钥无效或没有回退模型时重新抛出，否则记录并回退到下一个模型"""
+    if isinstance(error, AuthenticationError) or fallback is None:
+        raise error
+    logger.warning("模型 %s 请求失败，回退到 %s: %s", model, fallback, error)
+    get_metrics().record_fallback()
+
+def chat_completion(prompt: str, api_key: str, model: str, max_retries: int = 5) -> str:
+    """
+    调用OpenRouter chat completions接口并返回回复内容。
+    model 登记了回退链（MODEL=primary,fallback）时，某个模型重试用完仍失败则改用下一个模型（API密钥无效除外）；
+    开启对冲（HEDGE_ENABLED）时慢请求会被对冲到下一个模型，没有回退模型时对冲到同一模型。
+    """
+    policy = get_hedge_policy()
+    for candidate, hedge_model, fallback in iter_model_chain(model):
+        try:
+            return policy.run(lambda name, cancelled: request_completion(prompt, api_key, name, max_retries, cancelled), candidate, hedge_model)
+        except TranslationFailedError as e:
+            fall_back(e, candidate, fallback)
+
+class CompletionAttempts:
+    """
+    一次补全请求的重试状态和响应处理，同步（requests）与异步（httpx）的请求函数共用，二者只负责发送请求和读取回复。
+
+    每次尝试由后端池选择一个后端（BACKENDS），并发由该后端的自适应限流器控制：429/5xx会收缩并发并遵守 Retry-After；
+    重试使用抖动退避并消耗全局重试预算，可能落到另一个后端。mock 为True时使用只有mock后端的后端池。
+    """
+
+    def __init__(self, prompt: str, model: str, max_retries: int, mock: bool = False):
+        self.prompt = prompt
+        self.model = model
+        self.max_retries = max_retries
+        self.pool = get_backend_pool(mock)
+        self.limiter = get_rate_limiter()
+        self.metrics = get_metrics()
+        self.prompt_bytes = len(prompt.encode('utf-8'))
+        self.retry_after = None
+        self.last_error = None
+        self.started = 0.0
+        self.elapsed = 0.0
+        # 当前尝试占用槽位的后端，归还后为None
+        self.holding = None
+
+    def backoff(self, attempt: int) -> float:
+        """第attempt次尝试前需要等待的秒数；重试预算耗尽时抛出 TranslationFailedError"""
+        if attempt == 0:
+            return 0.0
+        if not self.limiter.allow_retry():
+            logger.warning("重试预算耗尽，放弃请求: %s", self.last_error)
+            raise TranslationFailedError(f"Retry budget exhausted: {self.last_error}")
+        self.metrics.record_retry()
+        delay = self.limiter.backoff(attempt, self.retry_after)
+        self.retry_after = None
+        return delay
+
+    def acquire(self):
+        return self._begin(self.pool.acquire())
+
+    async def acquire_async(self):
+        return self._begin(await self.pool.acquire_async())
+
+    def _begin(self, backend):
+        logger.debug("API call attempt via %s", backend.name)
+        self.holding = backend
+        self.started = time.perf_counter()
+        return backend
+
+    def _release(self, backend, **kwargs) -> None:
+        self.holding = None
+        self.pool.release(backend, **kwargs)
+
+    def abandon(self) -> None:
+        """请求被取消或调用方提前停止迭代时归还仍占用的槽位，不计入成败"""
+        if self.holding is not None:
+            self._release(self.holding, success=None)
+
+    def mock_reply(self, backend) -> str:
+        """mock 后端在本地生成回复，不发出HTTP请求"""
+        content = mock_complete(self.prompt)
+        elapsed = time.perf_counter() - self.started
+        self._release(backend, success=True, latency=elapsed)
+        self.metrics.observe_request(elapsed, 200, self.prompt_bytes)
+        self.metrics.record_response(content)
+        return content
+
+    def request_failed(self, backend, error: Exception, attempt: int, stream: bool = False) -> None:
+        """连接失败或流中途断开（包括流中的错误事件）：记为失败，由调用方整段重新请求"""
+        self._release(backend, success=False)
+        self.metrics.observe_request(time.perf_counter() - self.started, 'error', self.prompt_bytes)
+        if stream:
+            logger.info("流式响应中断，稍后重试 (尝试 %d/%d): %s", attempt + 1, self.max_retries, error)
+        else:
+            logger.info("API请求失败，稍后重试 (尝试 %d/%d): %s", attempt + 1, self.max_retries, error)
+        self.last_error = error
+
+    def check_status(self, backend, response, attempt: int, stream: bool = False) -> bool:
+        """
+        处理响应状态码，返回是否需要重试：429/5xx 收缩并发后重试；401 时剔除该后端换一个重试，
+        没有其他可用后端时抛出 AuthenticationError；其余4xx为请求本身的问题，抛出 TranslationFailedError。
+        2xx 返回False：非流式请求此时归还槽位，流式请求读完后由 finish_stream 归还。
+        response 可以是 requests 或 httpx 的响应。
+        """
+        status_code = response.status_code
+        elapsed = time.perf_counter() - self.started
+        if not stream or status_code >= 400:
+            # 流式请求的延迟按整个流结束计算
+            self.metrics.observe_request(elapsed, status_code, self.prompt_bytes)
+        logger.debug("Response status: %s", status_code)
+        if is_throttle_status(status_code):
+            self.retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self._release(backend, success=False, status_code=status_code, retry_after=self.retry_after)
+            logger.info("API限流或服务端错误 %s，稍后重试 (尝试 %d/%d)", status_code, attempt + 1, self.max_retries,
+                        extra={'status_code': status_code, 'retry_after': self.retry_after, 'backend': backend.name})
+            self.last_error = f"HTTP {status_code}"
+            return True
+        if status_code == 401:
+            # 无效密钥记为失败；多个后端时只剔除该后端，其余后端继续服务
+            self._release(backend, success=False, status_code=status_code)
+            if not self.pool.eject(backend, "API密钥无效"):
+                logger.error("API密钥无效，请检查OPENROUTER_API_KEY")
+                raise AuthenticationError("Invalid API key")
+            self.last_error = "HTTP 401"
+            return True
+        if status_code >= 400:
+            self._release(backend, success=True)
+            logger.error("翻译失败: HTTP %s", status_code)
+            raise TranslationFailedError(f"HTTP error: {status_code}")
+        if not stream:
+            self.elapsed = elapsed
+            self._release(backend, success=True, latency=elapsed)
+        return False
+
+    def read_reply(self, load_json: Callable[[], dict]) -> Optional[str]:
+        """解析非流式回复并记录用量和延迟；回复无效时记录原因并返回None，由调用方重试"""
+        try:
+            data = load_json()
+            if 'choices' in data and len(data['choices']) > 0:
+                content = data['choices'][0]['message']['content'].strip()
+                self.metrics.record_response(content, data.get('usage'))
+                get_hedge_policy().observe(self.model, self.elapsed)
+                return content
+            raise ValueError("Invalid response from API")
+        except (ValueError, KeyError, TypeError) as e:
+            self.last_error = e
+            return None
+
+    def finish_stream(self, backend, parts: List[str]) -> Optional[str]:
+        """流正常结束：归还槽位并返回去除首尾空白的完整回复；回复为空时返回None，由调用方重试"""
+        elapsed = time.perf_counter() - self.started
+        self._release(backend, success=True, latency=elapsed)
+        self.metrics.observe_request(elapsed, 200, self.prompt_bytes)
+        content = ''.join(parts).strip()
+        if not content:
+            self.last_error = ValueError("Empty response from API")
+            return None
+        self.metrics.record_response(content)
+        return content
+
+    def exhausted(self) -> TranslationFailedError:
+        logger.error("翻译失败 after %d attempts: %s", self.max_retries, self.last_error)
+        return TranslationFailedError(f"Request error after {self.max_retries} attempts: {self.last_error}")
+
+def request_completion(prompt: str, api_key: str, model: str, max_retries: int = 5, cancelled: Optional[threading.Event] = None, mock: bool = False) -> str:
+    """
+    向单个模型发出请求并返回回复内容，不做回退和对冲；重试和状态码处理见 CompletionAttempts。
+    cancelled 被设置（对冲请求已有结果）后不再重试。
+    """
+    attempts = CompletionAttempts(prompt, model, max_retries, mock)
+    for attempt in range(max_retries):
+        if cancelled is not None and cancelled.is_set():
+            raise TranslationFailedError("Hedged request cancelled")
+        delay = attempts.backoff(attempt)
+        if delay:
+            time.sleep(delay)
+        backend = attempts.acquire()
+        try:
+            if backend.mock:
+                return attempts.mock_reply(backend)
+            try:
+                response = get_session().post(backend.url, json=backend.payload(prompt, model), headers=backend.headers(api_key), timeout=get_timeout())
+            except requests.exceptions.RequestException as e:
+                attempts.request_failed(backend, e, attempt)
+                continue
+            if attempts.check_status(backend, response, attempt):
+                continue
+            content = attempts.read_reply(response.json)
+            if content is not None:
+                return content
+        finally:
+            attempts.abandon()
+    raise attempts.exhausted()
+
+def lookup_translation(text: str, target_lang: str, model: str) -> Tuple[Optional[str], Optional[str], Optional[MemoryMatch]]:
+    """
+    查询持久化缓存和翻译记忆，返回 (缓存键, 已有译文, 参考)：
+    命中缓存时缓存键为None（无需写回）；翻译记忆中同一模型下原文相同的旧译文直接复用，相似的旧译文作为参考附在提示词中。
+    """
+    cache = get_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(text, target_lang, model, PROMPT_VERSION)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return None, cached, None
+    memory = get_memory()
+    if memory is not None:
+        match = memory.lookup(text, target_lang, model)
+        if match is not None and match.reusable:
+            return cache_key, match.target, None
+        return cache_key, None, match
+    return cache_key, None, None
+
+def store_translation(text: str, target_lang: str, model: str, cache_key: Optional[str], result: str, translated: bool) -> None:
+    """写回缓存（cache_key 不为None时）；新翻译的文本同时加入翻译记忆"""
+    memory = get_memory()
+    if translated and memory is not None:
+        memory.add(text, result, target_lang, model)
+    if cache_key is not None:
+        get_cache().set(cache_key, result)
+
 def translate_text(text: str, api_key: str, target_lang: str, model: str = "gpt-3.5-turbo", max_retries: int = 5, mock_mode: bool = False) -> str:
     """
-    使用OpenRouter API翻译文本，包含重试机制。
+    使用OpenRouter API翻译文本，包含重试机制、持久化缓存和翻译记忆。
+    mock_mode 时请求发给mock后端，不读写缓存和翻译记忆。
     """
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
     if mock_mode:
-        # 简单mock翻译
-        if 'Hello' in text:
-            return text.replace('Hello', '你好')
-        # 其他简单替换或fallback
-        return text + " (mock translated)"
-    
-    prompt = f"Translate the following English text to Chinese: {text}"
-    
-    payload = {
-        "model": model,
-        "messages": [{"role": "user", "content": prompt}]
-    }
-    
+        return request_completion(build_prompt(text, target_lang), api_key, model, max_retries, mock=True)
+    cache_key, result, reference = lookup_translation(text, target_lang, model)
+    translated = result is None
+    if translated:
+        result = chat_completion(build_prompt(text, target_lang, reference), api_key, model, max_retries)
+    store_translation(text, target_lang, model, cache_key, result, translated)
+    return result
+
+def chat_completion_stream(prompt: str, api_key: str, model: str, max_retries: int = 5, mock: bool = False) -> Iterator[str]:
+    """
+    以流式（SSE）方式调用chat completions接口，逐步产出当前已收到的完整回复（而非增量）。
+    流在中途断开时按与 chat_completion 相同的规则退避重试，新的一次从头产出，
+    调用方用后产出的文本替换先前的即可；最后一次产出的是去除首尾空白的完整回复。
+    """
+    attempts = CompletionAttempts(prompt, model, max_retries, mock)
     for attempt in range(max_retries):
-        print(f"API call attempt {attempt + 1}/{max_retries}")
+        delay = attempts.backoff(attempt)
+        if delay:
+            time.sleep(delay)
+        backend = attempts.acquire()
         try:
-            response = requests.post(url, json=payload, headers=headers)
-            print(f"Response status: {response.status_code}")
-            if response.status_code == 429:
-                wait_time = 2 ** (attempt + 1)
-                print(f"API速率限制，等待 {wait_time} 秒后重试 (尝试 {attempt + 1}/{max_retries})")
-                time.sleep(wait_time)
-                continue
-            response.raise_for_status()
-            data = response.json()
-            if 'choices' in data and len(data['choices']) > 0:
-                return data['choices'][0]['message']['content'].strip()
-            else:
-                raise ValueError("Invalid response from API")
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                print("API密钥无效，请检查OPENROUTER_API_KEY")
-                raise TranslationFailedError("Invalid API key")
-            elif attempt < max_retries - 1:
-                print(f"HTTP错误: {str(e)}，重试...")
-                time.sleep(2 ** (attempt + 1))
+            if backend.mock:
+                yield attempts.mock_reply(backend)
+                return
+            try:
+                response = get_session().post(backend.url, json=backend.payload(prompt, model, stream=True), headers=backend.headers(api_key, stream=True),
+                                              timeout=get_timeout(), stream=True)
+            except requests.exceptions.RequestException as e:
+                attempts.request_failed(backend, e, attempt)
                 continue
-            else:
-                print(f"翻译失败 after {max_retries} attempts: {str(e)}")
-                raise TranslationFailedError(f"HTTP error after {max_retries} attempts: {str(e)}")
-        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
-            if attempt < max_retries - 1:
-                time.sleep(2 ** (attempt + 1))
+            with response:
+                if attempts.check_status(backend, response, attempt, stream=True):
+                    continue
+                response.encoding = 'utf-8'
+                parts = []
+                try:
+                    for line in response.iter_lines(decode_unicode=True):
+                        delta = parse_stream_line(line)
+                        if delta is None:
+                            break
+                        if delta:
+                            parts.append(delta)
+                            yield ''.join(parts)
+                except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+                    attempts.request_failed(backend, e, attempt, stream=True)
+                    continue
+            content = attempts.finish_stream(backend, parts)
+            if content is None:
                 continue
-            else:
-                print(f"翻译失败 after {max_retries} attempts: {str(e)}")
-                raise TranslationFailedError(f"Request error after {max_retries} attempts: {str(e)}")
-    
-    print("翻译失败：达到最大重试次数")
-    raise TranslationFailedError("Max retries exceeded")
\ No newline at end of file
+            if content != ''.join(parts):
+                yield content
+            return
+        finally:
+            # 调用方提前停止迭代时也要归还槽位
+            attempts.abandon()
+    raise attempts.exhausted()
+
+def translate_text_stream(text: str, api_key: str, target_lang: str, model: str = "gpt-3.5-turbo", max_retries: int = 5, mock_mode: bool = False) -> Iterator[str]:
+    """
+    translate_text 的流式版本：逐步产出当前已翻译的部分，最后一次产出即完整译文。
+    命中缓存、复用翻译记忆或mock模式时只产出一次。
+    """
+    if mock_mode:
+        yield from chat_completion_stream(build_prompt(text, target_lang), api_key, model, max_retries, mock=True)
+        return
+    cache_key, result, reference = lookup_translation(text, target_lang, model)
+    translated = result is None
+    if translated:
+        result = ''
+        for result in chat_completion_stream(build_prompt(text, target_lang, reference), api_key, model, max_retries):
+            yield result
+    else:
+        yield result
+    store_translation(text, target_lang, model, cache_key, result, translated)
@@ -1,29 +1,207 @@
+import json
+import logging
 import os
+import threading
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
+# logging.LogRecord 的标准属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
 def load_env():
     load_dotenv()
     api_key = os.getenv('OPENROUTER_API_KEY')
     num_threads = int(os.getenv('NUM_THREADS', 5))
-    model = os.getenv('MODEL', 'gpt-3.5-turbo')
     mock_mode = os.getenv('MOCK_MODE', 'false').lower() == 'true'
     global mock_mode_global
     mock_mode_global = mock_mode
-    if not api_key:
+    setup_logging()
+    load_cache_config()
+    load_memory_config()
+    load_http_config(num_threads)
+    load_rate_limit_config(num_threads)
+    load_hedge_config()
+    pool = load_backend_config()
+    model = load_model_chain(os.getenv('MODEL', 'gpt-3.5-turbo'))
+    # 所有后端都自带密钥（或为mock/本地服务）时不需要 OPENROUTER_API_KEY
+    if not api_key and any(backend.api_key is None and not backend.mock for backend in pool.backends):
         raise ValueError("OPENROUTER_API_KEY not found in .env file")
-    return api_key, num_threads, model, mock_mode
+    return api_key or '', num_threads, model, mock_mode
 mock_mode_global = False
 
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra 中的字段作为顶层键"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+_logging_handler = None
+
+def setup_logging(level=None, fmt=None):
+    """
+    配置根日志器，日志输出到stderr，不与CLI的标准输出混在一起。
+    级别由 LOG_LEVEL（默认INFO）控制，LOG_FORMAT=json 时输出结构化JSON；重复调用只更新级别和格式。
+    """
+    global _logging_handler
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.getenv('LOG_FORMAT', 'text')).lower()
+    root = logging.getLogger()
+    if _logging_handler is None:
+        _logging_handler = logging.StreamHandler()
+        root.addHandler(_logging_handler)
+    if fmt == 'json':
+        _logging_handler.setFormatter(JsonFormatter())
+    else:
+        _logging_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.setLevel(level)
+    return root
+
+def load_http_config(num_threads):
+    """配置进程级共享HTTP连接池，默认连接池大小与NUM_THREADS一致"""
+    from http_session import configure_session
+    pool_size = int(os.getenv('HTTP_POOL_SIZE', num_threads))
+    connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', 10))
+    read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', 120))
+    return configure_session(pool_size, connect_timeout, read_timeout)
+
+def load_rate_limit_config(num_threads):
+    """配置进程级自适应限流器，初始并发默认与NUM_THREADS一致"""
+    from rate_limiter import configure_rate_limiter
+    initial_limit = float(os.getenv('RATE_LIMIT_INITIAL', num_threads))
+    max_limit = float(os.getenv('RATE_LIMIT_MAX', 100))
+    return configure_rate_limiter(initial_limit, max_limit)
+
+def load_hedge_config():
+    """配置进程级请求对冲策略，默认关闭"""
+    from hedging import configure_hedging, DEFAULT_HEDGE_PERCENTILE, DEFAULT_HEDGE_BUDGET, DEFAULT_HEDGE_MIN_DELAY, DEFAULT_HEDGE_MIN_SAMPLES
+    return configure_hedging(
+        enabled=os.getenv('HEDGE_ENABLED', 'false').lower() == 'true',
+        percentile=float(os.getenv('HEDGE_PERCENTILE', DEFAULT_HEDGE_PERCENTILE)),
+        budget=float(os.getenv('HEDGE_BUDGET', DEFAULT_HEDGE_BUDGET)),
+        min_delay=float(os.getenv('HEDGE_MIN_DELAY', DEFAULT_HEDGE_MIN_DELAY)),
+        min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', DEFAULT_HEDGE_MIN_SAMPLES)),
+    )
+
+def load_backend_config():
+    """根据 BACKENDS 和 BACKEND_<NAME>_* 配置进程级后端池，未设置时只有默认的 OpenRouter 后端"""
+    from backends import configure_backends, DEFAULT_EJECT_AFTER, DEFAULT_EJECT_SECONDS
+    return configure_backends(
+        os.getenv('BACKENDS', ''),
+        eject_after=int(os.getenv('BACKEND_EJECT_AFTER', DEFAULT_EJECT_AFTER)),
+        eject_seconds=float(os.getenv('BACKEND_EJECT_SECONDS', DEFAULT_EJECT_SECONDS)),
+    )
+
+def load_model_chain(value):
+    """登记 "primary,fallback" 形式的模型回退链，返回主模型"""
+    from hedging import register_model_chain
+    return register_model_chain(value)
+
+def load_cache_config(enabled=None, path=None):
+    """根据环境变量（可被CLI参数覆盖）配置持久化翻译缓存"""
+    from cache import configure_cache, DEFAULT_CACHE_PATH
+    if enabled is None:
+        enabled = os.getenv('CACHE_ENABLED', 'false').lower() == 'true'
+    path = path or os.getenv('CACHE_PATH', DEFAULT_CACHE_PATH)
+    max_entries = int(os.getenv('CACHE_MAX_ENTRIES', 100000))
+    max_age_days = os.getenv('CACHE_MAX_AGE_DAYS', '')
+    max_age = float(max_age_days) * 86400 if max_age_days else None
+    return configure_cache(enabled, path, max_entries, max_age)
+
+def load_memory_config(enabled=None, path=None):
+    """根据环境变量配置模糊翻译记忆，默认关闭"""
+    from memory import configure_memory, DEFAULT_MEMORY_PATH, DEFAULT_MEMORY_THRESHOLD
+    if enabled is None:
+        enabled = os.getenv('TM_ENABLED', 'false').lower() == 'true'
+    path = path or os.getenv('TM_PATH', DEFAULT_MEMORY_PATH)
+    threshold = float(os.getenv('TM_THRESHOLD', DEFAULT_MEMORY_THRESHOLD))
+    return configure_memory(enabled, path, threshold)
+
 def filter_files_by_types(files_list, types_list):
     """过滤文件列表，只返回匹配指定扩展名的文件"""
     if not types_list or all(not t.strip() for t in types_list):
-        print("警告: 文件类型列表为空，返回所有文件")
+        logger.warning("文件类型列表为空，返回所有文件")
         return files_list
     
-    filtered = []
-    for file_path in files_list:
-        _, ext = os.path.splitext(file_path)
-        ext = ext.lstrip('.')  # 忽略点前缀
-        if ext in types_list:
-            filtered.append(file_path)
-    return filtered
\ No newline at end of file
+    types = {t.strip().lstrip('.') for t in types_list if t.strip()}
+    # 忽略点前缀，按集合查找扩展名
+    return [file_path for file_path in files_list if os.path.splitext(file_path)[1][1:] in types]
+
+class AtomicWriter:
+    """
+    增量写出文件：内容先缓存在内存中，超过 buffer_size 后写入同目录下的临时文件，
+    commit 时原子替换目标文件，abort 时删除临时文件；输出目录中不会出现写了一半的文件。
+    小文件不占用文件句柄，大文件的内存占用不超过 buffer_size。
+    """
+
+    def __init__(self, path, buffer_size=1 << 20):
+        self.path = str(path)
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._buffered = 0
+        self._fh = None
+        directory = os.path.dirname(self.path) or '.'
+        self._tmp_path = os.path.join(directory, f".{os.path.basename(self.path)}.{os.getpid()}.{threading.get_ident()}.{id(self)}.tmp")
+
+    def _flush(self):
+        if self._fh is None:
+            os.makedirs(os.path.dirname(self._tmp_path), exist_ok=True)
+            self._fh = open(self._tmp_path, 'w', encoding='utf-8')
+        self._fh.write(''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def write(self, text):
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered > self.buffer_size:
+            self._flush()
+
+    def commit(self):
+        try:
+            self._flush()
+            self._fh.close()
+            os.replace(self._tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        self._buffer = []
+        if self._fh is not None:
+            self._fh.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+def atomic_write(path, content):
+    """先写入同目录下的临时文件再原子替换，输出目录中不会出现写了一半的文件"""
+    writer = AtomicWriter(path, buffer_size=0)
+    writer.write(content)
+    writer.commit()
+
+
+def atomic_copy(src, dst, block_size=1 << 20):
+    """按块把文本文件复制到 dst（原子替换），不整体读入内存"""
+    writer = AtomicWriter(dst)
+    try:
+        with open(src, 'r', encoding='utf-8') as f:
+            for block in iter(lambda: f.read(block_size), ''):
+                writer.write(block)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
@@ -1,19 +1,35 @@
-from fastapi import FastAPI, HTTPException, WebSocket, Depends, Request, BackgroundTasks
+import asyncio
+from fastapi import FastAPI, HTTPException, WebSocket, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
+import json
+import logging
 import os
-from utils import load_env, filter_files_by_types
-from parallel_translator import translate_parallel
+import re
+from utils import load_env, load_model_chain, AtomicWriter
+from archive import ARCHIVE_FORMATS, ARCHIVE_MEDIA_TYPES, StreamingArchive
+from scanner import scan_files
+from manifest import Manifest
+from async_translator import iter_translate_async, get_concurrency
+from planner import plan_translation
+from translator import parse_target_langs
+from rate_limiter import get_rate_limiter
+from backends import get_backend_pool
+from metrics import get_metrics
+from jobs import JobRegistry, DEFAULT_MAX_FINISHED_JOBS
 from pathlib import Path
-from collections import deque
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
-progress_queue = deque()
+# 每个翻译请求对应一个任务，进度互相独立；已结束的任务只保留最近 JOB_RETENTION 个
+jobs = JobRegistry(max_finished=int(os.getenv('JOB_RETENTION', DEFAULT_MAX_FINISHED_JOBS)))
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,9 +45,16 @@ app.add_middleware(SlowAPIMiddleware)
 class TranslateRequest(BaseModel):
     input_dir: str = 'test'
     output_dir: str = 'output'
-    target_lang: str = 'zh'
+    # 单个语言，或语言列表/逗号分隔的多个语言（每种语言写入 output_dir 下的同名子目录）
+    target_lang: str | List[str] = 'zh'
     file_types: str = ''
     model: str | None = None
+    pack: bool = False
+    incremental: bool = False
+    prune: bool = False
+    stream: bool = False
+    dedup: bool = False
+    extract: bool = True
 
 def secure_path(path: str, allowed_base: str):
     real_path = os.path.realpath(path)
@@ -45,91 +68,287 @@ def secure_path_dependency(base_dir: str):
         return secure_path(path, base_dir)
     return dependency
 
+# 语言代码同时用作输出子目录名，只允许形如 zh、pt-BR、zh_TW 的代码
+LANG_CODE_RE = re.compile(r'[A-Za-z]{2,3}([-_][A-Za-z0-9]{2,8})*')
+
 def validate_translate_request(request: TranslateRequest):
     secure_path(request.input_dir, 'test')
     secure_path(request.output_dir, 'output')
+    langs = parse_target_langs(request.target_lang)
+    if not langs or not all(LANG_CODE_RE.fullmatch(lang) for lang in langs):
+        raise HTTPException(status_code=400, detail="Invalid target_lang")
     return request
 
+def get_lang_output_dir(output_dir: str, lang: str, langs: List[str]) -> str:
+    """多语言时每种语言写入 output_dir 下的同名子目录，单语言时直接写入 output_dir"""
+    return os.path.join(output_dir, lang) if len(langs) > 1 else output_dir
+
+def plan_incremental(request: TranslateRequest, paths: List[str], langs: List[str], model: str, remove_stale: bool = False):
+    """按每种语言的清单筛选需要翻译的文件（任一语言有变化即重新翻译），返回 (文件列表, 未变化数, {语言: 清单})"""
+    manifests = {lang: Manifest.load(get_lang_output_dir(request.output_dir, lang, langs), request.input_dir) for lang in langs}
+    changed = set()
+    for lang, manifest in manifests.items():
+        if remove_stale:
+            manifest.remove_stale(paths, prune=request.prune)
+        changed.update(manifest.plan(paths, model, lang)[0])
+    return [path for path in paths if path in changed], sum(path not in changed for path in paths), manifests
+
 @app.get("/scan_dir")
-@limiter.limit("5/minute")
-def scan_dir(request: Request, dir_path: str = "test", file_types: str = ""):
+@limiter.limit("60/minute")
+def scan_dir(request: Request, dir_path: str = "test", file_types: str = "", offset: int = 0, limit: int | None = None):
+    """列出目录中匹配的文件（相对路径）；扫描结果按目录修改时间缓存，可用 offset/limit 分页"""
     dir_path = secure_path(dir_path, 'test')
     file_types_list = [t.strip() for t in file_types.split(',') if t.strip()]
-    files = []
-    for root, dirs, filenames in os.walk(dir_path):
-        for filename in filenames:
-            fullpath = os.path.join(root, filename)
-            relpath = os.path.relpath(fullpath, dir_path)
-            files.append(relpath)
-    filtered_files = filter_files_by_types(files, file_types_list)
-    return {"files": filtered_files, "total": len(filtered_files)}
+    files = scan_files(dir_path, file_types_list, relative=True)
+    offset = max(offset, 0)
+    end = len(files) if limit is None else offset + max(limit, 0)
+    next_offset = end if end < len(files) else None
+    return {"files": files[offset:end], "total": len(files), "offset": offset, "next_offset": next_offset}
+
+def collect_paths(request: TranslateRequest):
+    file_types_list = [t.strip() for t in request.file_types.split(',') if t.strip()]
+    return scan_files(request.input_dir, file_types_list)
+
+@app.post("/plan")
+def plan(request: TranslateRequest = Depends(validate_translate_request)):
+    """不调用API，估算 /translate 同样参数下的请求数、token数、费用和墙钟时间"""
+    api_key, num_threads, default_model, mock_mode = load_env()
+    model = load_model_chain(request.model) if request.model else default_model
+    langs = parse_target_langs(request.target_lang)
+    paths = collect_paths(request)
+    skipped = 0
+    if request.incremental:
+        paths, skipped, _ = plan_incremental(request, paths, langs, model)
+    result = plan_translation(paths, get_concurrency(), model, langs, pack=request.pack, extract=request.extract, dedup=request.dedup)
+    result["skipped_files"] = skipped
+    return result
 
 @app.post("/translate")
-async def translate(background_tasks: BackgroundTasks, request: TranslateRequest = Depends(validate_translate_request)):
+async def translate(request: TranslateRequest = Depends(validate_translate_request)):
     config = load_env()
     api_key, num_threads, default_model, mock_mode = config
-    model = request.model or default_model
-    file_types_list = [t.strip() for t in request.file_types.split(',') if t.strip()]
-    paths = []
-    for root, dirs, filenames in os.walk(request.input_dir):
-        for filename in filenames:
-            fullpath = os.path.join(root, filename)
-            paths.append(fullpath)
-    paths = filter_files_by_types(paths, file_types_list)
-    total_files = len(paths)
-    progress_queue.clear()
-    progress_queue.append({"progress": 0, "total_files": total_files, "message": f"找到 {total_files} 个文件，开始翻译"})
-    background_tasks.add_task(run_translation, paths, api_key, request.target_lang, num_threads, model, request.file_types, mock_mode, request.input_dir, request.output_dir)
-    return {"status": "started"}
-
-def run_translation(paths, api_key, target_lang, num_threads, model, file_types, mock_mode, input_dir, output_dir):
-    translated_files = []
-    errors = []
+    model = load_model_chain(request.model) if request.model else default_model
+    langs = parse_target_langs(request.target_lang)
+    # 多语言时每个文件只读取一次，所有 (块, 语言) 任务共用同一个并发上限
+    target_lang = langs if len(langs) > 1 else langs[0]
+    # 扫描目录和增量比对（读取文件计算哈希）在线程中运行，不阻塞事件循环上的其他请求和进度推送
+    paths = await asyncio.to_thread(collect_paths, request)
+    manifests = {}
+    skipped = 0
+    if request.incremental:
+        paths, skipped, manifests = await asyncio.to_thread(plan_incremental, request, paths, langs, model, remove_stale=True)
     total_files = len(paths)
+    job = jobs.create({"input_dir": request.input_dir, "output_dir": request.output_dir, "target_lang": target_lang, "model": model, "total_files": total_files})
+    job.append({"progress": 0, "total_files": total_files, "skipped_files": skipped, "message": f"找到 {total_files} 个文件，开始翻译"})
+    # 在事件循环中直接运行异步翻译，不占用线程池工作线程；任务句柄由登记表持有
+    job.task = asyncio.create_task(run_translation(job, paths, api_key, target_lang, model, mock_mode, request.input_dir, request.output_dir, request.pack, manifests, request.stream, request.dedup, request.extract))
+    return {"status": "started", "job_id": job.id}
+
+def get_output_path(path, input_dir, output_dir):
+    relpath = Path(path).relative_to(input_dir)
+    subdir = Path(input_dir).relative_to('test')
+    output_filename = f"{relpath.stem}_translated{relpath.suffix}"
+    return Path(output_dir) / subdir / relpath.parent / output_filename
+
+def make_partial_handler(job):
+    """
+    返回流式翻译的回调：把每个块的部分译文以增量形式推送到任务的进度流。
+    重试导致已推送的内容作废时推送 reset 事件和完整的当前文本。
+    """
+    sent = {}
+
+    def on_partial(path, index, text):
+        previous = sent.get((path, index), '')
+        if text.startswith(previous):
+            event = {"type": "partial", "file": path, "chunk": index, "delta": text[len(previous):]}
+        else:
+            event = {"type": "partial", "file": path, "chunk": index, "delta": text, "reset": True}
+        sent[(path, index)] = text
+        if event["delta"] or event.get("reset"):
+            job.append(event)
+
+    return on_partial
+
+async def run_translation(job, paths, api_key, target_lang, model, mock_mode, input_dir, output_dir, pack=False, manifests=None, stream=False, dedup=False, extract=True):
+    """target_lang 为语言列表时所有语言在同一次运行中翻译，manifests 为 {语言: 清单}"""
+    translated_files = job.translated_files
+    errors = job.errors
+    on_partial = make_partial_handler(job) if stream else None
+    multi = not isinstance(target_lang, str)
+    langs = target_lang if multi else [target_lang]
+    manifests = manifests or {}
     try:
-        results = translate_parallel(paths, api_key, target_lang, num_threads, model, file_types, mock_mode, progress_queue=progress_queue)
-        for i, (path, translated_content) in enumerate(results.items(), 1):
+        def lang_output_path(path, lang):
+            return get_output_path(path, input_dir, get_lang_output_dir(output_dir, lang, langs))
+
+        def open_output(path, lang=langs[0]):
+            return AtomicWriter(lang_output_path(path, lang))
+
+        # 译文按块顺序增量写出，每个文件完成后原子替换，服务端不在内存中累积全部结果
+        async for result in iter_translate_async(paths, api_key, target_lang, model=model, mock_mode=mock_mode, progress_queue=job, pack=pack, on_partial=on_partial, dedup=dedup, extract=extract, open_output=open_output):
+            path, lang = result[0], result[1] if multi else langs[0]
             try:
-                relpath = Path(path).relative_to(input_dir)
-                subdir = Path(input_dir).relative_to('test')
-                output_filename = f"{relpath.stem}_translated{relpath.suffix}"
-                output_path = Path(output_dir) / subdir / relpath.parent / output_filename
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(translated_content)
-                progress = (i / total_files) * 100
-                percent = progress
-                progress_queue.append({"progress": progress, "message": f'进度: {i}/{total_files} 文件完成 ({percent:.1f}%)'})
-                translated_files.append(str(output_path))
+                output_path = lang_output_path(path, lang)
+                job.add_file(str(output_path))
+                if stream:
+                    job.append({"type": "file_done", "file": path, "target_lang": lang, "output": str(output_path)})
+                if lang in manifests:
+                    manifests[lang].record(path, output_path, model, lang)
             except Exception as e:
-                progress = (i / total_files) * 100
-                percent = progress
-                progress_queue.append({"progress": progress, "error": f"保存 {path} 失败: {str(e)} ({percent:.1f}%)"})
+                job.append({"error": f"保存 {path} 失败: {str(e)}"})
                 errors.append(f"Error processing {path}: {str(e)}")
-        progress_queue.append({"progress": 100, "status": "completed", "message": "翻译完成", "translated_files": translated_files, "errors": errors})
+        for manifest in manifests.values():
+            await asyncio.to_thread(manifest.save)
+        job.append({"progress": 100, "status": "completed", "message": "翻译完成", "translated_files": translated_files, "errors": errors})
+        jobs.finish(job, "completed")
+    except asyncio.CancelledError:
+        # 已写出的文件仍记入清单，下次增量运行时只翻译剩余文件
+        for manifest in manifests.values():
+            manifest.save()
+        job.append({"progress": None, "status": "cancelled", "message": "翻译已取消", "translated_files": translated_files, "errors": errors})
+        jobs.finish(job, "cancelled")
+        raise
     except Exception as e:
-        progress_queue.append({"progress": None, "status": "error", "error": str(e)})
         errors.append(str(e))
+        job.append({"progress": None, "status": "error", "error": str(e)})
+        jobs.finish(job, "error")
 
 
+# 任务相关端点运行在事件循环中，与翻译任务同线程访问登记表，取消操作也必须在此线程执行
 @app.get("/status")
-def get_status():
-    if progress_queue:
-        last = progress_queue[-1]
-        return last
-    else:
+async def get_status():
+    # 兼容旧客户端：返回最近一个任务的最新进度事件
+    job = jobs.latest()
+    if job is None:
         return {"progress": 0}
+    return job.latest
+
+def get_job_or_404(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs")
+async def list_jobs():
+    return {"jobs": [job.summary() for job in jobs.list()], "counts": jobs.counts()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = get_job_or_404(job_id)
+    return dict(job.summary(), latest=job.latest)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = get_job_or_404(job_id)
+    if not job.cancel():
+        return {"job_id": job.id, "status": job.status}
+    return {"job_id": job.id, "status": "cancelling"}
+
+@app.get("/rate_limit")
+def get_rate_limit():
+    return get_rate_limiter().stats()
+
+async def stream_job_events(websocket: WebSocket, job, since: int | None = None):
+    """先推送当前状态快照和保留的事件（或 since 之后的事件），之后推送新事件，任务结束后关闭连接"""
+    async for event in job.subscribe(since):
+        if event is not None:
+            await websocket.send_json(event)
+    await websocket.close()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, since: int | None = None):
+    """
+    以 Server-Sent Events 推送任务事件，与 WebSocket 推送相同；事件 id 为序号，
+    断线重连时浏览器带上 Last-Event-ID（或手动传 since）即可从断点继续。
+    """
+    job = get_job_or_404(job_id)
+    last_event_id = request.headers.get("last-event-id", "")
+    if since is None and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def body():
+        async for event in job.subscribe(since):
+            if event is None:
+                # 心跳，防止代理因空闲断开连接
+                yield ": ping\n\n"
+                continue
+            event_id = f"id: {event['seq']}\n" if "seq" in event else ""
+            yield f"{event_id}data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/jobs/{job_id}/archive")
+async def job_archive(job_id: str, format: str = "zip"):
+    """
+    以 zip（或 format=tar）归档流式下载任务的输出文件：已写出的文件立即加入归档，之后每写完一个文件追加一个，
+    任务结束（包括取消和出错）后结束归档。归档边生成边发送，服务端只在内存中保留当前数据块。
+    """
+    job = get_job_or_404(job_id)
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid archive format")
+    output_dir = job.params.get("output_dir", "output")
+
+    async def body():
+        archive = StreamingArchive(format)
+        count = 0
+        while True:
+            files = await job.wait_files(count)
+            count += len(files)
+            for path in files:
+                # 输出文件都是原子替换写出的，登记时已完整；之后被删除的文件跳过
+                if not os.path.isfile(path):
+                    logger.warning("归档时输出文件 %s 已不存在，跳过", path)
+                    continue
+                chunks = archive.add_file(path, os.path.relpath(path, output_dir))
+                # 读取文件和压缩在线程中进行，不阻塞事件循环
+                while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+                    if chunk:
+                        yield chunk
+            if job.done and count == len(job.translated_files):
+                break
+        for chunk in archive.close():
+            yield chunk
+
+    headers = {"Content-Disposition": f'attachment; filename="{job.id}.{format}"', "X-Accel-Buffering": "no"}
+    return StreamingResponse(body(), media_type=ARCHIVE_MEDIA_TYPES[format], headers=headers)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Prometheus文本格式的翻译指标，附带限流器、各后端和任务状态"""
+    limiter_stats = get_rate_limiter().stats()
+    counts = jobs.counts()
+    gauges = [
+        ("translator_concurrency_limit", "Current adaptive concurrency limit.", limiter_stats["limit"]),
+        ("translator_requests_in_flight", "API requests currently holding a limiter slot.", limiter_stats["in_flight"]),
+        ("translator_jobs_running", "Translation jobs currently running.", counts.get("running", 0)),
+        ("translator_jobs_retained", "Job records kept in memory.", len(jobs)),
+    ]
+    body = get_metrics().render_prometheus(gauges) + get_backend_pool().render_prometheus()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.websocket("/ws/jobs/{job_id}")
+async def websocket_job(websocket: WebSocket, job_id: str, since: int | None = None):
+    await websocket.accept()
+    job = jobs.get(job_id)
+    if job is None:
+        await websocket.close(code=4404)
+        return
+    try:
+        await stream_job_events(websocket, job, since)
+    except Exception:
+        pass
 
 @app.websocket("/ws/progress")
 async def websocket_progress(websocket: WebSocket):
+    # 兼容旧客户端：推送最近一个任务的进度
     await websocket.accept()
+    job = jobs.latest()
+    if job is None:
+        await websocket.close()
+        return
     try:
-        while True:
-            if progress_queue:
-                data = progress_queue.popleft()
-                await websocket.send_json(data)
-            else:
-                await websocket.receive_text()
+        await stream_job_events(websocket, job)
     except Exception:
         pass
 
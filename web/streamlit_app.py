@@ -1,7 +1,8 @@
+import json
 import os
 import time
 from contextlib import suppress
-from typing import List
+from typing import Any, Dict, Iterator, List
 
 import requests
 import streamlit as st
@@ -34,6 +35,15 @@ def get_input_directories(base_dir: str | None = None) -> List[str]:
     ]
 
 
+def iter_job_events(url: str) -> Iterator[Dict[str, Any]]:
+    """读取后端的 Server-Sent Events 推送，逐个产出事件；心跳和空行被跳过，连接结束时停止"""
+    with requests.get(url, stream=True, timeout=(5, 60)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line and line.startswith("data:"):
+                yield json.loads(line[5:])
+
+
 def render_app() -> None:
     st.title("翻译GUI")
 
@@ -53,6 +63,8 @@ def render_app() -> None:
 
     file_types = st.text_input("文件类型 (逗号分隔)", value="")
 
+    target_lang = st.text_input("目标语言 (逗号分隔可同时翻译为多种语言)", value="zh")
+
     if st.button("扫描文件"):
         params = {"dir_path": input_dir, "file_types": file_types}
         response = requests.get("http://localhost:8000/scan_dir", params=params)
@@ -64,43 +76,65 @@ def render_app() -> None:
         payload = {
             "input_dir": input_dir,
             "output_dir": output_root,
-            "target_lang": "zh",
+            "target_lang": target_lang,
             "file_types": file_types,
             "model": None,
         }
         response = requests.post("http://localhost:8000/translate", json=payload)
         response.raise_for_status()
+        # 新版后端为每次翻译返回任务ID，订阅本任务的事件推送；旧版后端退回轮询 /status
+        job_id = response.json().get("job_id")
         progress_placeholder = st.empty()
         status_placeholder = st.empty()
-        total_files = 0
-        poll_count = 0
-        max_polls = 300
+        state = {"total_files": 0}
+
+        def handle_event(data: Dict[str, Any]) -> bool:
+            """显示一个状态/进度事件，任务结束时返回True"""
+            if data.get("type") in ("partial", "file_done"):
+                return False
+            if "total_files" in data and state["total_files"] == 0:
+                state["total_files"] = data["total_files"]
+            status_placeholder.write(data.get("message", ""))
+            if state["total_files"] > 0 and data.get("progress") is not None:
+                progress_placeholder.progress(min(data["progress"] / 100, 1.0))
+            if data.get("error"):
+                st.error(f"错误: {data['error']}")
+                return True
+            if data.get("status") == "cancelled":
+                st.warning("翻译已取消")
+                return True
+            if data.get("progress") == 100 and data.get("status") == "completed":
+                st.success("翻译完成！")
+                if "translated_files" in data:
+                    st.write("翻译文件: ", data["translated_files"])
+                if data.get("errors"):
+                    st.warning("警告: ", data["errors"])
+                return True
+            return False
+
         completed = False
-        while poll_count < max_polls:
-            status_response = requests.get("http://localhost:8000/status")
-            with suppress(requests.HTTPError):
-                status_response.raise_for_status()
-            if status_response.ok:
-                data = status_response.json()
-                if "total_files" in data and total_files == 0:
-                    total_files = data["total_files"]
-                status_placeholder.write(data.get("message", ""))
-                if total_files > 0 and data.get("progress") is not None:
-                    progress_placeholder.progress(min(data["progress"] / 100, 1.0))
-                if "error" in data:
-                    st.error(f"错误: {data['error']}")
-                    completed = True
-                    break
-                if data.get("progress") == 100 and data.get("status") == "completed":
-                    st.success("翻译完成！")
-                    if "translated_files" in data:
-                        st.write("翻译文件: ", data["translated_files"])
-                    if data.get("errors"):
-                        st.warning("警告: ", data["errors"])
+        if job_id:
+            try:
+                for data in iter_job_events(f"http://localhost:8000/jobs/{job_id}/events"):
+                    if handle_event(data):
+                        completed = True
+                        break
+            except requests.RequestException:
+                # 推送连接失败或中断时改为轮询任务状态
+                pass
+        if not completed:
+            status_url = f"http://localhost:8000/jobs/{job_id}" if job_id else "http://localhost:8000/status"
+            poll_count = 0
+            max_polls = 300
+            while poll_count < max_polls:
+                status_response = requests.get(status_url)
+                with suppress(requests.HTTPError):
+                    status_response.raise_for_status()
+                if status_response.ok and handle_event(status_response.json()):
                     completed = True
                     break
-            time.sleep(poll_interval)
-            poll_count += 1
+                time.sleep(poll_interval)
+                poll_count += 1
         if not completed:
             st.error("翻译超时或失败")
 
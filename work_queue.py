@@ -0,0 +1,306 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_QUEUE_PATH = '.translation_queue.sqlite3'
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+# 等待其他进程释放数据库锁的毫秒数
+BUSY_TIMEOUT_MS = 30000
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    """主机名 + 进程号，便于在 status 中定位租约持有者"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    基于SQLite的持久化工作队列，以文件为单位分发翻译任务。
+
+    主进程入队 (输入路径, 输出路径, 目标语言, 模型)，任意数量的工作进程（可在多台主机上，
+    只要共享同一文件系统）通过租约领取任务：领取时记录持有者和过期时间，完成后确认；
+    工作进程崩溃导致租约过期后任务会被其他进程重新领取，超过最大尝试次数后标记为失败。
+    所有状态变更都在 BEGIN IMMEDIATE 事务中完成，多个进程同时领取不会重复分配。
+
+    使用回滚日志（journal_mode=DELETE）而不是WAL：WAL依赖共享内存索引，不能在NFS等网络文件系统上跨主机使用；
+    回滚日志只依赖文件锁，锁冲突时按 busy_timeout 等待。跨主机共享时文件系统需要正确实现POSIX文件锁。
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        # isolation_level=None：由下面的方法显式控制事务
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            self._conn.execute('PRAGMA journal_mode=DELETE')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS items ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'input_path TEXT NOT NULL, output_path TEXT NOT NULL, '
+                'target_lang TEXT NOT NULL, model TEXT NOT NULL, '
+                "status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+                'lease_owner TEXT, lease_expires REAL, error TEXT, '
+                'created REAL NOT NULL, updated REAL NOT NULL, '
+                'UNIQUE (input_path, output_path))'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_status ON items(status, lease_expires)')
+
+    def _transaction(self, func):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func()
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return result
+
+    def enqueue(self, items: Iterable[Tuple[str, str]], target_lang: str, model: str) -> int:
+        """
+        入队 (输入路径, 输出路径) 列表，返回新加入或重新排队的数量。
+        已在队列中的任务不会重复加入；已失败或已完成的任务会重新排队。
+        """
+        now = time.time()
+        rows = [(input_path, str(output_path), target_lang, model, now, now) for input_path, output_path in items]
+
+        def run():
+            before = self._conn.total_changes
+            self._conn.executemany(
+                'INSERT INTO items (input_path, output_path, target_lang, model, created, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (input_path, output_path) DO UPDATE SET '
+                "status = 'pending', attempts = 0, error = NULL, lease_owner = NULL, lease_expires = NULL, "
+                'target_lang = excluded.target_lang, model = excluded.model, updated = excluded.updated '
+                "WHERE items.status IN ('failed', 'done')",
+                rows,
+            )
+            return self._conn.total_changes - before
+        return self._transaction(run)
+
+    def claim(self, worker_id: str, limit: int = 1) -> List[dict]:
+        """领取最多limit个待处理或租约已过期的任务"""
+        now = time.time()
+
+        def run():
+            # 租约过期且已用完尝试次数的任务不再分配
+            self._conn.execute(
+                "UPDATE items SET status = 'failed', lease_owner = NULL, updated = ?, "
+                "error = COALESCE(error, 'lease expired') "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            rows = self._conn.execute(
+                'SELECT id, input_path, output_path, target_lang, model, attempts FROM items '
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                'ORDER BY id LIMIT ?',
+                (now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE items SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                'attempts = attempts + 1, updated = ? WHERE id = ?',
+                [(worker_id, now + self.lease_seconds, now, row[0]) for row in rows],
+            )
+            return [
+                {'id': row[0], 'input_path': row[1], 'output_path': row[2], 'target_lang': row[3], 'model': row[4], 'attempts': row[5] + 1}
+                for row in rows
+            ]
+        return self._transaction(run)
+
+    def heartbeat(self, ids: Iterable[int], worker_id: str) -> int:
+        """延长仍由worker_id持有的租约，返回成功续约的数量"""
+        now = time.time()
+        ids = list(ids)
+
+        def run():
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "UPDATE items SET lease_expires = ?, updated = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                [(now + self.lease_seconds, now, item_id, worker_id) for item_id in ids],
+            )
+            return self._conn.total_changes - before
+        return self._transaction(run) if ids else 0
+
+    def ack(self, item_id: int, worker_id: str) -> bool:
+        """确认任务完成；租约已被他人接管时返回False"""
+        now = time.time()
+
+        def run():
+            cursor = self._conn.execute(
+                "UPDATE items SET status = 'done', lease_owner = NULL, lease_expires = NULL, error = NULL, updated = ? "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now, item_id, worker_id),
+            )
+            return cursor.rowcount == 1
+        return self._transaction(run)
+
+    def fail(self, item_id: int, worker_id: str, error: str) -> Optional[str]:
+        """
+        任务失败：尝试次数未用完时放回队列，否则标记为失败。
+        返回任务的新状态（'pending' 或 'failed'）；租约已被他人接管时返回None。
+        """
+        now = time.time()
+
+        def run():
+            row = self._conn.execute(
+                "SELECT attempts FROM items WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (item_id, worker_id),
+            ).fetchone()
+            if row is None:
+                return None
+            status = 'failed' if row[0] >= self.max_attempts else 'pending'
+            self._conn.execute(
+                'UPDATE items SET status = ?, lease_owner = NULL, lease_expires = NULL, error = ?, updated = ? WHERE id = ?',
+                (status, error, now, item_id),
+            )
+            return status
+        return self._transaction(run)
+
+    def release(self, item_id: int, worker_id: str) -> bool:
+        """
+        归还未处理完的任务（如工作进程被中断）：放回队列并撤销领取时计入的尝试次数，中断不会让任务最终失败。
+        租约已被他人接管时返回False。
+        """
+        now = time.time()
+
+        def run():
+            cursor = self._conn.execute(
+                "UPDATE items SET status = 'pending', lease_owner = NULL, lease_expires = NULL, "
+                'attempts = MAX(attempts - 1, 0), updated = ? '
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (now, item_id, worker_id),
+            )
+            return cursor.rowcount == 1
+        return self._transaction(run)
+
+    def stats(self) -> Dict[str, int]:
+        """按状态统计任务数；expired 为租约已过期、等待重新分配的任务数"""
+        now = time.time()
+        with self._lock:
+            counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+            for status, count in self._conn.execute('SELECT status, COUNT(*) FROM items GROUP BY status'):
+                counts[status] = count
+            counts['expired'] = self._conn.execute(
+                "SELECT COUNT(*) FROM items WHERE status = 'leased' AND lease_expires < ?", (now,)
+            ).fetchone()[0]
+            counts['workers'] = self._conn.execute(
+                "SELECT COUNT(DISTINCT lease_owner) FROM items WHERE status = 'leased' AND lease_expires >= ?", (now,)
+            ).fetchone()[0]
+        return counts
+
+    def failures(self, limit: int = 20) -> List[Tuple[str, Optional[str]]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT input_path, error FROM items WHERE status = 'failed' ORDER BY updated DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def has_work(self) -> bool:
+        """还有待处理或被持有的任务"""
+        stats = self.stats()
+        return stats['pending'] + stats['leased'] > 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def run_worker(queue: WorkQueue, api_key: str, num_threads: int, worker_id: Optional[str] = None, batch_size: Optional[int] = None,
+               wait: bool = False, poll_interval: float = 5.0, mock_mode: bool = False, chunk_tokens: Optional[int] = None,
+               pack: bool = False, pack_tokens: Optional[int] = None) -> Dict[str, int]:
+    """
+    工作进程主循环：批量领取任务，用线程池翻译，每个文件写出后立即确认。
+    后台线程定期为持有的任务续约；队列中没有待处理和被持有的任务时退出（wait为True时持续等待新任务）。
+    返回本进程的任务数：done 为已完成，requeued 为失败后放回队列等待重试，failed 为用完尝试次数的失败。
+    """
+    from parallel_translator import iter_translate
+    from utils import AtomicWriter, atomic_copy
+
+    worker_id = worker_id or default_worker_id()
+    batch_size = batch_size or max(num_threads * 2, 1)
+    held: Dict[int, dict] = {}
+    counts = {'done': 0, 'requeued': 0, 'failed': 0}
+    stop = threading.Event()
+
+    def record_failure(item_id, error):
+        status = queue.fail(item_id, worker_id, error)
+        if status == 'pending':
+            counts['requeued'] += 1
+        elif status == 'failed':
+            counts['failed'] += 1
+
+    def renew_leases():
+        while not stop.wait(queue.lease_seconds / 3):
+            try:
+                queue.heartbeat(list(held), worker_id)
+            except sqlite3.Error as e:
+                logger.warning("续约失败: %s", e)
+
+    renewer = threading.Thread(target=renew_leases, daemon=True)
+    renewer.start()
+    logger.info("工作进程 %s 已启动，队列: %s", worker_id, queue.path)
+    try:
+        while True:
+            items = queue.claim(worker_id, batch_size)
+            if not items:
+                # 其他进程持有的任务可能因崩溃过期，继续等待以便接管
+                if wait or queue.has_work():
+                    time.sleep(poll_interval)
+                    continue
+                break
+            by_input: Dict[Tuple[str, str], Dict[str, List[dict]]] = {}
+            for item in items:
+                held[item['id']] = item
+                by_input.setdefault((item['model'], item['input_path']), {}).setdefault(item['target_lang'], []).append(item)
+            # 需要相同语言集合的输入一起翻译：每个文件只读取一次，所有 (块, 语言) 任务共用线程池
+            groups: Dict[Tuple[str, Tuple[str, ...]], Dict[Tuple[str, str], List[dict]]] = {}
+            for (model, path), by_lang in by_input.items():
+                group = groups.setdefault((model, tuple(sorted(by_lang))), {})
+                for target_lang, lang_items in by_lang.items():
+                    group[(path, target_lang)] = lang_items
+            for (model, langs), by_unit in groups.items():
+                def open_output(path, target_lang=langs[0]):
+                    # 译文增量写入第一个任务的输出路径，同一输入和语言的其余任务完成后复制
+                    return AtomicWriter(by_unit[(path, target_lang)][0]['output_path'])
+
+                paths = list(dict.fromkeys(path for path, _ in by_unit))
+                try:
+                    for result in iter_translate(paths, api_key, list(langs) if len(langs) > 1 else langs[0], num_threads, model=model, mock_mode=mock_mode,
+                                                 chunk_tokens=chunk_tokens, pack=pack, pack_tokens=pack_tokens, open_output=open_output):
+                        items = by_unit.pop((result[0], result[1] if len(langs) > 1 else langs[0]))
+                        for item in items:
+                            held.pop(item['id'], None)
+                            try:
+                                if item is not items[0]:
+                                    atomic_copy(items[0]['output_path'], item['output_path'])
+                            except OSError as e:
+                                record_failure(item['id'], f"写入失败: {e}")
+                                continue
+                            if queue.ack(item['id'], worker_id):
+                                counts['done'] += 1
+                                logger.info("已完成: %s -> %s", item['input_path'], item['output_path'])
+                            else:
+                                logger.warning("租约已被其他进程接管，结果已写出但未确认: %s", item['input_path'])
+                except Exception as e:
+                    logger.error("批次翻译失败，任务放回队列: %s", e)
+                    for remaining in by_unit.values():
+                        for item in remaining:
+                            held.pop(item['id'], None)
+                            record_failure(item['id'], str(e))
+    finally:
+        stop.set()
+        # 中断时立即归还未完成的任务，不必等待租约过期，也不消耗尝试次数
+        for item_id in list(held):
+            queue.release(item_id, worker_id)
+    return counts